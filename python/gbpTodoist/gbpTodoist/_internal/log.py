@@ -6,6 +6,24 @@ situations, in tight loops, etc.
 Formatting is organized by indenting levels which can be
 increased/decreased by calling the open/close methods of the stream
 respectively.
+
+A stream can alternatively be put in a structured mode (see
+:py:meth:`~.log.log_stream.set_format`), in which every event (open, close,
+comment, error, progress) is written as one line of JSON carrying its nesting
+depth, a timestamp and (where relevant) an elapsed time, e.g.::
+
+    {"pid":4242,"t":1571234567.123456,"event":"close","depth":1,"elapsed":0.520000,"msg":"Done."}
+
+Structured lines are assembled with string formatting (only messages go
+through the JSON string encoder) and are buffered, so that high-volume logs
+are cheap to write and to ingest.
+
+Long phases can report their progress through
+:py:meth:`~.log.log_stream.progress`, which wraps any iterable (or is updated
+by hand) and reports the number of items done and their rate.  Reports are
+throttled: the clock is only read every so many items (a number adapted to the
+observed rate) and a terminal is only redrawn a few times per second.  When the
+stream is not a terminal, a summary line is written periodically instead.
 """
 # For legacy-Python compatibility
 from __future__ import print_function
@@ -15,6 +33,9 @@ import sys
 import importlib
 import time
 import datetime
+import json
+import atexit
+import threading
 
 # Infer the name of this package from the path of __file__
 package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -36,6 +57,12 @@ intervals = (
     ('seconds', 1),
 )
 
+#: The output formats supported by `log_stream`
+formats = ('text', 'json')
+
+# The C-accelerated encoder used by the json module for strings
+_encode_string = json.encoder.encode_basestring_ascii
+
 
 def format_time(seconds, granularity=None):
     """Create a nice ASCII representation of a time interval, given in seconds.
@@ -103,6 +130,90 @@ class log_stream(object):
         # ended with a new line
         self.hanging = False
 
+        # Structured-mode state (see set_format())
+        self.format = 'text'
+        self.buffer = []
+        self.buffer_size = 256
+        self.progress_interval = 1.
+        self._prefix = None
+        self._flush_registered = False
+
+        # Progress-reporting state (see progress()); intervals are in seconds
+        self.progress_delay = 0.5
+        self.redraw_interval = 0.1
+        self.summary_interval = 10.
+        self._progress_active = []
+        self._progress_lock = threading.RLock()
+        self._progress_drawn = False
+        self._progress_len = 0
+        self._t_drawn = 0.
+
+    def set_format(self, format='text', fp_out=None, buffer_size=256, progress_interval=1.):
+        """Set the output format of the stream.
+
+        In the 'json' format, every event is written as one line of JSON (see
+        the module documentation).  Lines are buffered and written out once
+        `buffer_size` of them are pending, when the outermost indent bracket is
+        closed, when an error is raised, on `flush` and at exit.
+
+        :param format: One of 'text' or 'json'
+        :param fp_out: An optional file pointer to use for the log (the current one is kept otherwise)
+        :param buffer_size: The number of structured lines to buffer before writing
+        :param progress_interval: The minimum number of seconds between structured progress events
+        :return: None
+        """
+        if(format not in formats):
+            self.error("Invalid log format {%s}." % (format))
+        self.flush()
+        self._unhang()
+        if(fp_out is not None):
+            self.set_fp(fp_out)
+        self.format = format
+        self.buffer_size = max(1, buffer_size)
+        self.progress_interval = progress_interval
+        self._prefix = '{"pid":%d,"t":' % (os.getpid())
+        if(format == 'json' and not self._flush_registered):
+            atexit.register(self.flush)
+            self._flush_registered = True
+
+    def is_structured(self):
+        """Check if the stream is in a structured (JSON lines) format.
+
+        :return: Boolean
+        """
+        return self.format != 'text'
+
+    def flush(self):
+        """Write out any buffered structured lines.
+
+        :return: None
+        """
+        if(self.buffer):
+            self.fp.write(''.join(self.buffer))
+            del self.buffer[:]
+            self.fp.flush()
+
+    def _emit(self, event, msg=None, depth=None, extra=''):
+        """Buffer one structured event.
+
+        :param event: The name of the event
+        :param msg: An optional object with a __str__ method, or a list thereof
+        :param depth: The nesting depth to report (defaults to the current one)
+        :param extra: Preformatted fields to add to the line (each starting with a comma)
+        :return: None
+        """
+        if(depth is None):
+            depth = self._n_indent()
+        if(msg is None):
+            msg_field = ''
+        else:
+            if(_internal.is_nonstring_iterable(msg)):
+                msg = '\n'.join(str(line) for line in msg)
+            msg_field = ',"msg":' + _encode_string(str(msg).rstrip('\n'))
+        self.buffer.append('%s%.6f,"event":"%s","depth":%d%s%s}\n' % (self._prefix, time.time(), event, depth, extra, msg_field))
+        if(len(self.buffer) >= self.buffer_size or (depth == 0 and event == 'close')):
+            self.flush()
+
     def set_fp(self, fp_out=None):
         """Set the file pointer to be used for logging.  Default is
         `sys.stderr`.
@@ -114,6 +225,10 @@ class log_stream(object):
             self.fp = sys.stderr
         else:
             self.fp = fp_out
+        try:
+            self.is_tty = self.fp.isatty()
+        except (AttributeError, ValueError):
+            self.is_tty = False
 
     def set_verbosity(self,verbosity=True):
         """
@@ -195,6 +310,13 @@ class log_stream(object):
         :param msg: An object with a __str__ method, or a list thereof
         :return: None
         """
+        if(self.format != 'text'):
+            if(self.check_verbosity()):
+                self._emit('open', msg)
+            self.t_last.append(time.time())
+            self.n_lines.append(0)
+            self.splice.append(None)
+            return
         self._print(msg, unhang=True, indent=True)
         self.t_last.append(time.time())
         self.n_lines.append(0)
@@ -225,6 +347,11 @@ class log_stream(object):
         # pop on t_last to keep track of the indenting level
         dt = time.time() - t_last
 
+        if(self.format != 'text'):
+            if(self.check_verbosity()):
+                self._emit('close', msg, extra=',"elapsed":%.6f' % (dt))
+            return
+
         if(splice):
             self._splice_line(splice, False)
 
@@ -245,6 +372,10 @@ class log_stream(object):
         :param overwrite:
         :return: None
         """
+        if(self.format != 'text'):
+            if(self.check_verbosity()):
+                self._emit('comment', msg)
+            return
         if(blankline_before):
             self.blankline()
         self._print(msg, unhang=unhang, indent=True, overwrite=overwrite)
@@ -257,49 +388,116 @@ class log_stream(object):
         :param msg: An object with a __str__ method, or a list thereof
         :return: None
         """
+        if(self.format != 'text'):
+            if(self.check_verbosity()):
+                self._emit('append', msg)
+            return
         self._print(msg, unhang=False, indent=False)
 
-    def progress_bar(self, gen, count, *args, **kwargs):
+    def progress(self, iterable=None, count=None, label=None, unit='items'):
+        """Track the progress of a phase.
+
+        The returned `progress` object can either be iterated over (it yields the
+        items of `iterable`) or be updated by hand (see `progress.update`), e.g.
+        from callbacks or worker threads.  Several can be active at once.
+
+        :param iterable: An optional iterable to wrap
+        :param count: The number of items expected (taken from `len(iterable)` if possible; None if unknown)
+        :param label: An optional name for the phase
+        :param unit: The name of the items being counted
+        :return: A `progress` instance
+        """
+        return progress(self, iterable=iterable, count=count, label=label, unit=unit)
+
+    def progress_bar(self, gen, count=None, *args, **kwargs):
         """Display a progress bar for a generator.
 
-        :param gen: Generator
-        :param count: Number of generator iterations
+        :param gen: Generator function (or an iterable, if no arguments are given)
+        :param count: Number of generator iterations (None if unknown)
         :param args: Positional arguments to pass to the generator
         :param kwargs: Keyword arguments to pass to the generator
         :return: None
         """
+        if(callable(gen)):
+            gen = gen(*args, **kwargs)
+        for _ in self.progress(gen, count=count):
+            pass
+
+    def _progress_refresh(self, bar, t_now):
+        """Report the state of a progress indicator (called by `progress` at
+        most once per refresh interval).
+
+        :param bar: A `progress` instance
+        :param t_now: The current time
+        :return: The time of the next refresh
+        """
+        with self._progress_lock:
+            if(not self.check_verbosity()):
+                return t_now + self.summary_interval
+            if(self.format != 'text'):
+                self._emit('progress', depth=bar.depth, extra=bar.json_fields(t_now))
+                return t_now + self.progress_interval
+            bar.shown = True
+            if(self.is_tty):
+                # One line shows all the indicators, so it is drawn at most once per interval
+                if(not self._progress_drawn or t_now - self._t_drawn >= self.redraw_interval):
+                    self._progress_draw(t_now)
+                return t_now + self.redraw_interval
+            self._print(bar.summary(t_now), unhang=True, indent=True)
+            return t_now + self.summary_interval
+
+    def _progress_draw(self, t_now):
+        """Draw the active progress indicators (on one line) over the last line
+        drawn.
+
+        :param t_now: The current time
+        :return: None
+        """
+        if(self.hanging and not self._progress_drawn):
+            self._unhang()
+        line = ' | '.join(bar.status(t_now) for bar in self._progress_active)
+        line_len = len(line)
+        if(line_len < self._progress_len):
+            line += ' ' * (self._progress_len - line_len)
+        self.fp.write('\r' + self.indent_size * self._n_indent() * ' ' + line)
+        self.fp.flush()
+        self._progress_len = line_len
+        self._progress_drawn = True
+        self._t_drawn = t_now
+        self.hanging = True
+
+    def _progress_clear(self):
+        """Blank-out the drawn progress indicators, so that other output can take
+        their place.
 
-        # Initialize counter
-        width = 30
-        msg_len_last = 0
-        start_time = time.time()
-        self.comment("[%s] Remaining:" % (' ' * width), unhang=True)
-
-        # Iterate
-        for iteration, result in enumerate(gen(*args, **kwargs)):
-            fraction_complete = float(iteration + 1) / float(count)
-            ticks = int(fraction_complete * float(width + 1))
-            secs_elapsed = time.time() - start_time
-            secs_estimate = int(secs_elapsed / fraction_complete)
-            secs_remaining = secs_estimate - secs_elapsed
-            if(secs_remaining > 0):
-                msg = "[%s%s] Remaining: %s" % ('#' * ticks, ' ' * (width - ticks),
-                                                str(datetime.timedelta(seconds=secs_remaining)).split('.')[0])
-                msg_len = len(msg)
-
-                # Make sure to blank-out any old underlying text
-                if(msg_len < msg_len_last):
-                    msg += ' ' * (msg_len_last - msg_len)
-                msg_len_last = msg_len
-                self.comment(msg, unhang=False, overwrite=True)
-
-        # Finalize counter
-        msg = "[%s%s] Time elapsed: %s" % ('#' * ticks, ' ' * (width - ticks),
-                                           str(datetime.timedelta(seconds=secs_elapsed)).split('.')[0])
-        msg_len = len(msg)
-        if(msg_len < msg_len_last):
-            msg += ' ' * (msg_len_last - msg_len)
-        self.comment(msg, unhang=False, overwrite=True)
+        :return: None
+        """
+        self.fp.write('\r' + ' ' * (self.indent_size * self._n_indent() + self._progress_len) + '\r')
+        self._progress_drawn = False
+        self._progress_len = 0
+        self.hanging = False
+
+    def _progress_start(self, bar):
+        with self._progress_lock:
+            self._progress_active.append(bar)
+            if(self.format != 'text' and self.check_verbosity()):
+                self._emit('progress', depth=bar.depth, extra=bar.json_fields(bar.t_start))
+
+    def _progress_finish(self, bar):
+        with self._progress_lock:
+            t_now = time.time()
+            if(bar in self._progress_active):
+                self._progress_active.remove(bar)
+            if(not self.check_verbosity()):
+                return
+            if(self.format != 'text'):
+                self._emit('progress', depth=bar.depth, extra=bar.json_fields(t_now) + ',"done":true')
+            elif(bar.shown):
+                if(self._progress_drawn):
+                    self._progress_clear()
+                self._print(bar.summary(t_now, done=True), unhang=True, indent=True)
+                if(self._progress_active and self.is_tty):
+                    self._progress_draw(t_now)
 
     def error(self, err_msg, code=None):
         """Raise an exception.
@@ -308,11 +506,15 @@ class log_stream(object):
         :param code: Optional error code to report
         :return: None
         """
-        self._unhang()
         if(code):
             message = err_msg + " [code=" + code + "]"
         else:
             message = err_msg
+        if(self.format != 'text'):
+            self._emit('error', message)
+            self.flush()
+        else:
+            self._unhang()
         raise Exception(message)
 
     def blankline(self):
@@ -320,6 +522,8 @@ class log_stream(object):
 
         :return: None
         """
+        if(self.format != 'text'):
+            return
         self.comment('\n', unhang=True)
 
     def raw(self, msg):
@@ -328,6 +532,10 @@ class log_stream(object):
         :param msg: An object with a __str__ method, or a list thereof
         :return: None
         """
+        if(self.format != 'text'):
+            if(self.check_verbosity()):
+                self._emit('raw', msg)
+            return
         self._print(msg, unhang=True, indent=False)
 
     def _splice_line(self, splice_msg, flag_start):
@@ -373,6 +581,10 @@ class log_stream(object):
         # Check if rendering is active on the stream
         if(self.check_verbosity()):
 
+            # Clear any progress indicators from the current line
+            if(self._progress_drawn):
+                self._progress_clear()
+
             # Optionally unhang the stream
             if(unhang):
                 self._unhang()
@@ -411,6 +623,8 @@ class log_stream(object):
 
         :return: None
         """
+        if(self._progress_drawn):
+            self._progress_clear()
         if(self.hanging):
             print ('', file=self.fp)
             self.n_lines[-1] += 1
@@ -433,3 +647,147 @@ class log_stream(object):
         :return: Integer
         """
         return len(self.t_last) - 1
+
+
+class progress(object):
+    """This class provides a throttled progress indicator for a `log_stream`
+    (see :py:meth:`~.log.log_stream.progress`)."""
+
+    # Number of clock readings aimed for per refresh interval
+    _n_checks = 4
+
+    def __init__(self, stream, iterable=None, count=None, label=None, unit='items'):
+        """Generate an instance of the progress class (and start reporting).
+
+        :param stream: The `log_stream` to report to
+        :param iterable: An optional iterable to wrap
+        :param count: The number of items expected (taken from `len(iterable)` if possible; None if unknown)
+        :param label: An optional name for the phase
+        :param unit: The name of the items being counted
+        """
+        if(count is None and iterable is not None):
+            try:
+                count = len(iterable)
+            except TypeError:
+                count = None
+        self.stream = stream
+        self.iterable = iterable
+        self.count = count
+        self.label = label
+        self.unit = unit
+        self.n = 0
+        self.depth = stream._n_indent()
+        self.shown = False
+        self.closed = False
+        self.t_start = time.time()
+        if(stream.format != 'text'):
+            self.t_next = self.t_start + stream.progress_interval
+        else:
+            self.t_next = self.t_start + stream.progress_delay
+        self.n_next = 1
+        self._lock = threading.Lock()
+        stream._progress_start(self)
+
+    def __iter__(self):
+        if(self.iterable is None):
+            self.stream.error("A progress indicator without an iterable can not be iterated over.")
+        try:
+            for value in self.iterable:
+                yield value
+                self.n += 1
+                if(self.n >= self.n_next):
+                    self._check()
+        finally:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, n=1):
+        """Count items as done (this method can be called from several threads).
+
+        :param n: The number of items done
+        :return: None
+        """
+        with self._lock:
+            self.n += n
+            if(self.n >= self.n_next):
+                self._check()
+
+    def close(self):
+        """Stop reporting (and write a final report, if any was made).
+
+        :return: None
+        """
+        if(not self.closed):
+            self.closed = True
+            self.stream._progress_finish(self)
+
+    def _check(self):
+        # Read the clock, refresh if it is time to, and work out how many more
+        # items to wait for before reading the clock again
+        t_now = time.time()
+        if(t_now >= self.t_next):
+            self.t_next = self.stream._progress_refresh(self, t_now)
+        interval = min(self.t_next - t_now, self.stream.redraw_interval)
+        self.n_next = self.n + max(1, int(self.rate(t_now) * interval / self._n_checks))
+
+    def rate(self, t_now=None):
+        """Return the rate at which items are done.
+
+        :param t_now: The current time (optional)
+        :return: The number of items per second
+        """
+        if(t_now is None):
+            t_now = time.time()
+        dt = t_now - self.t_start
+        if(dt <= 0.):
+            return 0.
+        return self.n / dt
+
+    def status(self, t_now):
+        """Return a (one-line) rendering of the indicator.
+
+        :param t_now: The current time
+        :return: string
+        """
+        width = 20
+        label = self.label + ' ' if self.label else ''
+        rate = self.rate(t_now)
+        if(self.count):
+            fraction = min(1., float(self.n) / float(self.count))
+            ticks = int(fraction * width)
+            if(rate > 0.):
+                remaining = 'Remaining: %s' % (str(datetime.timedelta(seconds=int(max(0, self.count - self.n) / rate))))
+            else:
+                remaining = 'Remaining: ?'
+            return "%s[%s%s] %d/%d %s (%.1f/s) %s" % (label, '#' * ticks, ' ' * (width - ticks), self.n, self.count, self.unit, rate, remaining)
+        return "%s%d %s (%.1f/s) Elapsed: %s" % (label, self.n, self.unit, rate, str(datetime.timedelta(seconds=int(t_now - self.t_start))))
+
+    def summary(self, t_now, done=False):
+        """Return a summary line for the indicator.
+
+        :param t_now: The current time
+        :param done: Boolean flag indicating whether the summary is the final one
+        :return: string
+        """
+        label = self.label + ': ' if self.label else ''
+        if(done):
+            return "%s%d %s in %.1f seconds (%.1f/s)." % (label, self.n, self.unit, t_now - self.t_start, self.rate(t_now))
+        if(self.count):
+            return "%s%d/%d %s (%.0f%%; %.1f/s)" % (label, self.n, self.count, self.unit, 100. * self.n / self.count, self.rate(t_now))
+        return "%s%d %s (%.1f/s)" % (label, self.n, self.unit, self.rate(t_now))
+
+    def json_fields(self, t_now):
+        """Return the fields of a structured progress event for the indicator.
+
+        :param t_now: The current time
+        :return: string
+        """
+        fields = ',"n":%d,"count":%s,"elapsed":%.6f' % (self.n, 'null' if self.count is None else '%d' % (self.count), t_now - self.t_start)
+        if(self.label):
+            fields += ',"label":' + _encode_string(self.label)
+        return fields
@@ -0,0 +1,217 @@
+"""This module provides a `manifest` class for quickly assembling the lists of
+files (data files, scripts, etc.) that get bundled with a Python package.
+
+Directory trees are scanned with `scandir` rather than `os.walk` (falling back
+to `os.listdir` where neither `os.scandir` nor the `scandir` backport is
+available), entries are pruned by name using a list of shell-style ignore
+patterns, symbolic links to directories are followed without ever descending
+into a directory which is already an ancestor of the current one (i.e. symlink
+loops are detected) and directory listings are cached on disk, keyed by
+directory modification time, so that subsequent scans only list directories
+whose contents have changed.
+"""
+import os
+import sys
+import importlib
+import json
+import fnmatch
+
+import stat
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+package_root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Names (shell-style patterns) which are never added to a manifest, or descended into
+ignore_default = ['__pycache__', '*.pyc', '*.pyo', '.git', '.tox', '*.egg-info', '.eggs', '.DS_Store', '*.swp']
+
+#: Version of the on-disk cache format.  Caches with a different version are discarded.
+_CACHE_VERSION = 1
+
+
+class _dir_entry(object):
+    """This class provides the parts of an `os.DirEntry` used by `manifest`,
+    for Pythons without `scandir` (built with `os.listdir` and `os.lstat`)."""
+
+    def __init__(self, path, name):
+        self.name = name
+        self.path = os.path.join(path, name)
+
+    def is_dir(self, follow_symlinks=True):
+        mode = os.lstat(self.path).st_mode
+        if(follow_symlinks and stat.S_ISLNK(mode)):
+            mode = os.stat(self.path).st_mode
+        return stat.S_ISDIR(mode)
+
+
+def _scandir(path):
+    if(scandir is not None):
+        return scandir(path)
+    return [_dir_entry(path, name) for name in os.listdir(path)]
+
+
+class manifest(object):
+    """This class provides a scanner for generating lists of the files found
+    under a set of directories, with an optional on-disk cache of directory
+    listings."""
+
+    def __init__(self, ignore=None, path_cache=None, follow_symlinks=True):
+        """Generate an instance of the `manifest` class.
+
+        :param ignore: A list of shell-style patterns; matching file and directory names are skipped (defaults to `ignore_default`)
+        :param path_cache: Optional path to a .json file used to cache directory listings between runs
+        :param follow_symlinks: Boolean flag indicating whether to follow symbolic links to directories
+        """
+        if(ignore is None):
+            ignore = ignore_default
+        self.ignore = list(ignore)
+        self.follow_symlinks = follow_symlinks
+        self.path_cache = path_cache
+
+        # Scan statistics, accumulated over the lifetime of the instance
+        self.n_dirs_scanned = 0
+        self.n_dirs_cached = 0
+        self.n_links_skipped = 0
+
+        # Load the directory-listing cache
+        self._cache = {}
+        self._cache_dirty = False
+        if(self.path_cache and os.path.isfile(self.path_cache)):
+            try:
+                with open(self.path_cache, 'r') as fp_cache:
+                    cache_in = json.load(fp_cache)
+                if(cache_in.get('version') == _CACHE_VERSION and cache_in.get('ignore') == self.ignore):
+                    self._cache = cache_in['dirs']
+            except (IOError, OSError, ValueError, KeyError):
+                # A corrupt cache is not an error; it just gets rebuilt
+                self._cache = {}
+
+    def is_ignored(self, name):
+        """Check a file or directory name against the ignore patterns.
+
+        :param name: A file or directory name (no path)
+        :return: Boolean.  True if the name matches one of the ignore patterns.
+        """
+        for pattern in self.ignore:
+            if(fnmatch.fnmatchcase(name, pattern)):
+                return True
+        return False
+
+    def _list_dir(self, path):
+        """Return the (filtered) subdirectory and file names of a directory,
+        using the cache if the directory has not been modified since it was
+        last listed.
+
+        :param path: Absolute path to a directory
+        :return: A tuple of (directory identity, list of subdirectory names, list of file names)
+        """
+        stat_dir = os.stat(path)
+        key = [stat_dir.st_dev, stat_dir.st_ino]
+
+        cached = self._cache.get(path)
+        if(cached is not None and cached['mtime'] == stat_dir.st_mtime and cached['key'] == key):
+            self.n_dirs_cached += 1
+            return tuple(key), cached['dirs'], cached['files']
+
+        self.n_dirs_scanned += 1
+        dirs = []
+        files = []
+        for entry in _scandir(path):
+            if(self.is_ignored(entry.name)):
+                continue
+            try:
+                if(entry.is_dir(follow_symlinks=self.follow_symlinks)):
+                    dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+            except OSError:
+                # Dangling links, permission problems, etc.
+                continue
+        dirs.sort()
+        files.sort()
+        self._cache[path] = {'mtime': stat_dir.st_mtime, 'key': key, 'dirs': dirs, 'files': files}
+        self._cache_dirty = True
+        return tuple(key), dirs, files
+
+    def scan(self, path_start):
+        """Generate the contents of a directory tree.
+
+        Directories are visited depth-first in sorted order.  A directory is not
+        descended into if it is (via a symbolic link) one of its own ancestors.
+
+        :param path_start: Path to the root of the tree
+        :return: A generator of (directory path, list of file names) tuples
+        """
+        path_start = os.path.abspath(path_start)
+        if(not os.path.isdir(path_start)):
+            return
+
+        # Each stack entry carries the set of (st_dev, st_ino) identities of its ancestors
+        stack = [(path_start, frozenset())]
+        while(stack):
+            path, ancestors = stack.pop()
+            try:
+                key, dirs, files = self._list_dir(path)
+            except OSError:
+                continue
+            if(key in ancestors):
+                self.n_links_skipped += 1
+                continue
+            yield path, files
+            ancestors_next = ancestors | frozenset([key])
+            for name in reversed(dirs):
+                stack.append((os.path.join(path, name), ancestors_next))
+
+    def files(self, path_start, extensions=None):
+        """Return a list of the files found under a directory.
+
+        :param path_start: Path to the root of the tree
+        :param extensions: An optional list of filename extensions (e.g. ['.py']) to restrict the result to
+        :return: A list of absolute paths
+        """
+        result = []
+        for path, filenames in self.scan(path_start):
+            for filename in filenames:
+                if(extensions is None or os.path.splitext(filename)[1] in extensions):
+                    result.append(os.path.join(path, filename))
+        return result
+
+    def save(self):
+        """Write the directory-listing cache to disk (if one has been
+        configured and it has changed).
+
+        :return: None
+        """
+        if(not self.path_cache or not self._cache_dirty):
+            return
+        try:
+            with open(self.path_cache, 'w') as fp_cache:
+                json.dump({'version': _CACHE_VERSION, 'ignore': self.ignore, 'dirs': self._cache}, fp_cache)
+            self._cache_dirty = False
+        except (IOError, OSError):
+            # Failing to write the cache only costs us speed next time
+            pkg.log.comment("Could not write manifest cache {%s}." % (self.path_cache))
+
+    def __str__(self):
+        """Summarize the scan statistics as a string.
+
+        :return: string
+        """
+        return "%d directories listed, %d from cache, %d symlink loops skipped" % (
+            self.n_dirs_scanned, self.n_dirs_cached, self.n_links_skipped)
@@ -4,6 +4,7 @@ import os
 import sys
 import importlib
 import json
+import time
 
 # Infer the name of this package from the path of __file__
 package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -16,6 +17,7 @@ sys.path.insert(0, package_parent_dir)
 
 # Import needed internal modules
 _internal = importlib.import_module(package_name + '._internal')
+_manifest = importlib.import_module(package_name + '._internal.manifest')
 pkg = importlib.import_module(package_name)
 
 
@@ -46,12 +48,21 @@ class package:
         with open_package_file(self.path_package_parent) as file_in:
             self.params = file_in.load()
 
+        # Scan the package for the files it bundles.  Directory listings are cached
+        # between runs in the package parent directory.
+        pkg.log.open("Building package manifest...")
+        t_start = time.time()
+        self.manifest = _manifest.manifest(path_cache=os.path.join(self.path_package_parent, ".manifest_cache.json"))
+
         # Assemble a list of data files to bundle with the package
         self.package_files = self.collect_package_files()
 
         # Assemble a list of package scripts
         self.scripts = self.collect_package_scripts()
 
+        self.manifest.save()
+        pkg.log.close("Done (%s; %.3f seconds)." % (self.manifest, time.time() - t_start))
+
         # Return the stream verbosity to its previous state
         pkg.log.unset_verbosity()
 
@@ -71,16 +82,10 @@ class package:
         paths.append(os.path.abspath(os.path.join(self.path_package_parent, ".package.json")))
 
         # Add the data directory
-        for (path, directories, filenames) in os.walk(os.path.join(self.path_package_parent, "data"), followlinks=True):
-            if(path != "__pycache__"):
-                for filename in filenames:
-                    paths.append(os.path.join('..', path, filename))
+        paths.extend(self.manifest.files(os.path.join(self.path_package_parent, "data")))
 
         # Add any .docstring files
-        for (path, directories, filenames) in os.walk(self.path_package_root, followlinks=True):
-            for filename in filenames:
-                if(filename.endswith('.docstring')):
-                    paths.append(os.path.join('..', path, filename))
+        paths.extend(self.manifest.files(self.path_package_root, extensions=['.docstring']))
 
         # setup() struggles when these filenames have unicode under python 2.7, so strip that here
         return [str(path) for path in paths]
@@ -96,20 +101,17 @@ class package:
 
         # Add the scripts directory
         path_start = os.path.join(self.path_package_root, "scripts")
-        for (path, directories, filenames) in os.walk(path_start, followlinks=True):
-            for filename in filenames:
-                filename_base = os.path.basename(filename)
-                script_name, filename_extension = os.path.splitext(filename_base)
-                if(filename_extension == '.py'):
-                    if(script_name != '__init__'):
-                        path_relative = os.path.relpath(path, path_start)
-                        script_pkg_path = path_relative.replace("/", ".")
-                        if(script_pkg_path == '.'):
-                            script_pkg_path = ''
-                        else:
-                            script_pkg_path += '.'
-                        script_pkg_path += script_name
-                        paths.append([script_name, script_pkg_path])
+        for filename in self.manifest.files(path_start, extensions=['.py']):
+            script_name = os.path.splitext(os.path.basename(filename))[0]
+            if(script_name != '__init__'):
+                path_relative = os.path.relpath(os.path.dirname(filename), path_start)
+                script_pkg_path = path_relative.replace(os.sep, ".")
+                if(script_pkg_path == '.'):
+                    script_pkg_path = ''
+                else:
+                    script_pkg_path += '.'
+                script_pkg_path += script_name
+                paths.append([script_name, script_pkg_path])
         return paths
 
     def __str__(self):
@@ -0,0 +1,269 @@
+"""This module provides profiling of the package's console scripts.
+
+Decorating a click command with `profile_option` gives it `--profile` and
+`--profile-dir` options.  When profiling is requested, the whole invocation
+(including any subcommand) is run under one of two profilers:
+
+   1) 'cprofile': the deterministic profiler of the standard library, with one
+      set of statistics (a .pstats file) written per phase;
+   2) 'sample': a sampling profiler, which records the stack of the main
+      thread at a fixed interval and writes the samples as collapsed stacks
+      (one 'frame;frame;... count' line per distinct stack, ready for
+      flamegraph tools), rooted at the name of their phase.
+
+In either mode, memory allocations are traced (where `tracemalloc` is
+available) and a report of the wall time, peak traced memory and top
+allocators of every phase is written alongside.
+
+Phases are marked by calling `phase` (a no-op when no profiler is running);
+the run starts in a phase named 'startup'.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import importlib
+import functools
+import threading
+import time
+import cProfile
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+package_root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: The profiling modes supported
+modes = ('cprofile', 'sample')
+
+#: The profiler currently running (if any)
+active = None
+
+
+def phase(name):
+    """Start a new profiling phase (ending the current one).
+
+    :param name: The name of the phase
+    :return: None
+    """
+    if(active is not None):
+        active.phase(name)
+
+
+# Modules whose allocations are left out of the memory reports
+_own_files = [module.__file__ for module in (tracemalloc, cProfile) if module is not None] + [os.path.splitext(__file__)[0] + '.py']
+
+
+def _take_snapshot():
+    # Leave out the profiling machinery's own allocations
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, path) for path in _own_files])
+
+
+def _frame_label(code):
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class _sampler(object):
+    """This class provides a sampling profiler for one thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.phase = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        labels = {}
+        while(not self._stop.wait(self.interval)):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while(frame is not None):
+                code = frame.f_code
+                label = labels.get(code)
+                if(label is None):
+                    label = labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            stack.append(self.phase)
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+class profiler(object):
+    """This class provides the profiler of a run."""
+
+    def __init__(self, mode, path_prefix, interval=0.005, n_allocators=20):
+        """Generate an instance of the profiler class.
+
+        :param mode: One of `modes`
+        :param path_prefix: The prefix of the paths of the files written (e.g. 'profiles/gbpTodoist-1234')
+        :param interval: The number of seconds between samples (sampling mode only)
+        :param n_allocators: The number of top allocators to report per phase
+        """
+        if(mode not in modes):
+            pkg.log.error("Invalid profiling mode {%s}." % (mode))
+        self.mode = mode
+        self.path_prefix = path_prefix
+        self.interval = interval
+        self.n_allocators = n_allocators
+        self.phases = []
+        self.paths = []
+        self._name = None
+        self._t_start = None
+        self._snapshot = None
+        self._profile = None
+        self._sampler = None
+        self._tracing = False
+
+    def start(self):
+        """Start profiling (in a phase named 'startup').
+
+        :return: None
+        """
+        global active
+        if(tracemalloc is not None and not tracemalloc.is_tracing()):
+            tracemalloc.start()
+            self._tracing = True
+        if(self.mode == 'sample'):
+            self._sampler = _sampler(threading.current_thread().ident, self.interval)
+        active = self
+        self._begin('startup')
+        if(self._sampler is not None):
+            self._sampler.start()
+
+    def phase(self, name):
+        """End the current phase and start another.
+
+        :param name: The name of the new phase
+        :return: None
+        """
+        self._end()
+        self._begin(name)
+
+    def stop(self):
+        """Stop profiling and write the results.
+
+        :return: A list of the paths written
+        """
+        global active
+        self._end()
+        if(self._sampler is not None):
+            self._sampler.stop()
+            self._write_stacks()
+        if(self._tracing):
+            tracemalloc.stop()
+            self._tracing = False
+        active = None
+        self._write_report()
+        pkg.log.open("Profile written to:")
+        for path in self.paths:
+            pkg.log.comment(path)
+        pkg.log.close(None)
+        return self.paths
+
+    def _begin(self, name):
+        self._name = name
+        if(self._sampler is not None):
+            self._sampler.phase = name
+        if(tracemalloc is not None):
+            self._snapshot = _take_snapshot()
+            if(hasattr(tracemalloc, 'reset_peak')):
+                tracemalloc.reset_peak()
+        self._t_start = time.time()
+        if(self.mode == 'cprofile'):
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def _end(self):
+        if(self._name is None):
+            return
+        if(self._profile is not None):
+            self._profile.disable()
+            path = '%s.%02d-%s.pstats' % (self.path_prefix, len(self.phases), self._name)
+            self._profile.dump_stats(path)
+            self.paths.append(path)
+            self._profile = None
+        record = {'name': self._name, 'time': time.time() - self._t_start, 'peak': None, 'allocators': []}
+        if(tracemalloc is not None and tracemalloc.is_tracing()):
+            record['peak'] = tracemalloc.get_traced_memory()[1]
+            record['allocators'] = _take_snapshot().compare_to(self._snapshot, 'lineno')[:self.n_allocators]
+            self._snapshot = None
+        self.phases.append(record)
+        self._name = None
+
+    def _write_stacks(self):
+        path = self.path_prefix + '.collapsed'
+        with open(path, 'w') as fp_out:
+            for stack, count in sorted(self._sampler.counts.items()):
+                fp_out.write('%s %d\n' % (stack, count))
+        self.paths.append(path)
+
+    def _write_report(self):
+        path = self.path_prefix + '.txt'
+        with open(path, 'w') as fp_out:
+            fp_out.write('%-24s %10s %14s\n' % ('Phase', 'Time [s]', 'Peak [MiB]'))
+            for record in self.phases:
+                peak = '%14.1f' % (record['peak'] / 1048576.) if record['peak'] is not None else '%14s' % ('-')
+                fp_out.write('%-24s %10.3f %s\n' % (record['name'], record['time'], peak))
+            if(tracemalloc is None):
+                fp_out.write('\nMemory allocations were not traced (tracemalloc is not available).\n')
+            for record in self.phases:
+                if(record['allocators']):
+                    fp_out.write('\nTop allocators of phase {%s} (net change):\n' % (record['name']))
+                    for stat in record['allocators']:
+                        fp_out.write('   %s\n' % (str(stat)))
+        self.paths.append(path)
+
+
+def profile_option(command_function):
+    """Decorate a click command so that it can be run under a profiler.
+
+    Apply it above `click.pass_context`/`click.pass_obj`, if used.  The
+    profiler runs until the command's context is closed, so that it covers
+    any subcommands of a group.
+
+    :param command_function: The function of the command
+    :return: The decorated function
+    """
+    import click
+
+    @click.option('--profile', 'profile_mode', type=click.Choice(('none',) + modes), default='none', show_default=True,
+                  help='Run under a profiler (cprofile: deterministic; sample: sampling) and write its results')
+    @click.option('--profile-dir', 'profile_dir', type=click.Path(file_okay=False), default='.', show_default=True,
+                  help='Directory to write profiling results to')
+    @functools.wraps(command_function)
+    def _command_function(*args, **kwargs):
+        profile_mode = kwargs.pop('profile_mode')
+        profile_dir = kwargs.pop('profile_dir')
+        if(profile_mode != 'none'):
+            ctx = click.get_current_context()
+            if(not os.path.isdir(profile_dir)):
+                os.makedirs(profile_dir)
+            path_prefix = os.path.join(profile_dir, '%s-%s-%d' % (ctx.info_name, time.strftime('%Y%m%dT%H%M%S'), os.getpid()))
+            run_profiler = profiler(profile_mode, path_prefix)
+            run_profiler.start()
+            ctx.call_on_close(run_profiler.stop)
+        return command_function(*args, **kwargs)
+    return _command_function
@@ -0,0 +1,220 @@
+"""This module provides a due-date index for answering agenda queries.
+
+Items with a due date are kept in lists sorted by due date (one for the whole
+account and one per project), so that the items due in an interval [t0, t1)
+are found by binary search rather than by scanning every item.  Recurring items
+are expanded into one entry per occurrence, but only inside a bounded window
+given when the index is built; outside of it, only their next due date is
+indexed.
+
+The recurrence patterns understood are those of the form:
+
+   every [other|N] day(s)|week(s)|month(s)|year(s)
+   daily, weekly, monthly, yearly (also: every weekday, every workday)
+   every monday[, wednesday, ...] (names may be abbreviated)
+
+optionally followed by `at <time>`, `starting ...`, etc.  Other recurring items
+are indexed under their next due date only.
+"""
+import os
+import sys
+import importlib
+import re
+import bisect
+import math
+import calendar
+import datetime
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+
+#: Maximum number of occurrences a single recurring item is expanded into
+max_occurrences_default = 400
+
+_weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_units = {'day': 'day', 'days': 'day', 'week': 'week', 'weeks': 'week', 'month': 'month', 'months': 'month',
+          'year': 'year', 'years': 'year'}
+_adverbs = {'daily': 'day', 'weekly': 'week', 'monthly': 'month', 'yearly': 'year'}
+_every_re = re.compile(r'^(?:every|ev)\s+(?:(other)\s+|(\d+)\s+)?(\w+)\b')
+_weekdays_re = re.compile(r'^(?:every|ev)\s+((?:[a-z]+\s*(?:,|and)?\s*)+)')
+
+
+def recurrence(data):
+    """Return the recurrence rule of an item, for either version of the Todoist
+    data model.
+
+    :param data: An item data dictionary
+    :return: A ('interval', unit, n) or ('weekdays', set of weekday numbers) tuple, or None if the item does not (understandably) recur
+    """
+    due = data.get('due')
+    if(isinstance(due, dict)):
+        if(not due.get('is_recurring')):
+            return None
+        string = due.get('string')
+    else:
+        string = data.get('date_string')
+    if(not string):
+        return None
+    string = string.strip().lower()
+    string = re.split(r'\s+(?:at|@|starting|from|until|for)\s+', string)[0]
+
+    if(string in _adverbs):
+        return ('interval', _adverbs[string], 1)
+    if(string in ('every weekday', 'every workday', 'ev weekday', 'ev workday')):
+        return ('weekdays', set(range(5)))
+    match = _every_re.match(string)
+    if(match and match.group(3) in _units):
+        n = 2 if match.group(1) else int(match.group(2) or 1)
+        if(n < 1):
+            return None
+        return ('interval', _units[match.group(3)], n)
+    match = _weekdays_re.match(string)
+    if(match):
+        weekdays = set()
+        for word in re.split(r'\s*(?:,|\band\b|\s)\s*', match.group(1)):
+            if(not word):
+                continue
+            matched = [i_day for i_day, name in enumerate(_weekdays) if len(word) >= 3 and name.startswith(word)]
+            if(len(matched) != 1):
+                return None
+            weekdays.add(matched[0])
+        if(weekdays):
+            return ('weekdays', weekdays)
+    return None
+
+
+def _add_months(start, n_months):
+    month = start.month - 1 + n_months
+    year = start.year + month // 12
+    month = month % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return start.replace(year=year, month=month, day=day)
+
+
+def occurrences(start, rule, t_start, t_stop, max_occurrences=max_occurrences_default):
+    """Generate the occurrences of a recurring item which fall in an interval.
+
+    :param start: The item's next due date
+    :param rule: The item's recurrence rule (see `recurrence`)
+    :param t_start: Start of the interval (inclusive)
+    :param t_stop: End of the interval (exclusive)
+    :param max_occurrences: Maximum number of occurrences to generate
+    :return: A generator of datetimes
+    """
+    n_found = 0
+    if(rule[0] == 'weekdays'):
+        day = start + datetime.timedelta(days=max(0, (t_start - start).days))
+        while(day < t_stop and n_found < max_occurrences):
+            if(day >= t_start and day.weekday() in rule[1]):
+                yield day
+                n_found += 1
+            day += datetime.timedelta(days=1)
+        return
+
+    _, unit, n = rule
+    if(unit in ('day', 'week')):
+        step = datetime.timedelta(days=n if unit == 'day' else 7 * n)
+
+        # Jump straight to the first occurrence in the interval
+        k = 0
+        if(t_start > start):
+            k = int(math.ceil((t_start - start).total_seconds() / step.total_seconds()))
+        occurrence = start + k * step
+        while(occurrence < t_stop and n_found < max_occurrences):
+            yield occurrence
+            n_found += 1
+            occurrence += step
+        return
+
+    n_months = n if unit == 'month' else 12 * n
+    k = 0
+    if(t_start > start):
+        k = max(0, ((t_start.year - start.year) * 12 + t_start.month - start.month) // n_months - 1)
+    occurrence = _add_months(start, k * n_months)
+    while(occurrence < t_stop and n_found < max_occurrences):
+        if(occurrence >= t_start):
+            yield occurrence
+            n_found += 1
+        k += 1
+        occurrence = _add_months(start, k * n_months)
+
+
+def _data(obj):
+    return getattr(obj, 'data', obj)
+
+
+class due_index(object):
+    """This class provides the due-date index."""
+
+    def __init__(self, items, window_start=None, window_stop=None, max_occurrences=max_occurrences_default):
+        """Build a due-date index.
+
+        :param items: A list of item models, nodes, records or data dictionaries
+        :param window_start: Start of the window in which recurring items are expanded (defaults to no expansion)
+        :param window_stop: End of the window in which recurring items are expanded
+        :param max_occurrences: Maximum number of occurrences to index for a single recurring item
+        """
+        self.window_start = window_start
+        self.window_stop = window_stop
+        self.data = {}
+        entries = []
+        for item in items:
+            data = _data(item)
+            if('id' not in data or data.get('checked') or data.get('is_archived') or data.get('is_deleted')):
+                continue
+            due = _tree.due_datetime(data)
+            if(due is None):
+                continue
+            self.data[data['id']] = data
+            entries.append((due, data['id'], data.get('project_id')))
+            rule = recurrence(data) if window_start is not None else None
+            if(rule is not None):
+                for occurrence in occurrences(due, rule, max(window_start, due), window_stop, max_occurrences):
+                    if(occurrence != due):
+                        entries.append((occurrence, data['id'], data.get('project_id')))
+
+        # Sorting on the date alone keeps the (arbitrary-typed) ids out of the comparisons
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.entries = [(entry[0], entry[1]) for entry in entries]
+        self.by_project = {}
+        for due, item_id, project_id in entries:
+            keys, entries_i = self.by_project.setdefault(project_id, ([], []))
+            keys.append(due)
+            entries_i.append((due, item_id))
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _slice(keys, entries, t_start, t_stop):
+        return entries[bisect.bisect_left(keys, t_start):bisect.bisect_left(keys, t_stop)]
+
+    def query(self, t_start, t_stop, project_ids=None):
+        """Return the items due in the interval [t_start, t_stop).
+
+        :param t_start: A datetime
+        :param t_stop: A datetime
+        :param project_ids: Optionally, an iterable of the ids of the projects to restrict the query to
+        :return: A list of (datetime, item data dictionary) tuples, ordered by due date
+        """
+        if(project_ids is None):
+            found = self._slice(self.keys, self.entries, t_start, t_stop)
+        else:
+            slices = []
+            for project_id in set(project_ids):
+                if(project_id in self.by_project):
+                    keys, entries = self.by_project[project_id]
+                    slices.append(self._slice(keys, entries, t_start, t_stop))
+            found = sorted((entry for slice_i in slices for entry in slice_i), key=lambda entry: entry[0])
+        return [(due, self.data[item_id]) for due, item_id in found]
@@ -0,0 +1,177 @@
+"""This module provides a local, append-only archive of an account's completed
+tasks.
+
+The completed-task history is paged through (newest first) between two
+bounds: the end of the last archived run (`since`) and the start of the current
+run (`until`), so that the pages do not shift as new tasks get completed.
+Every page is appended to the archive as it arrives, as one gzip member of JSON
+lines, so only one page is ever held in memory.
+
+After every page, a small cursor file (next to the archive) records the run's
+bounds, its offset and the size of the archive.  An interrupted run is resumed
+from its cursor: the archive is first truncated back to its last recorded size
+(discarding a partially written page), then paging carries on where it
+stopped.  The API's time bounds have a resolution of one minute, so tasks
+completed during the minute shared by two runs are de-duplicated by id.
+"""
+import os
+import sys
+import importlib
+import gzip
+import json
+import datetime
+from collections import Counter
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+
+#: Number of completed tasks requested per page (the API's maximum)
+page_size_default = 200
+
+#: Version of the cursor format.  Archives with a cursor of a different version can not be updated.
+_CURSOR_VERSION = 1
+
+_time_format = '%Y-%m-%dT%H:%M'
+
+#: The formats of the completion-date keys which `completed_archive.throughput` groups by
+periods = {'year': '%Y', 'month': '%Y-%m', 'day': '%Y-%m-%d'}
+
+
+class completed_archive(object):
+    """This class provides the archive."""
+
+    def __init__(self, path):
+        """Open (without reading) an archive.
+
+        :param path: Path to the archive file (e.g. 'completed.jsonl.gz'); the cursor is kept in `path` + '.cursor'
+        """
+        self.path = path
+        self.path_cursor = path + '.cursor'
+        self.cursor = self._load_cursor()
+
+    def _load_cursor(self):
+        if(not os.path.isfile(self.path_cursor)):
+            return {'version': _CURSOR_VERSION, 'since': None, 'until': None, 'offset': 0, 'size': 0,
+                    'boundary_ids': [], 'boundary_ids_next': []}
+        with open(self.path_cursor, 'r') as fp_in:
+            cursor = json.load(fp_in)
+        if(cursor.get('version') != _CURSOR_VERSION):
+            pkg.log.error("Archive cursor {%s} has an unsupported version." % (self.path_cursor))
+        return cursor
+
+    def _save_cursor(self):
+        # Write-then-rename, so that a crash never leaves a half-written cursor
+        path_temp = self.path_cursor + '.tmp'
+        with open(path_temp, 'w') as fp_out:
+            json.dump(self.cursor, fp_out)
+        os.rename(path_temp, self.path_cursor)
+
+    def is_resuming(self):
+        """Check if the last update of the archive was interrupted.
+
+        :return: Boolean
+        """
+        return self.cursor['until'] is not None
+
+    def update(self, api, page_size=page_size_default, until=None, max_pages=None):
+        """Archive the tasks completed since the last update.
+
+        :param api: A `todoist.TodoistAPI` instance
+        :param page_size: Number of completed tasks to request per page
+        :param until: Optional datetime (UTC) up to which to archive (defaults to now; ignored when resuming)
+        :param max_pages: Optional maximum number of pages to fetch (the update is then resumed by the next call)
+        :return: The number of tasks added to the archive
+        """
+        cursor = self.cursor
+        if(cursor['until'] is None):
+            if(until is None):
+                until = datetime.datetime.utcnow()
+            cursor['until'] = until.strftime(_time_format)
+            cursor['offset'] = 0
+            cursor['boundary_ids_next'] = []
+            self._save_cursor()
+
+        # Drop anything written after the last recorded page
+        if(os.path.isfile(self.path) and os.path.getsize(self.path) > cursor['size']):
+            with open(self.path, 'r+b') as fp_archive:
+                fp_archive.truncate(cursor['size'])
+
+        boundary_ids = set(cursor['boundary_ids'])
+        n_archived = 0
+        n_pages = 0
+        while(max_pages is None or n_pages < max_pages):
+            kwargs = {'limit': page_size, 'offset': cursor['offset'], 'until': cursor['until']}
+            if(cursor['since'] is not None):
+                kwargs['since'] = cursor['since']
+            response = api.completed.get_all(**kwargs)
+            if(not isinstance(response, dict) or 'items' not in response):
+                pkg.log.error("Unexpected response while fetching completed tasks: %s" % (str(response)[:200]))
+            items = response['items']
+            n_pages += 1
+
+            page = [item for item in items if item.get('id') not in boundary_ids]
+            if(page):
+                with gzip.open(self.path, 'ab') as fp_archive:
+                    for item in page:
+                        fp_archive.write((json.dumps(item, sort_keys=True) + '\n').encode('utf-8'))
+            until_datetime = datetime.datetime.strptime(cursor['until'], _time_format)
+            for item in items:
+                completed = _tree.completed_datetime(item)
+                if(completed is not None and completed >= until_datetime):
+                    cursor['boundary_ids_next'].append(item.get('id'))
+            n_archived += len(page)
+            cursor['offset'] += len(items)
+            cursor['size'] = os.path.getsize(self.path) if os.path.isfile(self.path) else 0
+            self._save_cursor()
+            if(len(items) < page_size):
+                # The run is complete: the next one starts where this one stopped
+                cursor['since'] = cursor['until']
+                cursor['until'] = None
+                cursor['offset'] = 0
+                cursor['boundary_ids'] = cursor['boundary_ids_next']
+                cursor['boundary_ids_next'] = []
+                self._save_cursor()
+                break
+        return n_archived
+
+    def items(self):
+        """Read the archived tasks.
+
+        :return: A generator of completed-task dictionaries
+        """
+        if(not os.path.isfile(self.path)):
+            return
+        with gzip.open(self.path, 'rb') as fp_archive:
+            for line in fp_archive:
+                line = line.strip()
+                if(line):
+                    yield json.loads(line.decode('utf-8'))
+
+    def throughput(self, period='month', project_ids=None):
+        """Count the archived tasks completed per period.
+
+        :param period: One of 'year', 'month' or 'day'
+        :param project_ids: Optionally, a set of the ids of the projects to count tasks from
+        :return: A list of (period, count) tuples, in chronological order
+        """
+        if(period not in periods):
+            pkg.log.error("Invalid period {%s}." % (period))
+        key_format = periods[period]
+        counts = Counter()
+        for item in self.items():
+            if(project_ids is not None and item.get('project_id') not in project_ids):
+                continue
+            completed = _tree.completed_datetime(item)
+            if(completed is not None):
+                counts[completed.strftime(key_format)] += 1
+        return sorted(counts.items())
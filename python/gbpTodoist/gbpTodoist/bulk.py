@@ -0,0 +1,184 @@
+"""This module provides bulk copy and move operations on task subtrees and
+projects.
+
+Copies are expressed as a single command stream: objects are created in
+dependency order (every parent before its children), each with a temp id which
+its children refer to, so that the whole stream can be committed in a few
+batched requests (see `commit`).  Sibling order is preserved, copies are placed
+after the destination's existing children and completed tasks are completed
+again once copied.  Moves only need one command per subtree root, since
+children travel with their parent.
+"""
+import os
+import sys
+import importlib
+import uuid
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+_commit = importlib.import_module(package_name + '.commit')
+
+#: Item fields which are copied by default
+copy_fields_default = ['priority', 'labels', 'date_string', 'date_lang', 'due_date_utc', 'due', 'description', 'collapsed',
+                       'responsible_uid']
+
+
+def _temp_id():
+    return str(uuid.uuid4())
+
+
+def _sorted(nodes):
+    return sorted(nodes, key=lambda node: node.order)
+
+
+def _order_args(data, order, indent):
+    """Return the ordering arguments of a new item, for either version of the
+    Todoist data model.
+
+    :param data: The data dictionary of the item being copied
+    :param order: The item's position amongst its siblings
+    :param indent: The item's indent level (for version 7 of the data model)
+    :return: Dictionary
+    """
+    if('child_order' in data):
+        return {'child_order': order}
+    return {'item_order': order, 'indent': indent}
+
+
+def queue_copy_tasks(api, roots, project_id, parent_id=None, fields=None, active_only=True, indent=0, order_start=0):
+    """Queue the commands which copy a list of task subtrees to a new parent.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param roots: The root nodes of the subtrees to copy (they keep this order)
+    :param project_id: The id (or temp id) of the destination project
+    :param parent_id: The id (or temp id) of the destination parent task (None to copy to the project root)
+    :param fields: The item fields to copy (defaults to `copy_fields_default`)
+    :param active_only: Boolean flag; if True, checked and archived tasks are not copied
+    :param indent: The indent level of the destination parent (0 for the project root)
+    :param order_start: The largest order amongst the destination's existing children (the copies are placed after them)
+    :return: The number of tasks queued
+    """
+    if(fields is None):
+        fields = copy_fields_default
+    n_queued = 0
+
+    # Pre-order traversal, so that every parent is created before its children
+    stack = [(root, parent_id, indent + 1, order_start + i_root + 1) for i_root, root in reversed(list(enumerate(roots)))]
+    completed = []
+    while(stack):
+        node, parent_id_i, indent_i, order = stack.pop()
+        if(active_only and not node.is_active()):
+            continue
+        data = node.data
+        args = {'content': data['content'], 'project_id': project_id}
+        for field in fields:
+            if(field in data and data[field] is not None):
+                args[field] = data[field]
+        args.update(_order_args(data, order, indent_i))
+        if(parent_id_i is not None):
+            args['parent_id'] = parent_id_i
+        temp_id = _temp_id()
+        _commit.queue_command(api, 'item_add', args, temp_id=temp_id)
+        n_queued += 1
+        if(node.flags & _tree.FLAG_CHECKED):
+            completed.append((temp_id, data.get('date_completed')))
+        children = _sorted(node.children)
+        for i_child in range(len(children) - 1, -1, -1):
+            stack.append((children[i_child], temp_id, indent_i + 1, i_child + 1))
+
+    # Completed tasks are completed once their whole subtree has been created
+    # (children first), since completing a task also completes its subtasks
+    for temp_id, date_completed in reversed(completed):
+        args = {'id': temp_id}
+        if(date_completed):
+            args['date_completed'] = date_completed
+        _commit.queue_command(api, 'item_complete', args)
+    return n_queued
+
+
+def max_order(nodes):
+    """Return the largest sibling order amongst a list of nodes.
+
+    :param nodes: A list of nodes
+    :return: Integer (0 if there are none)
+    """
+    return max([node.order for node in nodes] or [0])
+
+
+def queue_copy_project(api, project, project_tasks, parent_id=None, name=None, fields=None, active_only=True):
+    """Queue the commands which copy a project (with its sub-projects and all
+    of their tasks) to a new parent project.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param project: The node of the project to copy
+    :param project_tasks: A function returning the task nodes of a project node
+    :param parent_id: The id (or temp id) of the destination parent project (None for a top-level project)
+    :param name: Optional new name for the copy
+    :param fields: The item fields to copy (defaults to `copy_fields_default`)
+    :param active_only: Boolean flag; if True, checked, archived and deleted tasks and projects are not copied
+    :return: A (number of projects, number of tasks) tuple
+    """
+    n_projects = 0
+    n_tasks = 0
+    stack = [(project, parent_id, name)]
+    while(stack):
+        project_i, parent_id_i, name_i = stack.pop()
+        if(active_only and not project_i.is_active()):
+            continue
+        data = project_i.data
+        args = {'name': name_i if name_i else data['name']}
+        for field in ('color', 'is_favorite'):
+            if(field in data):
+                args[field] = data[field]
+        if(parent_id_i is not None):
+            args['parent_id'] = parent_id_i
+        temp_id = _temp_id()
+        _commit.queue_command(api, 'project_add', args, temp_id=temp_id)
+        n_projects += 1
+        roots = _sorted(task for task in project_tasks(project_i) if task.parent is None and not task.is_malformed())
+        n_tasks += queue_copy_tasks(api, roots, temp_id, fields=fields, active_only=active_only)
+        for child in reversed(_sorted(project_i.children)):
+            stack.append((child, temp_id, None))
+    return n_projects, n_tasks
+
+
+def queue_move_tasks(api, roots, project_id=None, parent_id=None):
+    """Queue the commands which move task subtrees to a new parent.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param roots: The root nodes of the subtrees to move
+    :param project_id: The id of the destination project (used if parent_id is None)
+    :param parent_id: The id of the destination parent task
+    :return: The number of commands queued
+    """
+    if(parent_id is None and project_id is None):
+        pkg.log.error("A destination project or parent task is needed to move tasks.")
+    for node in roots:
+        if(parent_id is not None):
+            _commit.queue_command(api, 'item_move', {'id': node.id, 'parent_id': parent_id})
+        else:
+            _commit.queue_command(api, 'item_move', {'id': node.id, 'project_id': project_id})
+    return len(roots)
+
+
+def queue_move_projects(api, projects, parent_id=None):
+    """Queue the commands which move projects (and their sub-projects) to a new parent project.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param projects: The nodes of the projects to move
+    :param parent_id: The id of the destination parent project (None to make them top-level projects)
+    :return: The number of commands queued
+    """
+    for project in projects:
+        _commit.queue_command(api, 'project_move', {'id': project.id, 'parent_id': parent_id})
+    return len(projects)
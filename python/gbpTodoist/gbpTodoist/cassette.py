@@ -0,0 +1,270 @@
+"""This module provides record and replay of the HTTP traffic between a
+`todoist.TodoistAPI` instance and the Todoist servers.
+
+Both modes work by handing the API a stand-in for its `requests` session (see
+the `session` argument of `todoist.TodoistAPI`):
+
+   1) `recording_session` forwards every request to a real session and appends
+      the request, the response and its latency to a cassette: a gzipped file
+      of JSON lines.  API tokens (in requests and responses alike) are always
+      scrubbed, and the names and contents of projects and items can
+      optionally be anonymized;
+   2) `replay_session` serves the responses of a cassette back without
+      touching the network, optionally waiting for the recorded latencies
+      (scaled by a given factor).  GET requests (e.g. the concurrent fetches
+      of `fetch`) are matched to the entry recorded with the same parameters;
+      other requests are served in order.
+
+Anonymization replaces each text value by a salted hash of it, so that equal
+texts stay equal (which template matching relies upon) while the texts
+themselves are not kept.  The salt is random and is not saved.
+"""
+import os
+import sys
+import importlib
+import gzip
+import json
+import time
+import hashlib
+import re
+import threading
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Request parameters and headers whose values are never written to a cassette
+secret_keys = ['token', 'Authorization', 'password', 'api_token']
+
+#: Fields whose text values are replaced when anonymizing
+anonymized_keys = ['content', 'name', 'description', 'full_name', 'email', 'date_string', 'string', 'text', 'title']
+
+_SCRUBBED = 'SCRUBBED'
+_call_re = re.compile(r'/v\d+/(.*)$')
+
+
+def _call(url):
+    # The part of a URL identifying the API call, e.g. 'sync' or 'completed/get_all'
+    url = url.split('?')[0].rstrip('/')
+    match = _call_re.search(url)
+    return match.group(1) if match else url
+
+
+class _anonymizer(object):
+    """This class provides the salted hashing of text values."""
+
+    def __init__(self, salt=None):
+        self.salt = salt if salt is not None else os.urandom(16)
+
+    def text(self, value):
+        return 'x' + hashlib.sha1(self.salt + value.encode('utf-8')).hexdigest()[:12]
+
+    def __call__(self, obj):
+        """Return an anonymized copy of a decoded JSON object.
+
+        :param obj: A decoded JSON object
+        :return: A decoded JSON object
+        """
+        if(isinstance(obj, dict)):
+            result = {}
+            for key, value in obj.items():
+                if(key in anonymized_keys and isinstance(value, type(u''))):
+                    result[key] = self.text(value)
+                elif(key == 'commands' and isinstance(value, type(u''))):
+                    # Commands are posted as a JSON string
+                    try:
+                        result[key] = json.dumps(self(json.loads(value)))
+                    except ValueError:
+                        result[key] = value
+                else:
+                    result[key] = self(value)
+            return result
+        if(isinstance(obj, list)):
+            return [self(value) for value in obj]
+        return obj
+
+
+def _scrub(obj):
+    # Return a copy of a decoded JSON object with the values of `secret_keys` (at any depth) scrubbed
+    if(isinstance(obj, dict)):
+        return dict((key, _SCRUBBED if key in secret_keys else _scrub(value)) for key, value in obj.items())
+    if(isinstance(obj, list)):
+        return [_scrub(value) for value in obj]
+    return obj
+
+
+def _params_key(call, params):
+    # The key under which GET requests are matched on replay
+    return call + ' ' + json.dumps(_scrub(params), sort_keys=True)
+
+
+class recording_session(object):
+    """This class provides a `requests` session stand-in which records the
+    traffic going through it to a cassette."""
+
+    def __init__(self, path, session=None, anonymize=False):
+        """Start recording a cassette.
+
+        :param path: Path to the cassette file (it is overwritten)
+        :param session: The session to forward requests to (defaults to a new `requests.Session`)
+        :param anonymize: Boolean flag; if True, names and contents are anonymized (see the module documentation)
+        """
+        if(session is None):
+            import requests
+            session = requests.Session()
+        self.session = session
+        self.path = path
+        self.anonymizer = _anonymizer() if anonymize else None
+        self.n_recorded = 0
+        self._fp = gzip.open(path, 'wb')
+        self._lock = threading.Lock()
+
+    def _record(self, method, url, kwargs, response, latency):
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        entry = {'method': method, 'call': _call(url), 'params': _scrub(kwargs.get('params')),
+                 'data': _scrub(kwargs.get('data')), 'status': response.status_code, 'latency': latency, 'body': _scrub(body)}
+        if(self.anonymizer is not None):
+            entry = self.anonymizer(entry)
+        with self._lock:
+            self._fp.write((json.dumps(entry) + '\n').encode('utf-8'))
+            self._fp.flush()
+            self.n_recorded += 1
+
+    def _request(self, method, url, kwargs):
+        t_start = time.time()
+        response = getattr(self.session, method)(url, **kwargs)
+        self._record(method, url, kwargs, response, time.time() - t_start)
+        return response
+
+    def get(self, url, **kwargs):
+        return self._request('get', url, kwargs)
+
+    def post(self, url, **kwargs):
+        return self._request('post', url, kwargs)
+
+    def close(self):
+        """Finish writing the cassette.
+
+        :return: None
+        """
+        self._fp.close()
+
+
+class replayed_response(object):
+    """This class provides a minimal stand-in for a `requests` response."""
+
+    def __init__(self, entry):
+        self.status_code = entry.get('status', 200)
+        self._body = entry['body']
+        self.text = self._body if isinstance(self._body, type(u'')) else json.dumps(self._body)
+
+    def json(self):
+        if(isinstance(self._body, type(u''))):
+            return json.loads(self._body)
+        return self._body
+
+    def iter_content(self, chunk_size=1):
+        body = self.text.encode('utf-8')
+        for i_start in range(0, len(body), chunk_size):
+            yield body[i_start:i_start + chunk_size]
+
+    def raise_for_status(self):
+        if(self.status_code >= 400):
+            pkg.log.error("Replayed request failed with status %d." % (self.status_code))
+
+
+def read_cassette(path):
+    """Read the entries of a cassette.
+
+    :param path: Path to the cassette file
+    :return: A generator of entry dictionaries
+    """
+    with gzip.open(path, 'rb') as fp_in:
+        for line in fp_in:
+            line = line.strip()
+            if(line):
+                yield json.loads(line.decode('utf-8'))
+
+
+class replay_session(object):
+    """This class provides a `requests` session stand-in which serves the
+    responses of a cassette."""
+
+    def __init__(self, path, latency_scale=1.):
+        """Load a cassette for replay.
+
+        :param path: Path to the cassette file
+        :param latency_scale: Factor applied to the recorded latencies (0 to replay without waiting)
+        """
+        self.path = path
+        self.latency_scale = latency_scale
+        self.entries = list(read_cassette(path))
+        self.n_replayed = 0
+
+        # Requests may be made concurrently (see `fetch`), and so be recorded
+        # in any order.  GET requests are served the entry recorded with the
+        # same call and parameters; others are served in the order they arrive.
+        self._lock = threading.Lock()
+        self._used = [False] * len(self.entries)
+        self._i_next = 0
+        self._gets = {}
+        for i_entry, entry in enumerate(self.entries):
+            if(entry['method'] == 'get'):
+                self._gets.setdefault(_params_key(entry['call'], entry.get('params')), []).append(i_entry)
+        for indices in self._gets.values():
+            indices.reverse()
+
+    def _next_entry(self, method, url, params):
+        # Return the index of the entry serving a request
+        call = _call(url)
+        if(method == 'get'):
+            indices = self._gets.get(_params_key(call, params))
+            if(not indices):
+                pkg.log.error("Cassette {%s} has no (more) recorded requests for %s %s with parameters %s." % (
+                    self.path, method.upper(), call, json.dumps(_scrub(params), sort_keys=True)))
+            return indices.pop()
+        while(self._i_next < len(self.entries) and self._used[self._i_next]):
+            self._i_next += 1
+        if(self._i_next >= len(self.entries)):
+            pkg.log.error("Cassette {%s} has no more recorded requests (%s %s)." % (self.path, method.upper(), call))
+        entry = self.entries[self._i_next]
+        if(entry['method'] != method or entry['call'] != call):
+            pkg.log.error("Request %d does not match cassette {%s}: expected %s %s but got %s %s." % (
+                self._i_next, self.path, entry['method'].upper(), entry['call'], method.upper(), call))
+        return self._i_next
+
+    def _request(self, method, url, params=None):
+        with self._lock:
+            i_entry = self._next_entry(method, url, params)
+            self._used[i_entry] = True
+            self.n_replayed += 1
+        entry = self.entries[i_entry]
+        if(self.latency_scale > 0.):
+            time.sleep(entry['latency'] * self.latency_scale)
+        return replayed_response(entry)
+
+    def get(self, url, **kwargs):
+        return self._request('get', url, kwargs.get('params'))
+
+    def post(self, url, **kwargs):
+        return self._request('post', url)
+
+    def close(self):
+        """Release the cassette (and warn if some of its requests were not replayed).
+
+        :return: None
+        """
+        if(self.n_replayed < len(self.entries)):
+            pkg.log.comment("Only %d of the %d requests of cassette {%s} were replayed." % (
+                self.n_replayed, len(self.entries), self.path))
@@ -0,0 +1,238 @@
+"""This module provides batched, journaled committing of Todoist API commands.
+
+Commands queued on a `todoist.TodoistAPI` instance (by its managers, or with
+`queue_command`) are written to an on-disk journal before anything is sent to
+the server, and are then committed in batches.  Each batch that the server
+acknowledges is recorded in the journal, along with the temp-id to real-id
+mapping it returned.
+
+If a run is interrupted (an error, or the process being killed), the commands
+which were never acknowledged can be replayed by a later run without having to
+re-plan anything.  Commands keep their original `uuid` when replayed, and the
+Sync API does not execute a command twice, so replaying a batch which actually
+reached the server before the interruption is harmless.  The same mechanism
+allows commands to be journaled while offline and flushed later.
+
+Journal files are written as one JSON object per line:
+
+   {"event": "command", "command": {...}}
+   {"event": "ack", "status": {uuid: status, ...}, "temp_id_mapping": {...}}
+"""
+import os
+import sys
+import importlib
+import json
+import uuid
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Default number of commands sent to the server per request
+batch_size_default = 100
+
+
+def queue_command(api, command_type, args, temp_id=None):
+    """Add a raw command to an API's queue.
+
+    :param api: A `todoist.TodoistAPI` instance
+    :param command_type: The Sync API command type (e.g. 'item_delete')
+    :param args: Dictionary of command arguments
+    :param temp_id: Optional temp id for commands which create an object
+    :return: The command
+    """
+    command = {'type': command_type, 'uuid': str(uuid.uuid1()), 'args': args}
+    if(temp_id is not None):
+        command['temp_id'] = temp_id
+    api.queue.append(command)
+    return command
+
+
+def resolve_temp_ids(value, temp_id_mapping):
+    """Replace any temp ids found in a command's arguments with real ids.
+
+    :param value: A command argument (or dictionary/list of arguments)
+    :param temp_id_mapping: Dictionary mapping temp ids to real ids
+    :return: The resolved value
+    """
+    if(isinstance(value, dict)):
+        return dict((key, resolve_temp_ids(value_i, temp_id_mapping)) for key, value_i in value.items())
+    elif(isinstance(value, list)):
+        return [resolve_temp_ids(value_i, temp_id_mapping) for value_i in value]
+    try:
+        return temp_id_mapping.get(value, value)
+    except TypeError:
+        return value
+
+
+class command_journal(object):
+    """This class provides the write-ahead journal of planned commands."""
+
+    def __init__(self, path):
+        """Open (creating it if needed) a journal and load its state.
+
+        :param path: Path to the journal file
+        """
+        self.path = path
+        self.commands = []
+        self.status = {}
+        self.temp_id_mapping = {}
+        if(os.path.isfile(path)):
+            with open(path, 'r') as fp_in:
+                for line in fp_in:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from an interrupted write
+                        continue
+                    if(record['event'] == 'command'):
+                        self.commands.append(record['command'])
+                    elif(record['event'] == 'ack'):
+                        self.status.update(record['status'])
+                        self.temp_id_mapping.update(record['temp_id_mapping'])
+
+    def _write(self, records):
+        with open(self.path, 'a') as fp_out:
+            for record in records:
+                fp_out.write(json.dumps(record) + '\n')
+            fp_out.flush()
+            os.fsync(fp_out.fileno())
+
+    def pending(self):
+        """Return the journaled commands which have not been acknowledged.
+
+        :return: A list of commands
+        """
+        return [command for command in self.commands if command['uuid'] not in self.status]
+
+    def record(self, commands):
+        """Add commands to the journal.
+
+        :param commands: A list of commands
+        :return: None
+        """
+        self._write([{'event': 'command', 'command': command} for command in commands])
+        self.commands.extend(commands)
+
+    def acknowledge(self, status, temp_id_mapping):
+        """Record the server's response to a batch of commands.
+
+        :param status: Dictionary mapping command uuids to their sync status
+        :param temp_id_mapping: Dictionary mapping temp ids to real ids
+        :return: None
+        """
+        self._write([{'event': 'ack', 'status': status, 'temp_id_mapping': temp_id_mapping}])
+        self.status.update(status)
+        self.temp_id_mapping.update(temp_id_mapping)
+
+    def compact(self):
+        """Empty the journal if every command in it has been acknowledged.
+
+        :return: Boolean.  True if the journal was emptied.
+        """
+        if(self.pending()):
+            return False
+        if(os.path.isfile(self.path)):
+            os.remove(self.path)
+        self.commands = []
+        self.status = {}
+        self.temp_id_mapping = {}
+        return True
+
+
+def commit(api, journal=None, batch_size=batch_size_default, offline=False):
+    """Commit the commands queued on an API instance, in batches.
+
+    If a journal is given, the queued commands are journaled before anything is
+    sent, and each batch's acknowledgement is journaled once it is received.
+
+    :param api: A `todoist.TodoistAPI` instance
+    :param journal: An optional `command_journal` instance
+    :param batch_size: Maximum number of commands sent per request
+    :param offline: Boolean flag; if True, commands are only journaled (a journal is required)
+    :return: Dictionary mapping temp ids to real ids for the committed commands
+    """
+    commands = list(api.queue)
+    del api.queue[:]
+    if(journal):
+        journal.record(commands)
+    if(offline):
+        if(not journal):
+            pkg.log.error("A journal is needed to queue commands while offline.")
+        pkg.log.comment("%d commands journaled for a later run." % (len(commands)))
+        return {}
+    return _commit_commands(api, commands, journal, batch_size)
+
+
+def replay(api, journal, batch_size=batch_size_default):
+    """Commit any journaled commands which have not been acknowledged.
+
+    :param api: A `todoist.TodoistAPI` instance
+    :param journal: A `command_journal` instance
+    :param batch_size: Maximum number of commands sent per request
+    :return: Dictionary mapping temp ids to real ids for the committed commands
+    """
+    commands = journal.pending()
+    if(not commands):
+        journal.compact()
+        return {}
+    pkg.log.open("Replaying %d unacknowledged commands from {%s}..." % (len(commands), journal.path))
+    temp_id_mapping = _commit_commands(api, commands, journal, batch_size)
+    journal.compact()
+    pkg.log.close("Done.")
+    return temp_id_mapping
+
+
+def _commit_commands(api, commands, journal, batch_size):
+    """Send a list of commands to the server, in batches.
+
+    :param api: A `todoist.TodoistAPI` instance
+    :param commands: A list of commands
+    :param journal: An optional `command_journal` instance
+    :param batch_size: Maximum number of commands sent per request
+    :return: Dictionary mapping temp ids to real ids for the committed commands
+    """
+    temp_id_mapping = {}
+    if(journal):
+        temp_id_mapping.update(journal.temp_id_mapping)
+    n_failed = 0
+    with pkg.log.progress(count=len(commands), label='Committing', unit='commands') as bar:
+        for i_start in range(0, len(commands), batch_size):
+            batch = commands[i_start:i_start + batch_size]
+
+            # Temp ids created by earlier batches must be sent as real ids
+            for command in batch:
+                command['args'] = resolve_temp_ids(command['args'], temp_id_mapping)
+            api.queue.extend(batch)
+            try:
+                response = api.commit(raise_on_error=False)
+            except Exception:
+                del api.queue[:]
+                raise
+            if(not response):
+                response = {}
+            status = response.get('sync_status', {})
+            mapping = response.get('temp_id_mapping', {})
+            temp_id_mapping.update(mapping)
+
+            # Commands the server rejected are logged and acknowledged, so that they are not replayed forever
+            for command in batch:
+                status_i = status.get(command['uuid'], 'ok')
+                status[command['uuid']] = status_i
+                if(status_i != 'ok'):
+                    n_failed += 1
+                    pkg.log.comment("Command {%s} failed: %s" % (command['type'], str(status_i)))
+            if(journal):
+                journal.acknowledge(status, mapping)
+            bar.update(len(batch))
+    if(n_failed):
+        pkg.log.error("%d of %d commands failed." % (n_failed, len(commands)))
+    return temp_id_mapping
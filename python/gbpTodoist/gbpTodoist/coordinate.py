@@ -0,0 +1,246 @@
+"""This module provides coordination between overlapping runs on the same
+account.
+
+Two things are kept next to the API's local cache (see the `cache` argument of
+`todoist.TodoistAPI`), under names derived from a hash of the account's token:
+
+   1) a lock file, locked (with `fcntl.flock`) by a run for as long as it may
+      sync, plan or commit; a second run waits for it, so that commits to an
+      account are serialized and no two runs populate the same templates from
+      the same state;
+   2) a state stamp, recording the sync token and time of the last sync
+      written to the cache.  A run which obtains the lock just after another
+      run has synced can reload the (fresh enough) cache instead of syncing
+      again.
+
+Locks are released by the operating system if a run dies.  Where `fcntl` is
+not available, locking is skipped (and said so).
+"""
+import os
+import sys
+import importlib
+import errno
+import hashlib
+import json
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+
+def account_key(token):
+    """Return a name for an account which does not reveal its token.
+
+    :param token: The account's API token
+    :return: string
+    """
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+
+class account_lock(object):
+    """This class provides an exclusive, inter-process lock on a file."""
+
+    def __init__(self, path, timeout=None, poll_interval=0.2):
+        """Generate an instance of the account_lock class (without locking).
+
+        :param path: Path to the lock file (created if needed)
+        :param timeout: The number of seconds to wait for the lock (None to wait forever; 0 to not wait)
+        :param poll_interval: The number of seconds between attempts while waiting
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fp = None
+
+    def is_locked(self):
+        """Check if this instance holds the lock.
+
+        :return: Boolean
+        """
+        return self._fp is not None
+
+    def _try_lock(self, fp):
+        try:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if(e.errno in (errno.EAGAIN, errno.EACCES)):
+                return False
+            raise
+        return True
+
+    def acquire(self):
+        """Acquire the lock, waiting for it if it is held by another run.
+
+        :return: None
+        """
+        if(self._fp is not None):
+            return
+        if(fcntl is None):
+            pkg.log.comment("Inter-process locking is not available on this platform; lock {%s} not taken." % (self.path))
+            return
+        fp = open(self.path, 'a+')
+        t_start = time.time()
+        waiting = False
+        while(not self._try_lock(fp)):
+            if(not waiting):
+                fp.seek(0)
+                holder = fp.read().strip() or '?'
+                pkg.log.comment("Waiting for another run (pid %s) to release lock {%s}..." % (holder, self.path))
+                waiting = True
+            if(self.timeout is not None and time.time() - t_start >= self.timeout):
+                fp.close()
+                pkg.log.error("Timed-out waiting for lock {%s}." % (self.path))
+            time.sleep(self.poll_interval)
+        if(waiting):
+            pkg.log.comment("Lock acquired after %.1f seconds." % (time.time() - t_start))
+
+        # Leave our pid in the file, for the information of waiting runs
+        fp.seek(0)
+        fp.truncate()
+        fp.write('%d\n' % (os.getpid()))
+        fp.flush()
+        self._fp = fp
+
+    def release(self):
+        """Release the lock (if held).
+
+        :return: None
+        """
+        if(self._fp is not None):
+            fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class state_stamp(object):
+    """This class provides the record of the last sync written to an
+    account's cache."""
+
+    def __init__(self, path):
+        """Generate an instance of the state_stamp class.
+
+        :param path: Path to the stamp file
+        """
+        self.path = path
+
+    def read(self):
+        """Read the stamp.
+
+        :return: A dictionary with 'sync_token', 'time' and 'pid' keys, or None if there is no (valid) stamp
+        """
+        try:
+            with open(self.path, 'r') as fp_in:
+                stamp = json.load(fp_in)
+        except (IOError, OSError, ValueError):
+            return None
+        if(not isinstance(stamp, dict) or 'sync_token' not in stamp or 'time' not in stamp):
+            return None
+        return stamp
+
+    def write(self, sync_token, t_sync=None):
+        """Record a sync.
+
+        :param sync_token: The sync token written to the cache
+        :param t_sync: The time at which the account's state was fetched (defaults to now)
+        :return: None
+        """
+        # Write-then-rename, so that readers never see a half-written stamp
+        path_temp = self.path + '.%d.tmp' % (os.getpid())
+        with open(path_temp, 'w') as fp_out:
+            json.dump({'sync_token': sync_token, 'time': time.time() if t_sync is None else t_sync, 'pid': os.getpid()}, fp_out)
+        os.rename(path_temp, self.path)
+
+
+class account_coordinator(object):
+    """This class provides the coordination of a run with others on the same
+    account."""
+
+    def __init__(self, api, timeout=None, max_age=0.):
+        """Generate an instance of the account_coordinator class.
+
+        :param api: A `todoist.TodoistAPI` instance (with a cache; without one there is nothing to coordinate)
+        :param timeout: The number of seconds to wait for the account's lock (None to wait forever)
+        :param max_age: The maximum age (in seconds) of a state synced by another run for it to be reused (0 to always sync)
+        """
+        self.api = api
+        self.max_age = max_age
+        self.enabled = bool(api.cache)
+        self.lock = None
+        self.stamp = None
+        self.sync_token_stamped = None
+        if(self.enabled):
+            path_prefix = os.path.join(api.cache, account_key(api.token))
+            self.lock = account_lock(path_prefix + '.lock', timeout=timeout)
+            self.stamp = state_stamp(path_prefix + '.state')
+
+    def acquire(self):
+        """Acquire the account's lock.
+
+        :return: None
+        """
+        if(self.enabled):
+            self.lock.acquire()
+
+    def release(self):
+        """Release the account's lock, first recording any sync (e.g. by a
+        commit) made since the last one recorded.
+
+        :return: None
+        """
+        if(self.enabled and self.lock.is_locked()):
+            if(self.sync_token_stamped is not None and self.api.sync_token != self.sync_token_stamped):
+                self.mark_synced()
+            self.lock.release()
+
+    def reuse_state(self):
+        """Reload the cache if another run synced it recently enough.
+
+        The cache is re-read from scratch, since the state loaded when the API
+        was created may predate the other run's sync.
+
+        :return: Boolean; True if the cached state was reused
+        """
+        if(not self.enabled or self.max_age <= 0.):
+            return False
+        stamp = self.stamp.read()
+        if(stamp is None or time.time() - stamp['time'] > self.max_age):
+            return False
+        self.api.reset_state()
+        self.api._read_cache()
+        if(self.api.sync_token != stamp['sync_token']):
+            # The cache and the stamp disagree; do not trust either
+            return False
+        self.sync_token_stamped = self.api.sync_token
+        pkg.log.comment("Reusing the state synced %.1f seconds ago (by pid %s)." % (time.time() - stamp['time'], stamp.get('pid', '?')))
+        return True
+
+    def mark_synced(self, t_sync=None):
+        """Record that the cache holds a freshly synced state.
+
+        :param t_sync: The time at which the state was fetched (defaults to now)
+        :return: None
+        """
+        if(self.enabled):
+            self.stamp.write(self.api.sync_token, t_sync=t_sync)
+            self.sync_token_stamped = self.api.sync_token
@@ -0,0 +1,179 @@
+"""This module provides concurrent fetching of per-item resources (comments,
+activity) which are not part of a sync response.
+
+Requests are issued from an asyncio event loop, with:
+
+   1) bounded concurrency: at most `concurrency` requests are in flight;
+   2) a shared (token-bucket) rate limiter, so that the account's API rate
+      limit is respected however many requests are queued;
+   3) per-request timeouts, counted from when a worker starts the request,
+      after which it is reported as failed rather than holding up the others
+      (its worker is only reused once the request returns).
+
+The HTTP requests themselves are made with the API's own session (so that
+cassette recording and replay apply to them), in a pool of worker threads.
+Results are handed to a callback as they arrive, in completion order.
+
+This module needs Python 3.5 or later.
+"""
+import os
+import sys
+import importlib
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: The per-item resources which can be fetched: name -> (API call, function building its parameters, function extracting the result)
+resources = {
+    'comments': ('items/get', lambda item_id: {'item_id': item_id}, lambda response: response.get('notes', [])),
+    'activity': ('activity/get', lambda item_id: {'object_type': 'item', 'object_id': item_id, 'limit': 100},
+                 lambda response: response.get('events', []))}
+
+
+class rate_limiter(object):
+    """This class provides a token-bucket rate limiter for coroutines."""
+
+    def __init__(self, rate, burst=1):
+        """Generate an instance of the `rate_limiter` class.
+
+        :param rate: The sustained number of acquisitions allowed per second (0 for no limit)
+        :param burst: The number of acquisitions allowed in a burst
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.t_last = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        """Wait until a request is allowed.
+
+        :return: None
+        """
+        if(self.rate <= 0.):
+            return
+        if(self._lock is None):
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while(True):
+                t_now = time.monotonic()
+                self.tokens = min(float(self.burst), self.tokens + (t_now - self.t_last) * self.rate)
+                self.t_last = t_now
+                if(self.tokens >= 1.):
+                    self.tokens -= 1.
+                    return
+                await asyncio.sleep((1. - self.tokens) / self.rate)
+
+
+def _release_threadsafe(loop, semaphore, future):
+    # Called (from a worker thread) when a request is done
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        # The loop has been closed; the fetch is over
+        pass
+
+
+class fetcher(object):
+    """This class provides the concurrent fetcher."""
+
+    def __init__(self, api, concurrency=8, rate=10., timeout=10.):
+        """Generate an instance of the `fetcher` class.
+
+        :param api: A `todoist.TodoistAPI` instance
+        :param concurrency: The maximum number of requests in flight
+        :param rate: The maximum number of requests per second (0 for no limit)
+        :param timeout: The number of seconds after which a request is abandoned
+        """
+        self.api = api
+        self.concurrency = concurrency
+        self.limiter = rate_limiter(rate, burst=concurrency)
+        self.timeout = timeout
+
+    async def _fetch_one(self, loop, executor, semaphore, key, call, params):
+        # The semaphore is held until the worker thread is done with the
+        # request, even if it has timed out.  A request is thus only submitted
+        # when a worker is free to start it, and its timeout runs from then on
+        # (rather than from when it was queued behind an abandoned request).
+        await semaphore.acquire()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            semaphore.release()
+            raise
+        request = functools.partial(self.api._get, call, params=dict(params, token=self.api.token), timeout=self.timeout)
+        future = executor.submit(request)
+        future.add_done_callback(functools.partial(_release_threadsafe, loop, semaphore))
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            return key, None, 'timed out after %g seconds' % (self.timeout)
+        except Exception as e:
+            return key, None, str(e)
+        if(not isinstance(response, dict)):
+            return key, None, 'unexpected response: %s' % (str(response)[:200])
+        if('error' in response):
+            return key, None, str(response['error'])
+        return key, response, None
+
+    async def _fetch(self, loop, requests, on_result):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            tasks = [self._fetch_one(loop, executor, semaphore, key, call, params) for key, call, params in requests]
+            for task in asyncio.as_completed(tasks):
+                key, response, error = await task
+                on_result(key, response, error)
+        finally:
+            # Do not wait for abandoned (timed-out) requests
+            executor.shutdown(wait=False)
+
+    def fetch(self, requests, on_result):
+        """Make a set of GET requests concurrently.
+
+        :param requests: A list of (key, API call, parameters) tuples
+        :param on_result: A function called with (key, response, error message) for each request, as it completes
+        :return: None
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._fetch(loop, requests, on_result))
+        finally:
+            loop.close()
+
+    def fetch_resource(self, resource, item_ids, on_result):
+        """Fetch a per-item resource (see `resources`) for a list of items.
+
+        :param resource: The name of the resource
+        :param item_ids: A list of item ids
+        :param on_result: A function called with (item id, list of results or None, error message) for each item, as it completes
+        :return: A (number of successes, number of failures) tuple
+        """
+        if(resource not in resources):
+            pkg.log.error("Unknown resource {%s}." % (resource))
+        call, params, extract = resources[resource]
+        counts = [0, 0]
+
+        def _on_result(item_id, response, error):
+            if(error is None):
+                counts[0] += 1
+                on_result(item_id, extract(response), None)
+            else:
+                counts[1] += 1
+                on_result(item_id, None, error)
+
+        self.fetch([(item_id, call, params(item_id)) for item_id in item_ids], _on_result)
+        return counts[0], counts[1]
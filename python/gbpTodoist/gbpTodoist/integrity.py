@@ -0,0 +1,144 @@
+"""This module provides an integrity checker for the task forest of an account.
+
+A single pass over the nodes (using an index of the nodes by id, rather than the
+links built by `tree.build_tree`) identifies:
+
+   1) malformed items (those whose data holds an unparsed `kwargs` entry);
+   2) incomplete items: those missing their content or project (e.g. because
+      they came from a partial payload);
+   3) orphans: items whose parent id does not refer to a known item;
+   4) cycles: groups of items which are (indirectly) their own parents;
+   5) cross-project links: items whose parent lives in a different project;
+   6) items whose project does not exist.
+
+Each item is visited a bounded number of times, so the check is linear in the
+number of items.  `plan_cleanup` turns a report into the commands which delete
+malformed items and move orphans, cycles and cross-project links to the root
+of their project.  Incomplete items may well be real tasks, so they are only
+reported.
+"""
+import os
+import sys
+import importlib
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_commit = importlib.import_module(package_name + '.commit')
+
+#: The categories of problem reported by `check`
+categories = ['malformed', 'incomplete', 'orphans', 'cycles', 'cross_project', 'missing_project']
+
+
+def check(nodes, project_ids=None):
+    """Check the integrity of a forest of task nodes.
+
+    :param nodes: A list of all the task nodes of an account (including malformed ones)
+    :param project_ids: An optional set of the ids of the account's projects
+    :return: A dictionary with a list of nodes for each category (see `categories`); 'cycles' holds a list of lists
+    """
+    report = dict((category, []) for category in categories)
+    index = {}
+    ids_incomplete = set()
+    for node in nodes:
+        if(node.is_malformed()):
+            report['malformed'].append(node)
+        elif(node.content is None or node.project_id is None):
+            report['incomplete'].append(node)
+            ids_incomplete.add(node.id)
+        else:
+            index[node.id] = node
+
+    # 0: not visited, 1: on the current path, 2: done
+    state = dict.fromkeys(index, 0)
+    for node in index.values():
+        if(project_ids is not None and node.project_id not in project_ids):
+            report['missing_project'].append(node)
+        parent = index.get(node.parent_id) if node.parent_id is not None else None
+        if(node.parent_id is not None and parent is None):
+            # The children of incomplete items are not orphans; their parent exists
+            if(node.parent_id not in ids_incomplete):
+                report['orphans'].append(node)
+        elif(parent is not None and parent.project_id != node.project_id):
+            report['cross_project'].append(node)
+
+        # Walk up the ancestors until reaching a node that has already been
+        # resolved; if we find one on the current path, we have a cycle
+        path = []
+        node_i = node
+        while(node_i is not None and state[node_i.id] == 0):
+            state[node_i.id] = 1
+            path.append(node_i)
+            node_i = index.get(node_i.parent_id) if node_i.parent_id is not None else None
+        if(node_i is not None and state[node_i.id] == 1):
+            report['cycles'].append(path[path.index(node_i):])
+        for node_j in path:
+            state[node_j.id] = 2
+    return report
+
+
+def n_problems(report):
+    """Count the problems in a report.
+
+    :param report: A report returned by `check`
+    :return: Integer
+    """
+    return sum(len(report[category]) for category in categories)
+
+
+def log_report(report):
+    """Write a report to the package log.
+
+    :param report: A report returned by `check`
+    :return: None
+    """
+    descriptions = {'malformed': 'Malformed items', 'incomplete': 'Items missing their content or project', 'orphans': 'Items with a missing parent',
+                    'cycles': 'Parent cycles', 'cross_project': 'Items with a parent in another project',
+                    'missing_project': 'Items in a missing project'}
+    for category in categories:
+        if(not report[category]):
+            continue
+        pkg.log.open('%s (%d):' % (descriptions[category], len(report[category])))
+        for entry in report[category]:
+            if(category == 'cycles'):
+                pkg.log.comment(' -> '.join('%s (%s)' % (node.content, node.id) for node in entry))
+            elif(category == 'malformed'):
+                pkg.log.comment(str(entry.data))
+            else:
+                pkg.log.comment('%s (%s)' % (entry.content, entry.id))
+        pkg.log.close(None)
+
+
+def plan_cleanup(api, report):
+    """Queue the commands which repair the problems in a report.
+
+    Malformed items are deleted.  Orphans, items with a parent in another
+    project and one item of each cycle are moved to the root of their project.
+    Incomplete items and items in missing projects can not be repaired here,
+    and are left alone.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param report: A report returned by `check`
+    :return: The number of commands queued
+    """
+    n_commands = 0
+    ids_delete = [node.id for node in report['malformed'] if node.is_malformed() and node.id is not None]
+    if(ids_delete):
+        _commit.queue_command(api, 'item_delete', {'ids': ids_delete})
+        n_commands += 1
+    ids_missing = set(node.id for node in report['missing_project'])
+    nodes_move = report['orphans'] + report['cross_project'] + [cycle[0] for cycle in report['cycles']]
+    for node in nodes_move:
+        if(node.id in ids_missing):
+            continue
+        _commit.queue_command(api, 'item_move', {'id': node.id, 'project_id': node.project_id})
+        n_commands += 1
+    return n_commands
@@ -0,0 +1,162 @@
+"""This module provides structural (Merkle) hashing of task subtrees.
+
+The digest of a node combines its own key (by default, its content) with the
+digests of its children.  Child digests are sorted before being combined, so
+that two subtrees have the same digest if and only if they hold the same
+contents in the same shape, whatever the order of their siblings.
+
+These digests are used in two ways:
+
+   1) template population: a target whose (active) subtree has the same digest
+      as the template's subtree already holds every task the template would
+      add, so it can be skipped without walking it (see `populate`);
+   2) snapshot diffs: `snapshot` records the digest of every subtree of a
+      forest and `diff` compares two snapshots, only descending into subtrees
+      whose digests differ.
+"""
+import os
+import sys
+import importlib
+import hashlib
+import json
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Item fields which contribute to a node's digest in snapshots
+snapshot_fields = ['content', 'name', 'checked', 'is_archived', 'priority', 'labels', 'date_string', 'due_date_utc', 'due',
+                   'responsible_uid', 'collapsed', 'child_order', 'item_order']
+
+
+def combine(key, child_digests, unique_keys=None):
+    """Compute the digest of a node from its key and its children's digests.
+
+    :param key: A string (or bytes) identifying the node's own content
+    :param child_digests: A list of the children's digests
+    :param unique_keys: Optional list of the children's keys; if any are repeated, the node is given no digest
+    :return: A digest (bytes), or None if the node (or any of its descendants) can not be given one
+    """
+    if(None in child_digests):
+        return None
+    if(unique_keys is not None and len(set(unique_keys)) != len(unique_keys)):
+        return None
+    if(not isinstance(key, bytes)):
+        key = key.encode('utf-8')
+    hasher = hashlib.sha1(key)
+    hasher.update(b'\x00')
+    for digest in sorted(child_digests):
+        hasher.update(digest)
+    return hasher.digest()
+
+
+def node_key(data, fields=None):
+    """Return the key used for a node's own contribution to its digest.
+
+    :param data: A project or item data dictionary
+    :param fields: The fields to include (defaults to `snapshot_fields`)
+    :return: A string
+    """
+    if(fields is None):
+        fields = snapshot_fields
+    return json.dumps([data.get(field) for field in fields], sort_keys=True)
+
+
+def snapshot(nodes, fields=None):
+    """Record the digests of every subtree of a forest.
+
+    :param nodes: A list of all the (linked) nodes of a forest
+    :param fields: The fields which contribute to each node's digest (defaults to `snapshot_fields`)
+    :return: A dictionary mapping node ids to (parent id, own digest, subtree digest, child ids) tuples
+    """
+    own = {}
+    for node in nodes:
+        if(node.id is not None and not node.is_malformed()):
+            own[node.id] = hashlib.sha1(node_key(node.data, fields=fields).encode('utf-8')).digest()
+
+    # Compute subtree digests bottom-up, without recursion
+    result = {}
+    for node in nodes:
+        if(node.id not in own or node.id in result):
+            continue
+        stack = [(node, False)]
+        while(stack):
+            node_i, expanded = stack.pop()
+            if(node_i.id in result):
+                continue
+            if(not expanded):
+                stack.append((node_i, True))
+                for child in node_i.children:
+                    if(child.id not in result):
+                        stack.append((child, False))
+            else:
+                child_ids = tuple(child.id for child in node_i.children)
+                digest = combine(own[node_i.id], [result[child_id][2] for child_id in child_ids])
+                parent_id = node_i.parent.id if node_i.parent else None
+                result[node_i.id] = (parent_id, own[node_i.id], digest, child_ids)
+    return result
+
+
+def diff(snapshot_old, snapshot_new):
+    """Compare two snapshots.
+
+    Only subtrees whose digests differ are descended into, so the cost scales
+    with the size of the change rather than the size of the forest.
+
+    :param snapshot_old: A snapshot (see `snapshot`)
+    :param snapshot_new: A snapshot (see `snapshot`)
+    :return: A dictionary of sets of ids: 'added', 'removed', 'changed' (own content) and 'moved' (parent changed)
+    """
+    result = {'added': set(), 'removed': set(), 'changed': set(), 'moved': set()}
+
+    def _roots(snap):
+        return [node_id for node_id, entry in snap.items() if entry[0] is None or entry[0] not in snap]
+
+    def _add_subtree(snap, snap_other, node_id, found, found_shared):
+        # Nodes which are also in the other snapshot are not descended into; they are returned instead
+        stack = [node_id]
+        while(stack):
+            node_id_i = stack.pop()
+            if(node_id_i in snap_other):
+                found_shared.append(node_id_i)
+            else:
+                found.add(node_id_i)
+                stack.extend(snap[node_id_i][3])
+
+    stack = [(_roots(snapshot_old), _roots(snapshot_new))]
+    while(stack):
+        ids_old, ids_new = stack.pop()
+
+        # Nodes which are no longer here are either gone, or will be found (as moved) under their new parent
+        set_new = set(ids_new)
+        for node_id in ids_old:
+            if(node_id not in set_new and node_id not in snapshot_new):
+                _add_subtree(snapshot_old, snapshot_new, node_id, result['removed'], [])
+
+        set_old = set(ids_old)
+        ids_compare = []
+        for node_id in ids_new:
+            if(node_id not in set_old):
+                if(node_id not in snapshot_old):
+                    _add_subtree(snapshot_new, snapshot_old, node_id, result['added'], ids_compare)
+                    continue
+            ids_compare.append(node_id)
+        for node_id in ids_compare:
+            entry_old = snapshot_old[node_id]
+            entry_new = snapshot_new[node_id]
+            if(entry_old[0] != entry_new[0]):
+                result['moved'].add(node_id)
+            if(entry_old[2] is not None and entry_old[2] == entry_new[2]):
+                continue
+            if(entry_old[1] != entry_new[1]):
+                result['changed'].add(node_id)
+            stack.append((entry_old[3], entry_new[3]))
+    return result
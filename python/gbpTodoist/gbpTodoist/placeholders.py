@@ -0,0 +1,206 @@
+"""This module provides the placeholders which can be used in template tasks.
+
+The content (and due-date string) of a template subtask may hold placeholders,
+which are replaced with values taken from each target it is populated onto:
+
+   {target}           the content of the target task
+   {project}          the name of the target's project
+   {due}              the target's due date (empty if it has none)
+   {today}            the date of the run
+
+Dates can be offset by a number of days and given a `strftime` format, e.g.
+`{due-2}`, `{today+7:%b %d}`; the default format is YYYY-MM-DD, which Todoist
+accepts as a due-date string.  `{{` and `}}` stand for literal braces, and
+braces around anything else are left as they are.
+
+Texts are compiled once (and cached) into `formatter` objects, holding the
+text already split into literal and placeholder parts; texts without
+placeholders compile to None and are used as they are.  A formatter's
+`pattern` matches its renderings for a given target on any date, so that tasks
+created from a text can be recognised on later runs (e.g. with a later
+`{today}`).
+"""
+import os
+import sys
+import importlib
+import re
+import datetime
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+
+#: The names of the placeholders holding text
+text_names = ['target', 'project']
+
+#: The names of the placeholders holding dates
+date_names = ['due', 'today']
+
+_date_format_default = '%Y-%m-%d'
+_token_re = re.compile(r'\{\{|\}\}|\{(\w+)([+-]\d+)?(?::([^{}]*))?\}')
+
+# Regular expressions for the `strftime` directives used in dates
+_date_directives = {'Y': r'\d{4}', 'y': r'\d{2}', 'm': r'\d{2}', 'd': r'\d{2}', 'H': r'\d{2}', 'I': r'\d{2}',
+                    'M': r'\d{2}', 'S': r'\d{2}', 'j': r'\d{3}', 'a': r'[^\W\d_]+', 'A': r'[^\W\d_]+',
+                    'b': r'[^\W\d_]+', 'B': r'[^\W\d_]+', 'p': r'[^\W\d_]+', '%': '%'}
+
+# Compiled texts, keyed by text, and date regular expressions, keyed by format
+_cache = {}
+_date_regex_cache = {}
+
+
+class formatter(object):
+    """This class provides a compiled text with placeholders."""
+
+    __slots__ = ('text', 'parts')
+
+    def __init__(self, text, parts):
+        """Generate an instance of the formatter class (see `compile_text`).
+
+        :param text: The source text
+        :param parts: A list of literal strings and (name, offset in days, date format) tuples
+        """
+        self.text = text
+        self.parts = parts
+
+    def __getstate__(self):
+        return (self.text, self.parts)
+
+    def __setstate__(self, state):
+        self.text, self.parts = state
+
+    def render(self, values):
+        """Render the text for a set of values.
+
+        :param values: A dictionary of placeholder values (see `target_values`)
+        :return: string
+        """
+        result = []
+        for part in self.parts:
+            if(isinstance(part, tuple)):
+                name, offset, date_format = part
+                value = values.get(name)
+                if(value is None):
+                    continue
+                if(name in date_names):
+                    if(offset):
+                        value = value + datetime.timedelta(days=offset)
+                    value = value.strftime(date_format)
+                result.append(value)
+            else:
+                result.append(part)
+        return ''.join(result)
+
+    def pattern(self, values):
+        """Return a regular expression matching the renderings of the text for
+        a target on any date.
+
+        Text placeholders must hold the target's own values; date placeholders
+        may hold any date (in their format).  Texts without any literal part
+        to anchor a match have no pattern, and only match exactly.
+
+        :param values: A dictionary of placeholder values (see `target_values`)
+        :return: A compiled regular expression (use its `match` method), or None
+        """
+        regex = []
+        anchored = False
+        for part in self.parts:
+            if(not isinstance(part, tuple)):
+                anchored = anchored or bool(part.strip())
+                regex.append(re.escape(part))
+            elif(part[0] in date_names):
+                regex.append('(?:%s)?' % (_date_regex(part[2])))
+            else:
+                regex.append(re.escape(values.get(part[0]) or ''))
+        if(not anchored):
+            return None
+        return re.compile(''.join(regex) + r'\Z', re.DOTALL)
+
+
+def _date_regex(date_format):
+    """Return a regular expression matching the dates written with a `strftime` format.
+
+    :param date_format: A `strftime` format
+    :return: string
+    """
+    regex = _date_regex_cache.get(date_format)
+    if(regex is None):
+        regex = []
+        for match in re.finditer(r'%(.)|([^%]+)', date_format):
+            directive, literal = match.groups()
+            if(literal is not None):
+                regex.append(re.escape(literal))
+            else:
+                regex.append(_date_directives.get(directive, '.+?'))
+        regex = _date_regex_cache[date_format] = ''.join(regex)
+    return regex
+
+
+def compile_text(text):
+    """Compile a text with placeholders.
+
+    :param text: A string (or None)
+    :return: A `formatter`, or None if the text holds no placeholders
+    """
+    if(not text or ('{' not in text and '}' not in text)):
+        return None
+    if(text in _cache):
+        return _cache[text]
+    parts = []
+    literal = []
+    i_last = 0
+    n_placeholders = 0
+    for match in _token_re.finditer(text):
+        literal.append(text[i_last:match.start()])
+        i_last = match.end()
+        token = match.group(0)
+        name, offset, date_format = match.groups()
+        if(token in ('{{', '}}')):
+            literal.append(token[0])
+        elif(name in date_names):
+            parts.append(''.join(literal))
+            literal = []
+            parts.append((name, int(offset) if offset else 0, date_format or _date_format_default))
+            n_placeholders += 1
+        elif(name in text_names and offset is None and date_format is None):
+            parts.append(''.join(literal))
+            literal = []
+            parts.append((name, 0, None))
+            n_placeholders += 1
+        else:
+            literal.append(token)
+    literal.append(text[i_last:])
+    parts.append(''.join(literal))
+    parts = [part for part in parts if part != '']
+    if(n_placeholders == 0 and ''.join(parts) == text):
+        result = None
+    else:
+        result = formatter(text, parts)
+    _cache[text] = result
+    return result
+
+
+def target_values(task_target, project_target, today=None):
+    """Return the placeholder values of a target.
+
+    :param task_target: A target task (with a `data` dictionary)
+    :param project_target: The target's project (with a `data` dictionary)
+    :param today: The date of the run (defaults to today)
+    :return: A dictionary of values
+    """
+    due = _tree.due_datetime(task_target.data)
+    if(today is None):
+        today = datetime.date.today()
+    return {'target': task_target.data.get('content'),
+            'project': project_target.data.get('name'),
+            'due': due.date() if due is not None and due.time() == datetime.time() else due,
+            'today': today}
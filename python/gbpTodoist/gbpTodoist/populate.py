@@ -0,0 +1,352 @@
+"""This module provides the planning stage of template population.
+
+Populating a template onto a target task is split into two steps: *planning*,
+in which the template subtree is compared against the target's subtree and an
+ordered list of commands is produced, and *committing*, in which those commands
+are handed to the Todoist API.  Planning is a pure function of the two subtrees,
+so it can be run in worker processes.
+
+Planning inputs are converted to compact nested tuples before being handed to
+a worker:
+
+   template: (content, fields, (child template, ...), digest, placeholders)
+   target:   (id, content, item_order, indent, (active child target, ...), digest)
+
+Each input carries the Merkle digest of its subtree (see `merkle`).  When a
+template subtree and the target subtree it is being populated onto have the
+same digest, the target already holds everything the template would add, and
+it is skipped without being walked.
+
+Template contents and due-date strings may hold placeholders (see
+`placeholders`), compiled once per template when its input is built.  Subtrees
+holding placeholders are rendered for each target (see `render_template`)
+before being planned, and their digests are computed from the rendered
+contents; subtrees without any are shared, as they are, by all their targets.
+Existing subtasks are also recognised by their renderings for the same target
+on other dates (see `placeholders.formatter.pattern`), so that a subtask
+rendered on an earlier run (e.g. with an earlier `{today}`) is not added again.
+
+Pairs are grouped into shards by the top-level project that hosts the target.
+The plans of all shards are merged back into a single command stream in shard
+order, so the result does not depend on the number of processes used.
+"""
+import os
+import sys
+import importlib
+import multiprocessing
+import datetime
+from collections import OrderedDict
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+merkle = importlib.import_module(package_name + '.merkle')
+placeholders = importlib.import_module(package_name + '.placeholders')
+
+#: Item fields which are copied from a template task onto the tasks created from it
+template_fields = ['date_completed', 'all_day', 'in_history', 'priority', 'labels', 'date_lang', 'day_order', 'is_archived',
+                   'responsible_uid', 'user_id', 'checked', 'date_string', 'due_date_utc', 'assigned_by_uid', 'collapsed', 'is_deleted']
+
+#: Template fields which may hold placeholders
+placeholder_fields = ['date_string']
+
+
+def is_active(item):
+    """Check if a task is active (i.e. neither checked nor archived).
+
+    :param item: A task with a `data` dictionary
+    :return: Boolean
+    """
+    return not (item.data['checked'] or item.data['is_archived'])
+
+
+def template_input(task_template):
+    """Convert a template task's subtree to the compact form used for planning.
+
+    The last element of the result is None if the subtree holds no
+    placeholders; otherwise it is a (content formatter or None, dictionary of
+    field formatters) tuple for the subtree's root, and the subtree's digest is
+    None until it is rendered.
+
+    :param task_template: A template (sub)task with `data` and `children` attributes
+    :return: A nested tuple
+    """
+    fields = {}
+    for key in template_fields:
+        if key in task_template.data:
+            fields[key] = task_template.data[key]
+    content = task_template.data['content']
+    children = tuple(template_input(child) for child in task_template.children)
+    content_formatter = placeholders.compile_text(content)
+    field_formatters = {}
+    for key in placeholder_fields:
+        field_formatter = placeholders.compile_text(fields.get(key))
+        if(field_formatter is not None):
+            field_formatters[key] = field_formatter
+    if(content_formatter is None and not field_formatters and all(child[4] is None for child in children)):
+        digest = merkle.combine(content, [child[3] for child in children], unique_keys=[child[0] for child in children])
+        return (content, fields, children, digest, None)
+    return (content, fields, children, None, (content_formatter, field_formatters))
+
+
+def render_template(template, values):
+    """Render the placeholders of a compact template subtree for a target.
+
+    :param template: A compact template subtree (see `template_input`)
+    :param values: A dictionary of placeholder values (see `placeholders.target_values`)
+    :return: A compact template subtree without placeholders (`template` itself, if it holds none); the last element of each rendered node is a pattern matching the renderings of its content on other dates (None if there is none)
+    """
+    content, fields, children, digest, formatters = template
+    if(formatters is None):
+        return template
+    content_formatter, field_formatters = formatters
+    pattern = None
+    if(content_formatter is not None):
+        content = content_formatter.render(values)
+        pattern = content_formatter.pattern(values)
+    if(field_formatters):
+        fields = dict(fields)
+        for key, field_formatter in field_formatters.items():
+            fields[key] = field_formatter.render(values)
+        if('date_string' in field_formatters):
+            # Let the server work the due date out from the rendered string
+            fields.pop('due_date_utc', None)
+    children = tuple(render_template(child, values) for child in children)
+    digest = merkle.combine(content, [child[3] for child in children], unique_keys=[child[0] for child in children])
+    return (content, fields, children, digest, pattern)
+
+
+def target_input(task_target):
+    """Convert a target task's subtree (active tasks only) to the compact form
+    used for planning.
+
+    :param task_target: A target task with `data` and `children` attributes
+    :return: A nested tuple
+    """
+    content = task_target.data['content']
+    children = tuple(target_input(child) for child in task_target.children if is_active(child))
+    digest = merkle.combine(content, [child[5] for child in children])
+    return (task_target.data['id'], content, task_target.data['item_order'], task_target.data['indent'], children, digest)
+
+
+def _plan_recursive(template, target_ref, target_content, item_order, indent, target_children, project_id, keys, added, commands):
+    """Plan the population of one template subtask onto a target (sub)task.
+
+    :param template: Compact template subtree
+    :param target_ref: Reference to the target; either ('id', task id) or ('key', plan key)
+    :param target_content: Content of the target
+    :param item_order: `item_order` of the target
+    :param indent: `indent` of the target
+    :param target_children: Compact subtrees of the target's active children
+    :param project_id: The project hosting the target
+    :param keys: A two-element list with the last plan key counter used and the shard's key prefix
+    :param added: A dictionary mapping target references to the (compact) children planned for them so far
+    :param commands: The list of commands to append to
+    :return: None
+    """
+    content, fields, template_children, digest, pattern = template
+    label = content + ' -> ' + target_content + ' ... '
+
+    # Check if subtask is already there (or has already been planned by another
+    # template with the same target).  If there are duplicates, the last one wins.
+    # Subtasks rendered with other placeholder values are only used if there
+    # is no exact match.
+    present = None
+    present_rendered = None
+    for child in target_children:
+        if content == child[1]:
+            present = (('id', child[0]),) + child[1:]
+        elif pattern is not None and pattern.match(child[1]):
+            present_rendered = (('id', child[0]),) + child[1:]
+    for child in added.get(target_ref, ()):
+        if content == child[1]:
+            present = child
+    if present is None:
+        present = present_rendered
+
+    if present and digest is not None and digest == present[5]:
+        commands.append({'action': 'covered', 'label': label, 'key': present[0], 'parent': target_ref})
+        return
+    elif present:
+        commands.append({'action': 'present', 'label': label, 'key': present[0], 'parent': target_ref})
+        ref_next, _, item_order_next, indent_next, children_next, _ = present
+    else:
+        keys[0] += 1
+        ref_next = ('key', '%s:%d' % (keys[1], keys[0]))
+        args = dict(fields)
+        args['item_order'] = item_order
+        args['indent'] = indent + 1
+        commands.append({'action': 'add', 'label': label, 'key': ref_next, 'parent': target_ref,
+                         'content': content, 'project_id': project_id, 'args': args})
+        added.setdefault(target_ref, []).append((ref_next, content, item_order, indent + 1, (), None))
+        item_order_next = item_order
+        indent_next = indent + 1
+        children_next = ()
+
+    for child in template_children:
+        _plan_recursive(child, ref_next, content, item_order_next, indent_next, children_next, project_id, keys, added, commands)
+
+
+def plan_pairs(pairs, key_prefix='0'):
+    """Plan the population of a list of template/target pairs.
+
+    :param pairs: A list of (compact template, compact target, project id, placeholder values) tuples
+    :param key_prefix: A prefix making the plan keys generated here unique
+    :return: A list of commands
+    """
+    commands = []
+    keys = [0, key_prefix]
+    added = {}
+    for template, target, project_id, values in pairs:
+        template = render_template(template, values)
+        target_id, target_content, item_order, indent, target_children, target_digest = target
+        if(template[3] is not None and template[3] == target_digest and ('id', target_id) not in added):
+            commands.append({'action': 'covered', 'label': template[0] + ' -> ' + target_content + ' ... ',
+                             'key': ('id', target_id), 'parent': None})
+            continue
+        for subtask_template in template[2]:
+            _plan_recursive(subtask_template, ('id', target_id), target_content, item_order, indent,
+                            target_children, project_id, keys, added, commands)
+    return commands
+
+
+def _plan_shard(shard):
+    """Plan one shard.  This is the function executed by the worker processes.
+
+    :param shard: A (shard index, list of pairs) tuple
+    :return: A list of commands
+    """
+    i_shard, pairs = shard
+    return plan_pairs(pairs, key_prefix=str(i_shard))
+
+
+def root_project(project):
+    """Return the top-level ancestor of a project.
+
+    :param project: A project with a `parent` attribute
+    :return: A project
+    """
+    while(project.parent):
+        project = project.parent
+    return project
+
+
+def pair_input(item, templates=None, today=None):
+    """Convert a template/target pair to the compact form used for planning.
+
+    :param item: A template dictionary (see `task_tree._find_template_tasks`)
+    :param templates: An optional dictionary of the templates converted so far (keyed by task id), so that each is only converted (and its placeholders compiled) once, however many targets it has
+    :param today: The date of the run (defaults to today)
+    :return: A (compact template, compact target, project id, placeholder values) tuple
+    """
+    task_template = item['task_template']
+    if(templates is None):
+        template = template_input(task_template)
+    else:
+        template = templates.get(task_template.data['id'])
+        if(template is None):
+            template = templates[task_template.data['id']] = template_input(task_template)
+    return (template, target_input(item['task_target']), item['task_target'].data['project_id'],
+            placeholders.target_values(item['task_target'], item['project_target'], today=today))
+
+
+def build_shards(template_list):
+    """Split the template list returned by `task_tree._find_template_tasks`
+    into shards, one per top-level project hosting the targets.
+
+    :param template_list: A list of template dictionaries
+    :return: A list of (shard index, list of compact pairs) tuples, in the order of first appearance in `template_list`
+    """
+    shards = OrderedDict()
+    templates = {}
+    today = datetime.date.today()
+    for item in template_list:
+        project_root = root_project(item['project_target'])
+        pair = pair_input(item, templates=templates, today=today)
+        shards.setdefault(project_root.data['id'], []).append(pair)
+    return list(enumerate(shards.values()))
+
+
+def plan(template_list, n_processes=1):
+    """Plan the population of all template/target pairs.
+
+    If more than one process is requested, the pairs are sharded by top-level
+    project and planned in a pool of worker processes.  The result is the
+    same in either case.
+
+    :param template_list: A list of template dictionaries (see `task_tree._find_template_tasks`)
+    :param n_processes: Number of worker processes to use
+    :return: A list of commands
+    """
+    shards = build_shards(template_list)
+    n_processes = min(n_processes, len(shards))
+    if(n_processes <= 1):
+        plans = [_plan_shard(shard) for shard in pkg.log.progress(shards, label='Planning', unit='shards')]
+    else:
+        pkg.log.comment("Planning %d shards with %d processes." % (len(shards), n_processes))
+        pool = multiprocessing.Pool(processes=n_processes)
+        try:
+            plans = list(pkg.log.progress(pool.imap(_plan_shard, shards, chunksize=1), count=len(shards), label='Planning', unit='shards'))
+        finally:
+            pool.close()
+            pool.join()
+
+    # Merge the shard plans into one ordered command stream
+    commands = []
+    for plan_shard in plans:
+        commands.extend(plan_shard)
+    return commands
+
+
+def select_affected(template_list, items_changed, projects_changed, get_node):
+    """Select the template/target pairs which could be affected by a set of
+    changes (e.g. those returned by an incremental sync).
+
+    A pair is affected if its template project or target project changed, or if
+    a changed (or deleted) task's nearest templated ancestor (i.e. the nearest
+    ancestor which is a template task or a target task) belongs to the pair.
+
+    Tasks which moved out of a template or target subtree between syncs can not
+    be traced back to it, and are only accounted for by a full run.
+
+    :param template_list: A list of template dictionaries (see `task_tree._find_template_tasks`)
+    :param items_changed: A list of the changed items' data dictionaries
+    :param projects_changed: A list of the changed projects' data dictionaries
+    :param get_node: A function returning the node of a task, given its id (or None if it is unknown)
+    :return: The list of affected template dictionaries, in their original order
+    """
+    pairs_by_task = {}
+    project_ids_watched = set()
+    for i_pair, item in enumerate(template_list):
+        pairs_by_task.setdefault(item['task_template'].id, []).append(i_pair)
+        pairs_by_task.setdefault(item['task_target'].id, []).append(i_pair)
+        project_ids_watched.add(item['project_template'].id)
+        project_ids_watched.add(item['project_target'].id)
+
+    selected = set()
+    project_ids_changed = set(data['id'] for data in projects_changed if 'id' in data)
+    for i_pair, item in enumerate(template_list):
+        if(item['project_template'].id in project_ids_changed or item['project_target'].id in project_ids_changed):
+            selected.add(i_pair)
+
+    for data in items_changed:
+        if(data.get('project_id') not in project_ids_watched):
+            continue
+        # Deleted tasks are no longer in the tree, so start from their parent
+        for task_id in (data.get('id'), data.get('parent_id')):
+            node = get_node(task_id) if task_id is not None else None
+            while(node is not None and node.id not in pairs_by_task):
+                node = node.parent
+            if(node is not None):
+                selected.update(pairs_by_task[node.id])
+                break
+
+    return [item for i_pair, item in enumerate(template_list) if i_pair in selected]
@@ -0,0 +1,136 @@
+"""This module provides the pruning of stale, completed subtrees.
+
+Completed tasks build up under template targets (and elsewhere), where they
+are carried by every sync and have to be stepped over by every populate.  A
+subtree is stale if every task in it is completed and the latest of their
+completions is older than a cutoff.
+
+`completed_subtrees` makes one pass over the nodes of a forest, bottom-up
+(each node is visited once its children have been, using an index of the
+number of children still to be visited, so no recursion is needed), recording
+the latest completion of each fully completed subtree.  `find_stale` then
+picks, in a top-down pass, the topmost stale subtrees, so that each is
+archived (or deleted) with a single command for its root.  `plan` queues those
+commands, which are committed in batches (see `commit.commit`).
+"""
+import os
+import sys
+import importlib
+import datetime
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+_commit = importlib.import_module(package_name + '.commit')
+
+#: The actions which can be taken on stale subtrees
+actions = ('archive', 'delete')
+
+#: Maximum number of ids given to each 'item_delete' command
+ids_per_command = 100
+
+
+def cutoff_date(n_days, now=None):
+    """Return the cutoff for subtrees last completed more than a number of days ago.
+
+    :param n_days: The number of days
+    :param now: The (naive, UTC) time to count back from (defaults to now)
+    :return: A datetime
+    """
+    if(now is None):
+        now = datetime.datetime.utcnow()
+    return now - datetime.timedelta(days=n_days)
+
+
+def completed_subtrees(nodes):
+    """Find the fully completed subtrees of a forest.
+
+    :param nodes: A list of all the (linked) task nodes of a forest
+    :return: A dictionary mapping the id of the root of each fully completed subtree to a (latest completion, number of tasks) tuple
+    """
+    pending = {}
+    for node in nodes:
+        if(node.id is not None and not node.is_malformed()):
+            pending[node.id] = len(node.children)
+
+    # Nodes which are checked but carry no completion date can not be dated,
+    # and are treated (with their ancestors) as not completed
+    result = {}
+    ready = [node for node in nodes if pending.get(node.id) == 0]
+    while(ready):
+        node = ready.pop()
+        latest = None
+        if(node.flags & _tree.FLAG_CHECKED and not node.flags & _tree.FLAG_DELETED):
+            latest = _tree.completed_datetime(node.data)
+        n_tasks = 1
+        for child in node.children:
+            if(latest is None):
+                break
+            entry = result.get(child.id)
+            if(entry is None):
+                latest = None
+            else:
+                latest = max(latest, entry[0])
+                n_tasks += entry[1]
+        if(latest is not None):
+            result[node.id] = (latest, n_tasks)
+        parent = node.parent
+        if(parent is not None and parent.id in pending):
+            pending[parent.id] -= 1
+            if(pending[parent.id] == 0):
+                ready.append(parent)
+    return result
+
+
+def find_stale(nodes, cutoff, roots=None):
+    """Find the topmost stale subtrees of a forest.
+
+    :param nodes: A list of all the (linked) task nodes of a forest
+    :param cutoff: A (naive, UTC) datetime; subtrees last completed before it are stale
+    :param roots: An optional list of nodes; only their subtrees are searched (defaults to those of every top-level node)
+    :return: A list of (root node, latest completion, number of tasks) tuples
+    """
+    completed = completed_subtrees(nodes)
+    if(roots is None):
+        roots = [node for node in nodes if node.parent is None and not node.is_malformed()]
+    stale = []
+    stack = list(reversed(roots))
+    while(stack):
+        node = stack.pop()
+        entry = completed.get(node.id)
+        if(entry is not None and entry[0] < cutoff):
+            stale.append((node, entry[0], entry[1]))
+        else:
+            stack.extend(reversed(node.children))
+    return stale
+
+
+def plan(api, stale, action='archive'):
+    """Queue the commands which archive or delete stale subtrees.
+
+    Only the root of each subtree is given a command; its descendants go with it.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param stale: A list returned by `find_stale`
+    :param action: One of `actions`
+    :return: The number of commands queued
+    """
+    if(action not in actions):
+        pkg.log.error("Invalid prune action {%s}." % (action))
+    ids = [node.id for node, latest, n_tasks in stale]
+    if(action == 'delete'):
+        for i_start in range(0, len(ids), ids_per_command):
+            _commit.queue_command(api, 'item_delete', {'ids': ids[i_start:i_start + ids_per_command]})
+        return (len(ids) + ids_per_command - 1) // ids_per_command
+    for item_id in ids:
+        _commit.queue_command(api, 'item_archive', {'id': item_id})
+    return len(ids)
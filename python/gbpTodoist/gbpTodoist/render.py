@@ -0,0 +1,194 @@
+"""This module provides the rendering of project and task trees.
+
+Trees are walked iteratively (so that their depth is not limited by Python's
+recursion limit), once, with:
+
+   1) an optional maximum depth, below which children are counted but not
+      rendered;
+   2) optional collapsing of completed tasks, whose subtasks are then counted
+      but not rendered;
+   3) optional sorting of siblings by their `child_order`, using the order
+      held by each node (read from its data once, when the node was built).
+
+Output is written to any file object, through a buffer of lines, in one of the
+`formats`: indented text, a Markdown outline (with task-list check boxes) or a
+JSON document (a list of nested node objects), which is streamed out as the
+tree is walked.
+"""
+import os
+import sys
+import importlib
+import json
+import operator
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+
+#: The output formats supported
+formats = ('text', 'markdown', 'json')
+
+#: The bullets used for successive levels of tasks in text output
+bullets = ['-', '+', '#']
+
+#: Number of lines buffered before being written out
+buffer_lines = 4096
+
+_order = operator.attrgetter('order')
+_encode_string = json.encoder.encode_basestring_ascii
+
+# Walk event types
+_NODE = 0
+_END = 1
+
+
+def _children(node, project_tasks, sort):
+    # The child nodes of a node: for a project, its top-level tasks then its sub-projects
+    if(node.flags & _tree.FLAG_PROJECT):
+        children = []
+        if(project_tasks is not None):
+            children = [task for task in project_tasks(node) if task.parent is None and not task.is_malformed()]
+            if(sort):
+                children.sort(key=_order)
+        if(sort):
+            return children + sorted(node.children, key=_order)
+        return children + node.children
+    if(sort):
+        return sorted(node.children, key=_order)
+    return node.children
+
+
+def walk(roots, project_tasks=None, max_depth=None, collapse_completed=False, sort=True):
+    """Walk a forest of project and/or task nodes, depth first.
+
+    :param roots: A list of root nodes
+    :param project_tasks: A function returning the task nodes of a project node (if None, projects are rendered without their tasks)
+    :param max_depth: The depth of the deepest nodes to visit (roots have depth 0; None for no limit)
+    :param collapse_completed: Boolean flag; if True, the subtasks of completed tasks are not visited
+    :param sort: Boolean flag; if True, siblings are visited in order of `child_order`
+    :return: A generator of (_NODE, node, depth, task level, number of children hidden, number of children visited) and (_END, node, depth, ...) events
+    """
+    if(sort):
+        roots = sorted(roots, key=_order)
+    stack = [(_NODE, root, 0, 0) for root in reversed(roots)]
+    while(stack):
+        event, node, depth, task_level = stack.pop()
+        if(event == _END):
+            yield _END, node, depth, task_level, 0, 0
+            continue
+        children = _children(node, project_tasks, sort)
+        is_project = node.flags & _tree.FLAG_PROJECT
+        if((max_depth is not None and depth >= max_depth) or (collapse_completed and not is_project and not node.is_active())):
+            yield _NODE, node, depth, task_level, len(children), 0
+            yield _END, node, depth, task_level, 0, 0
+            continue
+        yield _NODE, node, depth, task_level, 0, len(children)
+        stack.append((_END, node, depth, task_level))
+        for child in reversed(children):
+            if(child.flags & _tree.FLAG_PROJECT):
+                stack.append((_NODE, child, depth + 1, 0))
+            else:
+                stack.append((_NODE, child, depth + 1, 0 if is_project else task_level + 1))
+
+
+class _buffered_writer(object):
+    """This class provides a line buffer for a file object."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+        if(len(self.lines) >= buffer_lines):
+            self.flush()
+
+    def flush(self):
+        if(self.lines):
+            self.fp.write(''.join(self.lines))
+            del self.lines[:]
+
+
+def _text(node, depth, task_level, n_hidden):
+    hidden = ' (+%d)' % (n_hidden) if n_hidden else ''
+    if(node.flags & _tree.FLAG_PROJECT):
+        return '%s%s%s\n' % ('   ' * depth, node.content, hidden)
+    done = '' if node.is_active() else ' [done]'
+    return '%s%s %s%s%s\n' % ('   ' * depth, bullets[task_level % len(bullets)], node.content, done, hidden)
+
+
+def _markdown(node, depth, task_level, n_hidden):
+    hidden = ' (+%d)' % (n_hidden) if n_hidden else ''
+    if(node.flags & _tree.FLAG_PROJECT):
+        return '%s- **%s**%s\n' % ('  ' * depth, node.content, hidden)
+    return '%s- [%s] %s%s\n' % ('  ' * depth, ' ' if node.is_active() else 'x', node.content, hidden)
+
+
+def _json_value(value):
+    if(value is None):
+        return 'null'
+    if(type(value) is int):
+        return '%d' % (value)
+    if(isinstance(value, (type(u''), str))):
+        return _encode_string(value)
+    return json.dumps(value)
+
+
+def render(fp, roots, format='text', project_tasks=None, max_depth=None, collapse_completed=False, sort=True):
+    """Render a forest of project and/or task nodes.
+
+    Nodes whose children are not rendered (because of `max_depth` or
+    `collapse_completed`) are marked with the number of those children.
+
+    :param fp: The file object to write to
+    :param roots: A list of root nodes
+    :param format: One of `formats`
+    :param project_tasks: A function returning the task nodes of a project node (see `walk`)
+    :param max_depth: The depth of the deepest nodes to render (see `walk`)
+    :param collapse_completed: Boolean flag; if True, the subtasks of completed tasks are not rendered
+    :param sort: Boolean flag; if True, siblings are rendered in order of `child_order`
+    :return: The number of nodes rendered
+    """
+    if(format not in formats):
+        pkg.log.error("Invalid tree format {%s}." % (format))
+    writer = _buffered_writer(fp)
+    events = walk(roots, project_tasks=project_tasks, max_depth=max_depth, collapse_completed=collapse_completed, sort=sort)
+    n_nodes = 0
+    if(format == 'json'):
+        # Whether a comma is needed before the next node at each depth
+        need_comma = [False]
+        writer.write('[')
+        for event, node, depth, task_level, n_hidden, n_children in events:
+            if(event == _END):
+                writer.write(']}')
+                continue
+            if(need_comma[depth]):
+                writer.write(',\n')
+            need_comma[depth] = True
+            if(len(need_comma) <= depth + 1):
+                need_comma.append(False)
+            else:
+                need_comma[depth + 1] = False
+            is_project = node.flags & _tree.FLAG_PROJECT
+            writer.write('{"id":%s,"type":"%s","content":%s,"completed":%s,"n_hidden":%d,"children":[' % (
+                _json_value(node.id), 'project' if is_project else 'task', _json_value(node.content),
+                'false' if is_project or node.is_active() else 'true', n_hidden))
+            n_nodes += 1
+        writer.write(']\n')
+    else:
+        line = _text if format == 'text' else _markdown
+        for event, node, depth, task_level, n_hidden, n_children in events:
+            if(event == _NODE):
+                writer.write(line(node, depth, task_level, n_hidden))
+                n_nodes += 1
+    writer.flush()
+    return n_nodes
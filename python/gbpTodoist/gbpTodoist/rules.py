@@ -0,0 +1,277 @@
+"""This module provides a declarative automation rule engine for a task tree.
+
+Rules are read from a .json file holding a list of rules of the form:
+
+   {"name": "Flag urgent work",
+    "when": {"project": "Work", "content_matches": "(?i)urgent"},
+    "then": {"add_label": 2171563, "set_priority": 4}}
+
+All the conditions of a rule's `when` clause must hold for its `then` clause to
+be applied.  The supported conditions are:
+
+   project              -- the task is in the named project
+   under_project        -- the task is in the named project, or one of its sub-projects
+   content              -- the task's content is exactly this string
+   content_prefix       -- the task's content starts with this string
+   content_matches      -- the task's content matches this regular expression
+   label                -- the task carries this label id
+   priority             -- the task has this priority
+   checked              -- the task is (true) or is not (false) checked
+   has_children         -- the task does (true) or does not (false) have subtasks
+   all_children_checked -- the task has subtasks and all of them are checked
+   min_depth, max_depth -- bounds on the task's depth (0 for top-level tasks)
+
+and the supported actions are `add_label`, `remove_label`, `set_priority`,
+`move_to_project` (by name) and `complete` (true).
+
+Rules are compiled once: each is filed under an index keyed by its most
+selective condition (exact content, project or label), so that evaluating a
+task only involves the rules which could possibly apply to it.  All rules are
+then evaluated together in a single (post-order) traversal of the tree and the
+resulting commands are added to the API's queue, to be committed together.
+"""
+import os
+import sys
+import importlib
+import json
+import re
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_commit = importlib.import_module(package_name + '.commit')
+
+#: The conditions understood in a rule's `when` clause
+conditions = ['project', 'under_project', 'content', 'content_prefix', 'content_matches', 'label', 'priority', 'checked',
+              'has_children', 'all_children_checked', 'min_depth', 'max_depth']
+
+#: The actions understood in a rule's `then` clause
+actions = ['add_label', 'remove_label', 'set_priority', 'move_to_project', 'complete']
+
+
+class _context(object):
+    """The per-task values available to predicates during a traversal."""
+
+    __slots__ = ('node', 'depth', 'n_children', 'n_children_checked')
+
+    def __init__(self, node, depth, n_children, n_children_checked):
+        self.node = node
+        self.depth = depth
+        self.n_children = n_children
+        self.n_children_checked = n_children_checked
+
+
+class rule(object):
+    """This class provides a compiled rule."""
+
+    def __init__(self, spec, project_ids_by_name, project_children):
+        """Compile a rule.
+
+        :param spec: The rule's dictionary (see the module documentation)
+        :param project_ids_by_name: Dictionary mapping project names to project ids
+        :param project_children: Dictionary mapping project ids to the ids of their sub-projects
+        """
+        self.name = spec.get('name', 'unnamed rule')
+        when = spec.get('when', {})
+        self.then = spec.get('then', {})
+        for key in when:
+            if(key not in conditions):
+                pkg.log.error("Unknown condition {%s} in rule {%s}." % (key, self.name))
+        for key in self.then:
+            if(key not in actions):
+                pkg.log.error("Unknown action {%s} in rule {%s}." % (key, self.name))
+        if('move_to_project' in self.then):
+            if(self.then['move_to_project'] not in project_ids_by_name):
+                pkg.log.error("Unknown project {%s} in rule {%s}." % (self.then['move_to_project'], self.name))
+            self.then = dict(self.then, move_to_project=project_ids_by_name[self.then['move_to_project']])
+
+        def _project_id(name):
+            if(name not in project_ids_by_name):
+                pkg.log.error("Unknown project {%s} in rule {%s}." % (name, self.name))
+            return project_ids_by_name[name]
+
+        # Choose the index this rule is filed under; its condition need not be re-checked
+        self.index_key = None
+        if('content' in when):
+            self.index_key = ('content', when['content'])
+        elif('project' in when):
+            self.index_key = ('project', _project_id(when['project']))
+        elif('label' in when):
+            self.index_key = ('label', when['label'])
+
+        # Compile the remaining conditions into a list of predicates
+        self.predicates = []
+        for key, value in when.items():
+            if(self.index_key is not None and key == self.index_key[0]):
+                continue
+            if(key == 'project'):
+                self.predicates.append(lambda c, v=_project_id(value): c.node.project_id == v)
+            elif(key == 'under_project'):
+                project_ids = set()
+                stack = [_project_id(value)]
+                while(stack):
+                    project_id = stack.pop()
+                    project_ids.add(project_id)
+                    stack.extend(project_children.get(project_id, []))
+                self.predicates.append(lambda c, v=project_ids: c.node.project_id in v)
+            elif(key == 'content'):
+                self.predicates.append(lambda c, v=value: c.node.content == v)
+            elif(key == 'content_prefix'):
+                self.predicates.append(lambda c, v=value: (c.node.content or '').startswith(v))
+            elif(key == 'content_matches'):
+                self.predicates.append(lambda c, v=re.compile(value): v.search(c.node.content or '') is not None)
+            elif(key == 'label'):
+                self.predicates.append(lambda c, v=value: v in (c.node.data.get('labels') or []))
+            elif(key == 'priority'):
+                self.predicates.append(lambda c, v=value: c.node.data.get('priority') == v)
+            elif(key == 'checked'):
+                self.predicates.append(lambda c, v=bool(value): (not c.node.is_active()) == v)
+            elif(key == 'has_children'):
+                self.predicates.append(lambda c, v=bool(value): (c.n_children > 0) == v)
+            elif(key == 'all_children_checked'):
+                self.predicates.append(lambda c, v=bool(value): (c.n_children > 0 and c.n_children_checked == c.n_children) == v)
+            elif(key == 'min_depth'):
+                self.predicates.append(lambda c, v=value: c.depth >= v)
+            elif(key == 'max_depth'):
+                self.predicates.append(lambda c, v=value: c.depth <= v)
+
+    def matches(self, context):
+        """Check if the rule applies to a task.
+
+        :param context: The task's traversal context
+        :return: Boolean
+        """
+        for predicate in self.predicates:
+            if(not predicate(context)):
+                return False
+        return True
+
+
+class rule_set(object):
+    """This class provides a set of compiled rules, indexed for evaluation."""
+
+    def __init__(self, specs, projects):
+        """Compile a list of rules.
+
+        :param specs: A list of rule dictionaries
+        :param projects: A list of the account's project nodes
+        """
+        project_ids_by_name = {}
+        project_children = {}
+        for project in projects:
+            project_ids_by_name.setdefault(project.content, project.id)
+            if(project.parent_id is not None):
+                project_children.setdefault(project.parent_id, []).append(project.id)
+
+        self.rules = [rule(spec, project_ids_by_name, project_children) for spec in specs]
+        self.generic = []
+        self.by_key = {}
+        for rule_i in self.rules:
+            if(rule_i.index_key is None):
+                self.generic.append(rule_i)
+            else:
+                self.by_key.setdefault(rule_i.index_key, []).append(rule_i)
+
+    @classmethod
+    def load(cls, path, projects):
+        """Read and compile a rules file.
+
+        :param path: Path to a .json rules file
+        :param projects: A list of the account's project nodes
+        :return: A `rule_set` instance
+        """
+        with open(path, 'r') as fp_in:
+            specs = json.load(fp_in)
+        return cls(specs, projects)
+
+    def candidates(self, node):
+        """Return the rules which could apply to a task.
+
+        :param node: A task node
+        :return: A list of rules
+        """
+        result = list(self.generic)
+        result.extend(self.by_key.get(('content', node.content), ()))
+        result.extend(self.by_key.get(('project', node.project_id), ()))
+        for label in node.data.get('labels') or ():
+            result.extend(self.by_key.get(('label', label), ()))
+        return result
+
+    def evaluate(self, roots):
+        """Evaluate every rule against every task of a forest, in one traversal.
+
+        :param roots: The root nodes of the forest
+        :return: A list of (node, list of matching rules) tuples, in post-order
+        """
+        matches = []
+        for root in roots:
+            stack = [(root, 0, False)]
+            while(stack):
+                node, depth, expanded = stack.pop()
+                if(not expanded):
+                    stack.append((node, depth, True))
+                    for child in reversed(node.children):
+                        stack.append((child, depth + 1, False))
+                    continue
+                n_children_checked = 0
+                for child in node.children:
+                    if(not child.is_active()):
+                        n_children_checked += 1
+                context = _context(node, depth, len(node.children), n_children_checked)
+                matched = [rule_i for rule_i in self.candidates(node) if rule_i.matches(context)]
+                if(matched):
+                    matches.append((node, matched))
+        return matches
+
+
+def queue_actions(api, matches):
+    """Queue the commands for the actions of a set of matched rules.
+
+    The updates to each task are merged into a single command.
+
+    :param api: A `todoist.TodoistAPI` instance (the commands are added to its queue)
+    :param matches: A list of (node, list of matching rules) tuples, as returned by `rule_set.evaluate`
+    :return: A list of (node, rule name, description of the action) tuples
+    """
+    log = []
+    for node, matched in matches:
+        labels = list(node.data.get('labels') or [])
+        labels_start = list(labels)
+        update = {}
+        move_to = None
+        complete = False
+        for rule_i in matched:
+            then = rule_i.then
+            if('add_label' in then and then['add_label'] not in labels):
+                labels.append(then['add_label'])
+                log.append((node, rule_i.name, 'add label %s' % (then['add_label'])))
+            if('remove_label' in then and then['remove_label'] in labels):
+                labels.remove(then['remove_label'])
+                log.append((node, rule_i.name, 'remove label %s' % (then['remove_label'])))
+            if('set_priority' in then and node.data.get('priority') != then['set_priority']):
+                update['priority'] = then['set_priority']
+                log.append((node, rule_i.name, 'set priority %s' % (then['set_priority'])))
+            if('move_to_project' in then and node.project_id != then['move_to_project']):
+                move_to = then['move_to_project']
+                log.append((node, rule_i.name, 'move to project %s' % (move_to)))
+            if(then.get('complete') and node.is_active()):
+                complete = True
+                log.append((node, rule_i.name, 'complete'))
+        if(labels != labels_start):
+            update['labels'] = labels
+        if(update):
+            update['id'] = node.id
+            _commit.queue_command(api, 'item_update', update)
+        if(move_to is not None):
+            _commit.queue_command(api, 'item_move', {'id': node.id, 'project_id': move_to})
+        if(complete):
+            _commit.queue_command(api, 'item_close', {'id': node.id})
+    return log
@@ -2,6 +2,9 @@ from __future__ import print_function
 import os
 import sys
 import importlib
+import time
+import datetime
+import json
 import click
 
 import todoist
@@ -18,145 +21,320 @@ sys.path.insert(0, package_parent_dir)
 # Import needed internal modules
 pkg = importlib.import_module(package_name)
 prj = importlib.import_module(package_name + '._internal.project')
+profile = importlib.import_module(package_name + '._internal.profile')
+populate = importlib.import_module(package_name + '.populate')
+_tree = importlib.import_module(package_name + '.tree')
+_store = importlib.import_module(package_name + '.store')
+_commit = importlib.import_module(package_name + '.commit')
+integrity = importlib.import_module(package_name + '.integrity')
+rules = importlib.import_module(package_name + '.rules')
+bulk = importlib.import_module(package_name + '.bulk')
+search = importlib.import_module(package_name + '.search')
+_agenda = importlib.import_module(package_name + '.agenda')
+_stats = importlib.import_module(package_name + '.stats')
+cassette = importlib.import_module(package_name + '.cassette')
+_archive = importlib.import_module(package_name + '.archive')
+stream = importlib.import_module(package_name + '.stream')
+coordinate = importlib.import_module(package_name + '.coordinate')
+render = importlib.import_module(package_name + '.render')
+_prune = importlib.import_module(package_name + '.prune')
+if sys.version_info >= (3, 5):
+    fetch = importlib.import_module(package_name + '.fetch')
+else:
+    fetch = None
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
-bullet_list = ['-','#','+']
+# Subcommands which do not change the account (and so do not hold its lock once synced)
+read_only_commands = ['search','agenda','stats','report','archive','tree']
+
+def _parse_id(id_string):
+    try:
+        return int(id_string)
+    except ValueError:
+        return id_string
 
 class task_tree(object):
 
-    def __init__(self,api):
+    def __init__(self,api,lazy=False,store=None):
         self.api = api
-        self.projects = api.state['projects']
-        self.tasks = api.state['items']
+        self.auxiliary = {}
+        self._due_index = None
+
+        # Build project tree (from the local store, if one is given)
+        if store:
+            self.projects, self.project_index, _ = _tree.build_tree(store.projects(),is_project=True)
+        else:
+            self.projects, self.project_index, _ = _tree.build_tree(api.state['projects'],is_project=True)
 
-        # Build project tree
-        self.build_tree(self.projects)
+        # In lazy mode, task nodes are only built for the projects that get
+        # visited (see project_tasks()), so we are done here.  Trees hydrated
+        # from a store are always lazy.
+        self._lazy = None
+        if store or lazy:
+            if store:
+                self._lazy = _store.store_forest(store)
+            else:
+                self._lazy = _tree.lazy_forest(pkg.log.progress(api.state['items'],label='Indexing tasks',unit='tasks'))
+            self.tasks = None
+            self.task_index = self._lazy.index
+            return
 
         # Build task tree
-        bad_list=self.build_tree(self.tasks)
-
-        ###########################################
-        #if bad_list:
-        #    pkg.log.open('Identified the following bad tasks:')
-        #    bad_ids_list = []
-        #    for bad_item in bad_list:
-        #        pkg.log.comment('   '+str(bad_item.data))
-        #        bad_ids_list.append(bad_item.data['kwargs']['id'])
-        #    try:
-        #        pkg.log.comment('Deleting...')
-        #        task_manager = todoist.managers.items.ItemsManager(api)
-        #        task_manager.delete(bad_ids_list)
-        #        api.commit()
-        #    except Exception as e:
-        #        pkg.log.comment('failed with the following return: '+str(e))
-        #        raise
-        #    else:
-        #        pkg.log.comment('Done.')
-        #    pkg.log.close(None)
-        ###########################################
+        self.tasks, self.task_index, _ = _tree.build_tree(pkg.log.progress(api.state['items'],label='Building task tree',unit='tasks'))
 
         # Map tasks to their projects
-        for project in self.projects:
-            project.tasks = []
         for task in self.tasks:
-            task_id = task.data['id']
-            project_id = task.data['project_id']
-            for candidate in self.projects:
-                candidate_id = candidate.data['id']
-                if project_id==candidate_id:
-                    candidate.tasks.append(task)
-                    break
-
-    def _print_children_recursive(self,item,level,bullet_level,key='name'):
-        if(key=='name'):
-            pkg.log.comment(level*'   '+item.data[key])
-        else:
-            pkg.log.comment(level*'   '+bullet_list[-bullet_level]+' '+item.data[key])
-        if hasattr(item,'tasks'):
-            self._print_tree_recursive(item.tasks,level+1,0,key='content')
-        for child in item.children:
-            self._print_children_recursive(child,level+1,bullet_level+1,key=key)
-    
-    def _print_tree_recursive(self,items,level=0,bullet_level=0,key='name'):
-        for item in items:
-            if not item.parent:
-                self._print_children_recursive(item,level,bullet_level,key=key)
-    
-    @staticmethod
-    def build_tree(items):
-        bad_list = []
-        for item in items:
-            item.children = [] 
-            item.parent = None
-        for item in items:
-            if 'kwargs' in item.data:
-                bad_list.append(item)
-            else:
-                item_id = item.data['id']
-                parent_id = item.data['parent_id']
-                for candidate in items:
-                    candidate_id = candidate.data['id']
-                    if(candidate_id!=item_id):
-                        if(candidate_id==parent_id):
-                            item.parent = candidate
-                            candidate.children.append(item)
-                            break
-        return bad_list
-
-    def _populate_template_task_recursive(self,task_manager,subtask_add,task_target):
-        pkg.log.open(subtask_add.data['content']+' -> '+task_target.data['content']+' ... ')
-    
-        # Check if subtask is already there
-        parent_add = None
-        for child in task_target.children:
-            if subtask_add.data['content']==child.data['content'] and not (child.data['checked'] or child.data['is_archived']):
-                parent_add = child 
+            if not task.is_malformed():
+                project = self.project_index.get(task.project_id)
+                if project:
+                    project.tasks.append(task)
+
+    def project_tasks(self,project):
+        if self._lazy is not None and not self._lazy.is_built(project.id):
+            project.tasks = self._lazy.tasks_of(project.id)
+        return project.tasks
+
+    def _commit_plan(self,task_manager,commands):
+        # Resolve plan keys to the tasks created for them as we go
+        created = {}
+        for command in commands:
+            pkg.log.open(command['label'])
+            if command['action']=='present':
                 pkg.log.close("not added (already present).")
-    
-        # Create new task
-        if not parent_add:
-            key_list = ['date_completed', 'all_day','in_history','priority','labels', 'date_lang', 'day_order', 'is_archived','responsible_uid','user_id','checked','date_string','due_date_utc', 'assigned_by_uid','collapsed','is_deleted']
-            kwargs_item = {}
-            for key in key_list:
-                if key in subtask_add.data:
-                    kwargs_item[key]=subtask_add.data[key]
-            kwargs_item['item_order']=task_target.data['item_order']
-            kwargs_item['indent']=task_target.data['indent']+1
-            kwargs_item['parent_id']=task_target.data['id']
-            try:
-                parent_add = task_manager.add(subtask_add.data['content'],task_target.data['project_id'],**kwargs_item)
-            except Exception as e:
-                pkg.log.close('failed with the following return: '+str(e))
-                raise
-            task_target.children.append(parent_add)
-            parent_add.parent=task_target
-            parent_add.children=[]
+                continue
+            if command['action']=='covered':
+                pkg.log.close("skipped (already fully populated).")
+                continue
+            parent_type, parent_ref = command['parent']
+            if parent_type=='key':
+                parent_ref = created[parent_ref]
+            kwargs_item = dict(command['args'])
+            kwargs_item['parent_id']=parent_ref
+            if task_manager:
+                try:
+                    task_added = task_manager.add(command['content'],command['project_id'],**kwargs_item)
+                except Exception as e:
+                    pkg.log.close('failed with the following return: '+str(e))
+                    raise
+                created[command['key'][1]] = task_added.data['id']
+            else:
+                created[command['key'][1]] = command['key'][1]
             pkg.log.close("added.")
-    
-        # Recurse through subtasks
-        for child in subtask_add.children:
-            self._populate_template_task_recursive(task_manager,child,parent_add)
-    
+
     def _find_template_tasks(self):
         template_list = []
         for project in self.projects:
             if project.data['name']=='Task Templates':
                 parent = project.parent
                 if parent:
-                    for task_parent in parent.tasks:
-                        for task_template in project.tasks:
+                    for task_parent in self.project_tasks(parent):
+                        for task_template in self.project_tasks(project):
                             if task_template.data['content']==task_parent.data['content']:
                                 template_list.append({'content':task_template.data['content'],'project_template':project,'project_target':parent,'task_template':task_template,'task_target':task_parent})
     
         return template_list
 
-    def print_tree(self):
-        self._print_tree_recursive(self.projects)
+    def print_tree(self,fp=None,root=None,format='text',max_depth=None,collapse_completed=False,sort=True):
+        # Render the whole account (top-level projects) or the subtree of a given node
+        if fp is None:
+            fp = sys.stdout
+        if root is None:
+            roots = [project for project in self.projects if not project.parent]
+        else:
+            roots = [root]
+        return render.render(fp,roots,format=format,project_tasks=self.project_tasks,max_depth=max_depth,
+                             collapse_completed=collapse_completed,sort=sort)
+
+    def all_tasks(self):
+        if self._lazy is not None:
+            return self._lazy.all_nodes()
+        return self.tasks
+
+    def check_integrity(self,cleanup=False,debug=False,journal=None,offline=False):
+        # Returns the number of cleanup commands sent to the server
+        pkg.log.open('Checking tree integrity...')
+        report = integrity.check(self.all_tasks(),project_ids=set(self.project_index))
+        n_problems = integrity.n_problems(report)
+        n_committed = 0
+        if not n_problems:
+            pkg.log.close('Done (no problems found).')
+            return n_committed
+        integrity.log_report(report)
+        if cleanup:
+            n_commands = integrity.plan_cleanup(self.api,report)
+            pkg.log.comment('%d cleanup commands planned.'%(n_commands))
+            if debug:
+                pkg.log.comment('*** Debug mode is ON ***')
+                del self.api.queue[:]
+            else:
+                try:
+                    _commit.commit(self.api,journal=journal,offline=offline)
+                except Exception as e:
+                    pkg.log.close('failed with the following return: '+str(e))
+                    raise
+                if not offline:
+                    n_committed = n_commands
+        pkg.log.close('Done (%d problems found).'%(n_problems))
+        return n_committed
+
+    def apply_rules(self,path_rules):
+        # Queued commands are committed along with those of the populate step
+        pkg.log.open('Applying rules from {%s}...'%(path_rules))
+        rule_set = rules.rule_set.load(path_rules,self.projects)
+        roots = [task for task in self.all_tasks() if not task.parent and not task.is_malformed()]
+        actions = rules.queue_actions(self.api,rule_set.evaluate(roots))
+        for node, rule_name, action in actions:
+            pkg.log.comment(rule_name+': '+node.content+' ... '+action)
+        pkg.log.close('Done (%d actions queued from %d rules).'%(len(actions),len(rule_set.rules)))
 
-    def populate_template_subtasks(self,debug=False):
+    def find_project(self,name):
+        for project in self.projects:
+            if project.content==name:
+                return project
+        raise click.UsageError('Project {%s} not found.'%(name))
+
+    def find_task(self,task_id):
+        # Ids are given as strings on the command line
+        for candidate in (task_id,_parse_id(task_id)):
+            task = self.get_task(candidate)
+            if task:
+                return task
+        raise click.UsageError('Task {%s} not found.'%(task_id))
+
+    def commit(self,debug=False,journal=None,offline=False):
+        n_commands = len(self.api.queue)
+        if debug:
+            pkg.log.comment('*** Debug mode is ON *** (%d commands not committed)'%(n_commands))
+            del self.api.queue[:]
+            return
+        profile.phase('commit')
+        pkg.log.open('Committing %d commands...'%(n_commands))
+        try:
+            _commit.commit(self.api,journal=journal,offline=offline)
+        except Exception as e:
+            pkg.log.close('failed with the following return: '+str(e))
+            raise
+        pkg.log.close('Done.')
+
+    def search_index(self,path_index=None,response=None,sync_token_start=None):
+        # Reuse the on-disk index if it is current, or can be brought up-to-date
+        # with the incremental response of this run's sync; rebuild it otherwise
+        index = None
+        if path_index:
+            index = search.search_index.load(path_index)
+        if index is not None and index.sync_token==self.api.sync_token:
+            return index
+        t_start = time.time()
+        if index is not None and response and not response.get('full_sync') and index.sync_token==sync_token_start:
+            pkg.log.open('Updating search index...')
+            n_docs = index.apply_sync(response)
+        else:
+            pkg.log.open('Building search index...')
+            index = search.search_index()
+            n_docs = index.update(projects=self.api.state['projects'],items=self.api.state['items'],sync_token=self.api.sync_token)
+        if path_index:
+            index.save(path_index)
+        pkg.log.close('Done (%d documents indexed; %.3f seconds).'%(n_docs,time.time()-t_start))
+        return index
+
+    def fetch_auxiliary(self,resource,nodes,concurrency=8,rate=10.,timeout=10.):
+        # Results are filed under self.auxiliary[resource][item id] as they arrive
+        if fetch is None:
+            raise click.UsageError('Fetching %s needs Python 3.5 or later.'%(resource))
+        results = self.auxiliary.setdefault(resource,{})
+        item_ids = []
+        item_ids_seen = set()
+        for node in nodes:
+            if node.id not in results and node.id not in item_ids_seen:
+                item_ids.append(node.id)
+                item_ids_seen.add(node.id)
+        pkg.log.open('Fetching %s for %d tasks...'%(resource,len(item_ids)))
+        t_start = time.time()
+        bar = pkg.log.progress(count=len(item_ids),label='Fetching',unit='requests')
+        def on_result(item_id,result,error):
+            bar.update()
+            if error is None:
+                results[item_id] = result
+            else:
+                pkg.log.comment('Task %s: %s'%(item_id,error))
+        with bar:
+            n_ok, n_failed = fetch.fetcher(self.api,concurrency=concurrency,rate=rate,timeout=timeout).fetch_resource(resource,item_ids,on_result)
+        pkg.log.close('Done (%d fetched, %d failed; %.3f seconds).'%(n_ok,n_failed,time.time()-t_start))
+        return results
+
+    def template_coverage(self):
+        # A target is fully populated if planning it would add nothing
+        coverage = []
+        for item in self._find_template_tasks():
+            commands = populate.plan_pairs([populate.pair_input(item)])
+            coverage.append((item['project_target'].id,not any(command['action']=='add' for command in commands)))
+        return coverage
+
+    def stats(self,coverage=False):
+        pkg.log.open('Computing account statistics...')
+        t_start = time.time()
+        arrays = _stats.build_arrays(self.api.state['projects'],self.api.state['items'])
+        # Template coverage replans every target, so it is only computed on request
+        template_targets = self.template_coverage() if coverage else None
+        report = _stats.compute(arrays,template_targets=template_targets)
+        pkg.log.close('Done (%d items; %.3f seconds).'%(report['totals']['n_items'],time.time()-t_start))
+        return report
+
+    def project_subtree_ids(self,project):
+        project_ids = set()
+        stack = [project]
+        while stack:
+            project_i = stack.pop()
+            if project_i.id not in project_ids:
+                project_ids.add(project_i.id)
+                stack.extend(project_i.children)
+        return project_ids
+
+    def due_index(self,t_start,t_stop):
+        # Built on first use and reused for every query inside the window its
+        # recurring items were expanded over
+        index = self._due_index
+        if index is None or t_start<index.window_start or t_stop>index.window_stop:
+            pkg.log.open('Building due-date index...')
+            index = self._due_index = _agenda.due_index(self.api.state['items'],window_start=t_start,window_stop=t_stop)
+            pkg.log.close('Done (%d entries).'%(len(index)))
+        return index
+
+    def agenda(self,t_start,t_stop,project_names=()):
+        project_ids = None
+        if project_names:
+            project_ids = set()
+            for project_name in project_names:
+                project_ids |= self.project_subtree_ids(self.find_project(project_name))
+        entries = self.due_index(t_start,t_stop).query(t_start,t_stop,project_ids=project_ids)
+        day = None
+        for due, data in entries:
+            if due.date()!=day:
+                if day is not None:
+                    pkg.log.close(None)
+                day = due.date()
+                pkg.log.open(due.strftime('%A %Y-%m-%d:'))
+            time_string = due.strftime('%H:%M') if due.time()!=datetime.time() else '     '
+            project = self.project_index.get(data.get('project_id'))
+            project_name = project.content if project else '?'
+            pkg.log.comment('%s %s [%s]'%(time_string,data['content'],project_name))
+        if day is not None:
+            pkg.log.close(None)
+        return entries
+
+    def get_task(self,task_id):
+        if self._lazy is not None:
+            return self._lazy.get(task_id)
+        return self.task_index.get(task_id)
+
+    def populate_template_subtasks(self,debug=False,n_processes=1,journal=None,offline=False,changes=None):
         pkg.log.open('Populate template subtasks...')
         template_list = self._find_template_tasks()
+        if changes is not None:
+            n_pairs = len(template_list)
+            template_list = populate.select_affected(template_list,changes.get('items',[]),changes.get('projects',[]),self.get_task)
+            pkg.log.comment('Re-evaluating %d of %d template targets affected by the last sync.'%(len(template_list),n_pairs))
         if not debug:
             try:
                 task_manager = todoist.managers.items.ItemsManager(self.api)
@@ -166,36 +344,512 @@ class task_tree(object):
         else:
             task_manager = None
             pkg.log.comment('*** Debug mode is ON ***')
-        for item in template_list:
-            for subtask_template in item['task_template'].children:
-                self._populate_template_task_recursive(task_manager,subtask_template,item['task_target'])
+        if self._lazy is not None:
+            pkg.log.comment('Task nodes built for %d of %d projects.'%(self._lazy.n_built(),len(self.projects)))
+        commands = populate.plan(template_list,n_processes=n_processes)
+        self._commit_plan(task_manager,commands)
         if not debug:
+            profile.phase('commit')
             try:
-                self.api.commit()
+                _commit.commit(self.api,journal=journal,offline=offline)
             except Exception as e:
                 pkg.log.close('failed with the following return: '+str(e))
                 raise
         pkg.log.close('Done.')
 
-@click.command(context_settings=CONTEXT_SETTINGS)
+class session(object):
+
+    def __init__(self,ctx,API_key=None,debug=False,lazy=False,path_store=None,path_journal=None,offline=False,
+                 path_record=None,path_replay=None,anonymize=False,latency_scale=1.,streaming=False,
+                 lock=True,lock_timeout=None,reuse_state=60.):
+        # Nothing is set-up here, so that commands which fail to parse (or
+        # are only asked for their help) do not lock, replay or sync anything
+        self.ctx = ctx
+        self.command = ctx.invoked_subcommand
+        self.API_key = API_key
+        self.debug = debug
+        self.lazy = lazy
+        self.path_store = path_store
+        self.path_journal = path_journal
+        self.offline = offline
+        self.path_record = path_record
+        self.path_replay = path_replay
+        self.anonymize = anonymize
+        self.latency_scale = latency_scale
+        self.streaming = streaming
+        self.lock = lock
+        self.lock_timeout = lock_timeout
+        self.reuse_state = reuse_state
+        self.api = None
+        self.coordinator = None
+        self.journal = None
+        self.response = None
+        self.sync_token_start = None
+        self.tree = None
+
+    def open(self):
+        # Set-up the session (once) and return it
+        if self.tree is not None:
+            return self
+        self._connect()
+        self._lock_account()
+        self._open_journal()
+        self._sync()
+        store = self._update_store()
+
+        # Build trees, etc.
+        profile.phase('tree')
+        self.tree = task_tree(self.api,lazy=self.lazy,store=store)
+        if self.command is not None:
+            if self.coordinator and self.command in read_only_commands:
+                self.coordinator.release()
+            profile.phase(self.command)
+        return self
+
+    def rebuild_tree(self):
+        # Rebuild the trees after a commit has changed the API's state (the
+        # store is not updated by commits, so it is not used here)
+        profile.phase('tree')
+        self.tree = task_tree(self.api,lazy=self.lazy)
+        return self.tree
+
+    def _connect(self):
+        # Record or replay the API's traffic, if asked to.  Replayed sessions start
+        # from an empty state, so that they do not depend on the local cache.
+        if self.path_record:
+            api_session = cassette.recording_session(self.path_record,anonymize=self.anonymize)
+            self.api = todoist.TodoistAPI(self.API_key,session=api_session)
+        elif self.path_replay:
+            api_session = cassette.replay_session(self.path_replay,latency_scale=self.latency_scale)
+            self.api = todoist.TodoistAPI(self.API_key or 'replay',session=api_session,cache=None)
+        else:
+            api_session = None
+            self.api = todoist.TodoistAPI(self.API_key)
+        if api_session is not None:
+            self.ctx.call_on_close(api_session.close)
+
+    def _lock_account(self):
+        # Wait for any other run on this account to finish
+        if self.lock:
+            self.coordinator = coordinate.account_coordinator(self.api,timeout=self.lock_timeout,max_age=self.reuse_state)
+            self.coordinator.acquire()
+            self.ctx.call_on_close(self.coordinator.release)
+
+    def _open_journal(self):
+        # Open the command journal and flush anything left over from an earlier run
+        if self.path_journal:
+            self.journal = _commit.command_journal(self.path_journal)
+            if not (self.offline or self.debug):
+                _commit.replay(self.api,self.journal)
+
+    def _sync(self):
+        # Fetch user's data from server (in offline mode, the API's local cache is used)
+        profile.phase('sync')
+        api = self.api
+        coordinator = self.coordinator
+        self.sync_token_start = api.sync_token
+        t_sync = time.time()
+        if self.offline:
+            self.response = {}
+        elif coordinator and coordinator.reuse_state():
+            self.response = {}
+            self.sync_token_start = api.sync_token
+        elif self.streaming:
+            with pkg.log.progress(label='Syncing',unit='objects') as bar:
+                self.response = stream.sync(api,on_object=lambda datatype,data: bar.update())
+        else:
+            self.response = api.sync()
+        if coordinator and self.response:
+            coordinator.mark_synced(t_sync)
+
+    def _update_store(self):
+        # Update the local store with the (possibly incremental) sync response
+        # and return it, if it holds the synced state (for trees to be hydrated from)
+        if not self.path_store:
+            return None
+        store = _store.state_store(self.path_store)
+        self.ctx.call_on_close(store.close)
+        if self.response:
+            pkg.log.open('Updating local store {%s}...'%(self.path_store))
+            n_projects, n_items = store.apply_sync(self.response)
+            pkg.log.close('Done (%d projects, %d items).'%(n_projects,n_items))
+        if store.get_meta('sync_token')!=self.api.sync_token:
+            pkg.log.comment('Local store {%s} is not up-to-date with the synced state; it will not be used.'%(self.path_store))
+            return None
+        return store
+
+def _set_up_log(ctx,log_format,path_log):
+    fp_log = None
+    if path_log:
+        fp_log = open(path_log,'a')
+    pkg.log.set_format(log_format,fp_out=fp_log)
+    def close_log():
+        pkg.log.flush()
+        if fp_log:
+            pkg.log.set_fp(None)
+            fp_log.close()
+    ctx.call_on_close(close_log)
+
+def populate_account(session,n_processes=1,delta=False,check=False,cleanup=False,path_rules=None):
+    tree = session.open().tree
+
+    # Check (and optionally repair) the tree
+    if check or cleanup:
+        profile.phase('check')
+        if tree.check_integrity(cleanup=cleanup,debug=session.debug,journal=session.journal,offline=session.offline):
+            tree = session.rebuild_tree()
+
+    # Apply automation rules
+    if path_rules:
+        profile.phase('rules')
+        tree.apply_rules(path_rules)
+
+    # Find and populate template tasks (and commit everything queued so far)
+    profile.phase('populate')
+    changes = None
+    if delta and session.response and not session.response.get('full_sync'):
+        changes = session.response
+    tree.populate_template_subtasks(debug=session.debug,n_processes=n_processes,journal=session.journal,offline=session.offline,changes=changes)
+
+@click.group(context_settings=CONTEXT_SETTINGS, invoke_without_command=True)
 @click.option('-k', '--key', 'API_key', help="User's Todoist API Key", type=str, default=None)
 @click.option('-d','--debug/--no-debug', default=False, show_default=True, help='Debug mode? (no writing; dry-run only)')
-def gbpTodoist(API_key,debug):
+@click.option('-j','--processes', 'n_processes', default=1, show_default=True, help='Number of processes to plan template population with (sharded by top-level project)')
+@click.option('--lazy/--no-lazy', default=False, show_default=True, help='Only build task trees for the projects an operation visits?')
+@click.option('-s','--store', 'path_store', help="Path to a local SQLite store to update with the synced state (and to build task trees from)", type=click.Path(dir_okay=False), default=None)
+@click.option('--journal', 'path_journal', help="Path to a journal of commands, used to resume interrupted commits", type=click.Path(dir_okay=False), default=None)
+@click.option('--offline/--online', default=False, show_default=True, help='Offline mode? (use the cached state; journal commands for a later run)')
+@click.option('--delta/--no-delta', default=False, show_default=True, help='Only re-evaluate the template targets affected by an incremental sync?')
+@click.option('--check/--no-check', default=False, show_default=True, help='Check the integrity of the task tree?')
+@click.option('--cleanup/--no-cleanup', default=False, show_default=True, help='Delete malformed items and re-parent orphaned ones? (implies --check)')
+@click.option('-r','--rules', 'path_rules', help="Path to a .json file of automation rules to apply", type=click.Path(exists=True, dir_okay=False), default=None)
+@click.option('--record', 'path_record', help="Path to a cassette file to record the session's API traffic to", type=click.Path(dir_okay=False), default=None)
+@click.option('--replay', 'path_replay', help="Path to a cassette file to replay API traffic from (no network access)", type=click.Path(exists=True, dir_okay=False), default=None)
+@click.option('--anonymize/--no-anonymize', default=False, show_default=True, help='Anonymize names and contents when recording?')
+@click.option('--latency-scale', 'latency_scale', default=1., show_default=True, help='Factor applied to recorded latencies when replaying (0 for none)')
+@click.option('--stream/--no-stream', 'streaming', default=False, show_default=True, help='Parse the sync response incrementally? (bounded memory, for large accounts)')
+@click.option('--lock/--no-lock', default=True, show_default=True, help='Lock the account against other runs while syncing, planning and committing?')
+@click.option('--lock-timeout', 'lock_timeout', type=float, default=None, help='Number of seconds to wait for another run to release the account (default: no limit)')
+@click.option('--reuse-state', 'reuse_state', default=60., show_default=True, help="Reuse a state synced by another run up to this many seconds ago (0 to always sync)")
+@click.option('--log-format', 'log_format', type=click.Choice(['text','json']), default='text', show_default=True, help='Format of the log (json: one structured event per line)')
+@click.option('--log-file', 'path_log', help="Path to a file to append the log to (instead of stderr)", type=click.Path(dir_okay=False), default=None)
+@profile.profile_option
+@click.pass_context
+def gbpTodoist(ctx,API_key,debug,n_processes,lazy,path_store,path_journal,offline,delta,check,cleanup,path_rules,path_record,path_replay,anonymize,latency_scale,streaming,lock,lock_timeout,reuse_state,log_format,path_log):
     """Perform Todoist processing.
 
+    With no command given, the account's template tasks are populated (after
+    any requested integrity check and rules).  Otherwise, the given command is
+    run on the synced account.
+
+    :return: None
+    """
+    _set_up_log(ctx,log_format,path_log)
+    if path_record and path_replay:
+        raise click.UsageError('--record and --replay can not be used together.')
+    if offline and not path_journal:
+        raise click.UsageError('Offline mode requires a journal (--journal).')
+
+    # The session is only set-up once a command needs it (see session.open())
+    ctx.obj = session(ctx,API_key=API_key,debug=debug,lazy=lazy,path_store=path_store,path_journal=path_journal,offline=offline,
+                      path_record=path_record,path_replay=path_replay,anonymize=anonymize,latency_scale=latency_scale,
+                      streaming=streaming,lock=lock,lock_timeout=lock_timeout,reuse_state=reuse_state)
+    if ctx.invoked_subcommand is None:
+        populate_account(ctx.obj,n_processes=n_processes,delta=delta,check=check,cleanup=cleanup,path_rules=path_rules)
+
+@gbpTodoist.command(context_settings=CONTEXT_SETTINGS)
+@click.option('-t','--task', 'task_ids', multiple=True, help='Id of a task whose subtree is to be copied (may be repeated)')
+@click.option('-p','--project', 'project_names', multiple=True, help='Name of a project to copy, with its sub-projects (may be repeated)')
+@click.option('--to-project', 'to_project', help='Destination project (for projects: the new parent project)', default=None)
+@click.option('--to-task', 'to_task', help='Id of the destination parent task (tasks only)', default=None)
+@click.option('--name', 'name', help='Name to give the copy (when copying a single project)', default=None)
+@click.option('-f','--field', 'fields', multiple=True, help='Task field to copy (may be repeated; defaults to %s)'%(', '.join(bulk.copy_fields_default)))
+@click.option('--completed/--no-completed', default=False, show_default=True, help='Copy completed tasks too?')
+@click.pass_obj
+def copy(obj,task_ids,project_names,to_project,to_task,name,fields,completed):
+    """Copy task subtrees or whole projects to a new parent.
+
     :return: None
     """
+    session = obj.open()
+    tree = session.tree
+    fields = list(fields) if fields else None
+    if not (task_ids or project_names):
+        raise click.UsageError('Nothing to copy (use --task and/or --project).')
+    if name and len(project_names)!=1:
+        raise click.UsageError('--name can only be used when copying a single project.')
+    pkg.log.open('Copying...')
+    if task_ids:
+        if to_task:
+            parent = tree.find_task(to_task)
+            project_id = parent.project_id
+            n_tasks = bulk.queue_copy_tasks(tree.api,[tree.find_task(task_id) for task_id in task_ids],project_id,
+                                            parent_id=parent.id,fields=fields,active_only=not completed,indent=parent.data.get('indent',0),
+                                            order_start=bulk.max_order(parent.children))
+        elif to_project:
+            project = tree.find_project(to_project)
+            roots_existing = [task for task in tree.project_tasks(project) if task.parent is None and not task.is_malformed()]
+            n_tasks = bulk.queue_copy_tasks(tree.api,[tree.find_task(task_id) for task_id in task_ids],project.id,
+                                            fields=fields,active_only=not completed,order_start=bulk.max_order(roots_existing))
+        else:
+            raise click.UsageError('Copying tasks needs a destination (--to-project or --to-task).')
+        pkg.log.comment('%d tasks queued.'%(n_tasks))
+    for project_name in project_names:
+        parent_id = tree.find_project(to_project).id if to_project else None
+        n_projects, n_tasks = bulk.queue_copy_project(tree.api,tree.find_project(project_name),tree.project_tasks,
+                                                      parent_id=parent_id,name=name,fields=fields,active_only=not completed)
+        pkg.log.comment('{%s}: %d projects and %d tasks queued.'%(project_name,n_projects,n_tasks))
+    tree.commit(debug=session.debug,journal=session.journal,offline=session.offline)
+    pkg.log.close('Done.')
+
+@gbpTodoist.command(context_settings=CONTEXT_SETTINGS)
+@click.option('-t','--task', 'task_ids', multiple=True, help='Id of a task whose subtree is to be moved (may be repeated)')
+@click.option('-p','--project', 'project_names', multiple=True, help='Name of a project to move, with its sub-projects (may be repeated)')
+@click.option('--to-project', 'to_project', help='Destination project (for projects: the new parent project; omit to make them top-level)', default=None)
+@click.option('--to-task', 'to_task', help='Id of the destination parent task (tasks only)', default=None)
+@click.pass_obj
+def move(obj,task_ids,project_names,to_project,to_task):
+    """Move task subtrees or whole projects to a new parent.
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    if not (task_ids or project_names):
+        raise click.UsageError('Nothing to move (use --task and/or --project).')
+    pkg.log.open('Moving...')
+    if task_ids:
+        roots = [tree.find_task(task_id) for task_id in task_ids]
+        if to_task:
+            bulk.queue_move_tasks(tree.api,roots,parent_id=tree.find_task(to_task).id)
+        elif to_project:
+            bulk.queue_move_tasks(tree.api,roots,project_id=tree.find_project(to_project).id)
+        else:
+            raise click.UsageError('Moving tasks needs a destination (--to-project or --to-task).')
+    if project_names:
+        parent_id = tree.find_project(to_project).id if to_project else None
+        bulk.queue_move_projects(tree.api,[tree.find_project(project_name) for project_name in project_names],parent_id=parent_id)
+    tree.commit(debug=session.debug,journal=session.journal,offline=session.offline)
+    pkg.log.close('Done.')
+
+@gbpTodoist.command('search', context_settings=CONTEXT_SETTINGS)
+@click.argument('query', nargs=-1, required=True)
+@click.option('-n','--limit', default=20, show_default=True, help='Maximum number of hits to list')
+@click.option('--kind', type=click.Choice(['all','project','item']), default='all', show_default=True, help='Kind of object to search for')
+@click.option('-i','--index', 'path_index', help="Path to an on-disk search index (kept up-to-date between runs)", type=click.Path(dir_okay=False), default=None)
+@click.pass_obj
+def search_tasks(obj,query,limit,kind,path_index):
+    """Search project names and task content.
+
+    Words must all match; use "quotes" for phrases and a trailing * for
+    prefixes.
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    index = tree.search_index(path_index=path_index,response=session.response,sync_token_start=session.sync_token_start)
+    query = ' '.join(query)
+    pkg.log.open('Searching for {%s}...'%(query))
+    t_start = time.time()
+    hits = index.search(query,limit=limit,kind=None if kind=='all' else kind)
+    t_search = time.time()-t_start
+    for hit in hits:
+        pkg.log.comment('%s (%s %s)'%(str(hit),hit.kind,hit.id))
+    pkg.log.close('Done (%d hits; %.1f milliseconds).'%(len(hits),1e3*t_search))
+
+@gbpTodoist.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--start', 'date_start', help='First day of the agenda (YYYY-MM-DD; defaults to today)', default=None)
+@click.option('-n','--days', 'n_days', default=1, show_default=True, help='Number of days covered by the agenda')
+@click.option('-p','--project', 'project_names', multiple=True, help='Only list tasks under this project (may be repeated)')
+@click.pass_obj
+def agenda(obj,date_start,n_days,project_names):
+    """List the tasks due over a number of days.
+
+    Recurring tasks are listed on every day they fall due.
 
-    # Fetch user's data from server
-    api = todoist.TodoistAPI(API_key)
-    api.sync()
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    if date_start:
+        try:
+            t_start = datetime.datetime.strptime(date_start,'%Y-%m-%d')
+        except ValueError:
+            raise click.BadParameter('Dates must be given as YYYY-MM-DD.',param_hint='--start')
+    else:
+        t_start = datetime.datetime.combine(datetime.date.today(),datetime.time())
+    t_stop = t_start+datetime.timedelta(days=n_days)
+    pkg.log.open('Agenda for %s to %s...'%(t_start.strftime('%Y-%m-%d'),(t_stop-datetime.timedelta(days=1)).strftime('%Y-%m-%d')))
+    entries = tree.agenda(t_start,t_stop,project_names=project_names)
+    pkg.log.close('Done (%d tasks due).'%(len(entries)))
+
+@gbpTodoist.command(context_settings=CONTEXT_SETTINGS)
+@click.option('-o','--output', 'path_output', help="Path to a .json file to write the statistics to (instead of printing them)", type=click.Path(dir_okay=False), default=None)
+@click.option('--coverage/--no-coverage', default=False, show_default=True, help='Report how many template targets are fully populated (replans every target)?')
+@click.pass_obj
+def stats(obj,path_output,coverage):
+    """Report per-project statistics (needs NumPy).
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    report = tree.stats(coverage=coverage)
+    if path_output:
+        with open(path_output,'w') as fp_out:
+            json.dump(report,fp_out,indent=1)
+        pkg.log.comment('Statistics written to {%s}.'%(path_output))
+    else:
+        _stats.log_report(report)
+
+@gbpTodoist.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--comments/--no-comments', default=True, show_default=True, help='Report the comments on template tasks?')
+@click.option('--activity/--no-activity', default=True, show_default=True, help='Report the latest activity on template targets?')
+@click.option('-c','--concurrency', default=8, show_default=True, help='Maximum number of requests in flight')
+@click.option('--rate', default=10., show_default=True, help='Maximum number of requests per second (0 for no limit)')
+@click.option('--timeout', default=10., show_default=True, help='Number of seconds after which a request is abandoned')
+@click.pass_obj
+def report(obj,comments,activity,concurrency,rate,timeout):
+    """Report the comments on template tasks and the activity on their targets.
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    template_list = tree._find_template_tasks()
+    fetch_args = dict(concurrency=concurrency,rate=rate,timeout=timeout)
+    if comments:
+        template_nodes = []
+        for template in template_list:
+            stack = [template['task_template']]
+            while stack:
+                node = stack.pop()
+                template_nodes.append(node)
+                stack.extend(node.children)
+        notes = tree.fetch_auxiliary('comments',template_nodes,**fetch_args)
+    if activity:
+        events = tree.fetch_auxiliary('activity',[template['task_target'] for template in template_list],**fetch_args)
+    for template in template_list:
+        pkg.log.open('%s -> %s [%s]:'%(template['content'],template['task_target'].content,template['project_target'].content))
+        if comments:
+            stack = [template['task_template']]
+            while stack:
+                node = stack.pop()
+                for note in notes.get(node.id,[]):
+                    pkg.log.comment('Comment on {%s}: %s'%(node.content,note.get('content')))
+                stack.extend(node.children)
+        if activity:
+            events_target = events.get(template['task_target'].id,[])
+            if events_target:
+                pkg.log.comment('Latest activity: %s on %s (%d events).'%(events_target[0].get('event_type'),events_target[0].get('event_date'),len(events_target)))
+            else:
+                pkg.log.comment('No activity found.')
+        pkg.log.close(None)
+
+@gbpTodoist.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('path_archive', metavar='ARCHIVE', type=click.Path(dir_okay=False))
+@click.option('--update/--no-update', default=True, show_default=True, help='Fetch the tasks completed since the last update?')
+@click.option('--page-size', default=_archive.page_size_default, show_default=True, help='Number of completed tasks to request per page')
+@click.option('--report', type=click.Choice(['none','year','month','day']), default='none', show_default=True, help='Report the number of tasks completed per period')
+@click.option('-p','--project', 'project_names', multiple=True, help='Only report tasks completed under this project (may be repeated)')
+@click.pass_obj
+def archive(obj,path_archive,update,page_size,report,project_names):
+    """Archive completed tasks to a local file and report throughput.
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    completed_archive = _archive.completed_archive(path_archive)
+    if update:
+        if completed_archive.is_resuming():
+            pkg.log.open('Resuming archive update {%s}...'%(path_archive))
+        else:
+            pkg.log.open('Updating archive {%s}...'%(path_archive))
+        n_archived = completed_archive.update(tree.api,page_size=page_size)
+        pkg.log.close('Done (%d completed tasks added).'%(n_archived))
+    if report!='none':
+        project_ids = None
+        if project_names:
+            project_ids = set()
+            for project_name in project_names:
+                project_ids |= tree.project_subtree_ids(tree.find_project(project_name))
+        pkg.log.open('Completed tasks per %s:'%(report))
+        for period, count in completed_archive.throughput(report,project_ids=project_ids):
+            pkg.log.comment('%-10s %7d'%(period,count))
+        pkg.log.close(None)
+
+@gbpTodoist.command('tree', context_settings=CONTEXT_SETTINGS)
+@click.option('-p','--project', 'project_name', help='Only render this project (with its sub-projects)', default=None)
+@click.option('-t','--task', 'task_id', help='Only render the subtree of the task with this id', default=None)
+@click.option('--max-depth', 'max_depth', type=int, default=None, help='Depth of the deepest nodes to render (0: the roots only)')
+@click.option('--collapse-completed/--no-collapse-completed', default=False, show_default=True, help='Hide the subtasks of completed tasks?')
+@click.option('--sort/--no-sort', default=True, show_default=True, help='Order siblings as they are in Todoist (by child_order)?')
+@click.option('-f','--format', 'format', type=click.Choice(render.formats), default='text', show_default=True, help='Output format')
+@click.option('-o','--output', 'path_output', help="Path to a file to write the tree to (default: stdout)", type=click.Path(dir_okay=False), default=None)
+@click.pass_obj
+def show_tree(obj,project_name,task_id,max_depth,collapse_completed,sort,format,path_output):
+    """Render the tree of projects and tasks.
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    if project_name and task_id:
+        raise click.UsageError('--project and --task can not be used together.')
+    root = None
+    if project_name:
+        root = tree.find_project(project_name)
+    elif task_id:
+        root = tree.find_task(task_id)
+    if path_output:
+        with open(path_output,'w') as fp_out:
+            n_nodes = tree.print_tree(fp=fp_out,root=root,format=format,max_depth=max_depth,collapse_completed=collapse_completed,sort=sort)
+        pkg.log.comment('%d nodes written to {%s}.'%(n_nodes,path_output))
+    else:
+        tree.print_tree(root=root,format=format,max_depth=max_depth,collapse_completed=collapse_completed,sort=sort)
+
+@gbpTodoist.command('prune', context_settings=CONTEXT_SETTINGS)
+@click.option('--older-than', 'n_days', default=30, show_default=True, help='Number of days since the latest completion in a subtree for it to be pruned')
+@click.option('--action', type=click.Choice(_prune.actions), default='archive', show_default=True, help='What to do with stale subtrees')
+@click.option('-p','--project', 'project_names', multiple=True, help='Only prune under this project (with its sub-projects; may be repeated)')
+@click.option('--templates-only/--no-templates-only', default=False, show_default=True, help='Only prune under the targets of template tasks?')
+@click.pass_obj
+def prune_tasks(obj,n_days,action,project_names,templates_only):
+    """Archive or delete fully completed subtrees which have gone stale.
+
+    Use -d to print the plan without committing it.
+
+    :return: None
+    """
+    session = obj.open()
+    tree = session.tree
+    nodes = tree.all_tasks()
 
-    # Build trees, etc.
-    tree = task_tree(api)
+    # Templates are never pruned
+    project_ids_skip = set(project.id for project in tree.projects if project.content=='Task Templates')
+    if templates_only:
+        roots = []
+        for template in tree._find_template_tasks():
+            roots.extend(template['task_target'].children)
+    else:
+        roots = [node for node in nodes if not node.parent and not node.is_malformed()]
+    if project_names:
+        project_ids = set()
+        for project_name in project_names:
+            project_ids |= tree.project_subtree_ids(tree.find_project(project_name))
+        roots = [node for node in roots if node.project_id in project_ids]
+    roots = [node for node in roots if node.project_id not in project_ids_skip]
 
-    # Find and populate template tasks
-    tree.populate_template_subtasks(debug=debug)
-    #tree.print_tree()
+    pkg.log.open('Finding subtrees completed more than %d days ago...'%(n_days))
+    stale = _prune.find_stale(nodes,_prune.cutoff_date(n_days),roots=roots)
+    for node, latest, n_tasks in stale:
+        project = tree.project_index.get(node.project_id)
+        pkg.log.comment('%s: %s (%d tasks; completed %s) [%s]'%(action,node.content,n_tasks,latest.strftime('%Y-%m-%d'),project.content if project else '?'))
+    n_commands = _prune.plan(tree.api,stale,action=action)
+    pkg.log.close('Done (%d subtrees; %d tasks; %d commands planned).'%(len(stale),sum(n_tasks for _, _, n_tasks in stale),n_commands))
+    tree.commit(debug=session.debug,journal=session.journal,offline=session.offline)
 
 # Permit script execution
 if __name__ == '__main__':
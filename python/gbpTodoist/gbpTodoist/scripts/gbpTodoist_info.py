@@ -15,12 +15,14 @@ sys.path.insert(0, package_parent_dir)
 
 # Import needed internal modules
 prj = importlib.import_module(package_name + '._internal.project')
+profile = importlib.import_module(package_name + '._internal.profile')
 
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
 @click.command(context_settings=CONTEXT_SETTINGS)
+@profile.profile_option
 def gbpTodoist_info():
     """Print the dictionary of project parameters stored in the project and package .json files.
 
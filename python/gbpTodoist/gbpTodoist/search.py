@@ -0,0 +1,332 @@
+"""This module provides an inverted full-text index over project names and task
+content.
+
+Text is split into lower-case word tokens, and every token maps to the
+documents (projects or items) holding it, with the positions at which it
+occurs.  Queries are lists of terms which must all match:
+
+   word           -- a document holding this token
+   word*          -- a document holding a token starting with `word`
+   "two words"    -- a document holding these tokens, consecutively
+
+Hits are ranked by a tf-idf score (with a bonus for phrase matches) and carry
+the path of project and task names leading to them.  The index can be built from
+any list of projects and items (`todoist` models, tree nodes, store records or
+data dictionaries), updated in place from an incremental sync response, and
+saved to (or loaded from) disk.
+"""
+import os
+import sys
+import importlib
+import json
+import re
+import math
+import bisect
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Version of the on-disk index format.  Files with a different version are rebuilt.
+_INDEX_VERSION = 1
+
+_token_re = re.compile(r'\w+', re.UNICODE)
+_query_re = re.compile(r'"([^"]*)"|(\S+)', re.UNICODE)
+
+
+def tokenize(text):
+    """Split a string into lower-case word tokens.
+
+    :param text: A string
+    :return: A list of strings
+    """
+    if(not text):
+        return []
+    return _token_re.findall(text.lower())
+
+
+def parse_query(query):
+    """Parse a query string into a list of terms.
+
+    :param query: A query string (see the module documentation)
+    :return: A list of ('word'|'prefix'|'phrase', token or list of tokens) tuples
+    """
+    terms = []
+    for phrase, word in _query_re.findall(query):
+        if(phrase):
+            tokens = tokenize(phrase)
+            if(len(tokens) == 1):
+                terms.append(('word', tokens[0]))
+            elif(tokens):
+                terms.append(('phrase', tokens))
+        elif(word.endswith('*')):
+            tokens = tokenize(word[:-1])
+            if(tokens):
+                terms.append(('prefix', tokens[-1]))
+                terms.extend(('word', token) for token in tokens[:-1])
+        else:
+            terms.extend(('word', token) for token in tokenize(word))
+    return terms
+
+
+def _data(obj):
+    return getattr(obj, 'data', obj)
+
+
+class hit(object):
+    """This class provides a search result."""
+
+    __slots__ = ('kind', 'id', 'content', 'score', 'path')
+
+    def __init__(self, kind, id, content, score, path):
+        self.kind = kind
+        self.id = id
+        self.content = content
+        self.score = score
+        self.path = path
+
+    def __str__(self):
+        return ' / '.join(self.path + [self.content])
+
+
+class search_index(object):
+    """This class provides the inverted index."""
+
+    def __init__(self):
+        """Generate an empty instance of the `search_index` class."""
+        self.sync_token = None
+
+        # Document numbers index a list of [kind, id, parent id, project id, text] entries
+        self.docs = []
+        self.doc_numbers = {}
+        self.n_docs = 0
+
+        # token -> {document number: list of positions}
+        self.postings = {}
+        self._vocabulary = None
+
+    def _add(self, kind, data):
+        text = data.get('name') if kind == 'project' else data.get('content')
+        key = (kind, data['id'])
+        self._remove(key)
+        doc_number = len(self.docs)
+        self.docs.append([kind, data['id'], data.get('parent_id'), data.get('project_id'), text])
+        self.doc_numbers[key] = doc_number
+        self.n_docs += 1
+        for position, token in enumerate(tokenize(text)):
+            postings = self.postings.get(token)
+            if(postings is None):
+                postings = self.postings[token] = {}
+                self._vocabulary = None
+            postings.setdefault(doc_number, []).append(position)
+
+    def _remove(self, key):
+        doc_number = self.doc_numbers.pop(key, None)
+        if(doc_number is None):
+            return
+        for token in set(tokenize(self.docs[doc_number][4])):
+            postings = self.postings.get(token)
+            if(postings is not None):
+                postings.pop(doc_number, None)
+                if(not postings):
+                    del self.postings[token]
+                    self._vocabulary = None
+        self.docs[doc_number] = None
+        self.n_docs -= 1
+
+    def update(self, projects=(), items=(), sync_token=None):
+        """Add (or replace) projects and items in the index.
+
+        Deleted projects and items are removed from the index, and malformed
+        items (those without an id) are skipped.
+
+        :param projects: A list of project models, nodes, records or data dictionaries
+        :param items: A list of item models, nodes, records or data dictionaries
+        :param sync_token: Optional sync token which the index is up-to-date with after this update
+        :return: The number of documents added or replaced
+        """
+        n_added = 0
+        for kind, objects in (('project', projects), ('item', items)):
+            for obj in objects:
+                data = _data(obj)
+                if('id' not in data):
+                    continue
+                if(data.get('is_deleted')):
+                    self._remove((kind, data['id']))
+                else:
+                    self._add(kind, data)
+                    n_added += 1
+        if(sync_token is not None):
+            self.sync_token = sync_token
+        return n_added
+
+    def apply_sync(self, response):
+        """Apply the response of a call to `TodoistAPI.sync()` to the index.
+
+        :param response: The sync response dictionary
+        :return: The number of documents added or replaced
+        """
+        if(response.get('full_sync')):
+            self.__init__()
+        return self.update(projects=response.get('projects', []), items=response.get('items', []),
+                           sync_token=response.get('sync_token'))
+
+    def _prefix_tokens(self, prefix):
+        if(self._vocabulary is None):
+            self._vocabulary = sorted(self.postings)
+        i_start = bisect.bisect_left(self._vocabulary, prefix)
+        i_stop = i_start
+        while(i_stop < len(self._vocabulary) and self._vocabulary[i_stop].startswith(prefix)):
+            i_stop += 1
+        return self._vocabulary[i_start:i_stop]
+
+    def _match_term(self, term):
+        # Return a {document number: (term frequency, phrase match)} dictionary
+        term_type, value = term
+        if(term_type == 'word'):
+            return dict((doc_number, (len(positions), False)) for doc_number, positions in self.postings.get(value, {}).items())
+        if(term_type == 'prefix'):
+            result = {}
+            for token in self._prefix_tokens(value):
+                for doc_number, positions in self.postings[token].items():
+                    result[doc_number] = (result.get(doc_number, (0, False))[0] + len(positions), False)
+            return result
+
+        # Phrases: intersect the postings of the rarest token with the others, then check positions
+        postings = [self.postings.get(token, {}) for token in value]
+        candidates = min(postings, key=len)
+        result = {}
+        for doc_number in candidates:
+            if(not all(doc_number in postings_i for postings_i in postings)):
+                continue
+            positions = [set(postings_i[doc_number]) for postings_i in postings]
+            n_found = 0
+            for position in postings[0][doc_number]:
+                if(all(position + offset in positions[offset] for offset in range(1, len(value)))):
+                    n_found += 1
+            if(n_found):
+                result[doc_number] = (n_found, True)
+        return result
+
+    def path(self, doc_number):
+        """Return the names of the projects and tasks leading to a document.
+
+        :param doc_number: A document number
+        :return: A list of strings, outermost first
+        """
+        path = []
+        kind, _, parent_id, project_id, _ = self.docs[doc_number]
+        visited = set()
+        while(True):
+            if(parent_id is not None and (kind, parent_id) not in visited):
+                visited.add((kind, parent_id))
+                parent_number = self.doc_numbers.get((kind, parent_id))
+                if(parent_number is None):
+                    break
+                entry = self.docs[parent_number]
+            elif(kind == 'item' and project_id is not None):
+                kind = 'project'
+                parent_number = self.doc_numbers.get((kind, project_id))
+                if(parent_number is None):
+                    break
+                entry = self.docs[parent_number]
+            else:
+                break
+            path.append(entry[4])
+            parent_id = entry[2]
+            project_id = entry[3]
+        path.reverse()
+        return path
+
+    def search(self, query, limit=20, kind=None):
+        """Search the index.
+
+        :param query: A query string (see the module documentation)
+        :param limit: The maximum number of hits to return (None for all)
+        :param kind: Optionally, restrict hits to 'project' or 'item' documents
+        :return: A list of `hit` instances, best first
+        """
+        terms = parse_query(query)
+        if(not terms):
+            return []
+
+        # Match the most selective terms first, so that the candidate set shrinks quickly
+        matches = [self._match_term(term) for term in terms]
+        matches.sort(key=len)
+        scores = {}
+        for doc_number, (tf, phrase) in matches[0].items():
+            scores[doc_number] = 0.
+        for match in matches:
+            idf = math.log(1. + float(self.n_docs) / (1. + len(match)))
+            for doc_number in list(scores):
+                if(doc_number not in match):
+                    del scores[doc_number]
+                    continue
+                tf, phrase = match[doc_number]
+                scores[doc_number] += (1. + math.log(tf)) * idf * (2. if phrase else 1.)
+            if(not scores):
+                return []
+
+        if(kind is not None):
+            scores = dict((doc_number, score) for doc_number, score in scores.items() if self.docs[doc_number][0] == kind)
+        ranked = sorted(scores.items(), key=lambda entry: (-entry[1], len(self.docs[entry[0]][4] or ''), entry[0]))
+        if(limit is not None):
+            ranked = ranked[:limit]
+        result = []
+        for doc_number, score in ranked:
+            entry = self.docs[doc_number]
+            result.append(hit(entry[0], entry[1], entry[4], score, self.path(doc_number)))
+        return result
+
+    def save(self, path):
+        """Write the index to disk.
+
+        Removed documents are compacted away as the index is written.
+
+        :param path: Path to a .json file
+        :return: None
+        """
+        renumber = {}
+        docs = []
+        for doc_number, entry in enumerate(self.docs):
+            if(entry is not None):
+                renumber[doc_number] = len(docs)
+                docs.append(entry)
+        postings = {}
+        for token, postings_i in self.postings.items():
+            postings[token] = [[renumber[doc_number], positions] for doc_number, positions in postings_i.items()]
+        # Encoding in one go is much faster than streaming to the file with json.dump()
+        with open(path, 'w') as fp_out:
+            fp_out.write(json.dumps({'version': _INDEX_VERSION, 'sync_token': self.sync_token, 'docs': docs, 'postings': postings}))
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by `save`.
+
+        :param path: Path to a .json file
+        :return: A `search_index` instance, or None if the file is missing or unreadable
+        """
+        try:
+            with open(path, 'r') as fp_in:
+                index_in = json.load(fp_in)
+        except (IOError, OSError, ValueError):
+            return None
+        if(index_in.get('version') != _INDEX_VERSION):
+            return None
+        index = cls()
+        index.sync_token = index_in['sync_token']
+        index.docs = index_in['docs']
+        index.n_docs = len(index.docs)
+        for doc_number, entry in enumerate(index.docs):
+            index.doc_numbers[(entry[0], entry[1])] = doc_number
+        for token, postings_i in index_in['postings'].items():
+            index.postings[token] = dict((doc_number, positions) for doc_number, positions in postings_i)
+        return index
@@ -0,0 +1,224 @@
+"""This module provides per-project statistics for an account.
+
+The items of the account are converted (in a single pass) to a set of NumPy
+arrays: one entry per item, holding the row of its project, the row of its
+parent, its state and its priority.  Ids are turned into rows by binary
+search (`numpy.searchsorted`) over the sorted ids.  Every statistic is then computed with
+vectorized operations on those arrays:
+
+   1) depths, by pointer jumping up the parent array (a number of steps
+      logarithmic in the depth of the deepest task);
+   2) per-project aggregates (open and completed counts, depth histograms,
+      fan-out and the priority mix of open tasks), by `numpy.bincount` over
+      combined (project, value) codes.
+
+NumPy is an optional dependency of this package (the `stats` extra); the rest
+of the package works without it.
+"""
+import os
+import sys
+import importlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Maximum number of pointer-jumping steps; tasks still unresolved after this many are part of a parent cycle
+_max_jumps = 64
+
+
+def _check_numpy():
+    if(np is None):
+        pkg.log.error("NumPy is needed for account statistics (install it with: pip install numpy).")
+
+
+def _data(obj):
+    return getattr(obj, 'data', obj)
+
+
+def _rows(sorted_ids, order, keys):
+    """Map ids to rows by binary search over the sorted ids.
+
+    :param sorted_ids: An array of ids, sorted
+    :param order: An array giving the row of each sorted id
+    :param keys: A list of the ids to look up (None for none)
+    :return: An array of rows (-1 for ids which are None or not known)
+    """
+    rows = np.full(len(keys), -1, dtype=np.int64)
+    given = np.fromiter((key is not None for key in keys), dtype=bool, count=len(keys))
+    if(not len(sorted_ids) or not given.any()):
+        return rows
+    values = np.array([key for key in keys if key is not None])
+    i_sorted = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    rows[given] = np.where(sorted_ids[i_sorted] == values, order[i_sorted], -1)
+    return rows
+
+
+def _sort_ids(ids):
+    ids = np.array(ids)
+    order = np.argsort(ids, kind='stable')
+    return ids[order], order
+
+
+def build_arrays(projects, items):
+    """Convert the projects and items of an account to arrays.
+
+    Deleted and malformed items are skipped.  Items whose project is unknown
+    are given a project row of -1, and items whose parent is unknown are
+    treated as top-level tasks.
+
+    :param projects: A list of project models, nodes, records or data dictionaries
+    :param items: A list of item models, nodes, records or data dictionaries
+    :return: A dictionary of arrays ('project', 'parent', 'completed', 'priority') and project lists ('project_ids', 'project_names')
+    """
+    _check_numpy()
+    project_ids = []
+    project_names = []
+    for project in projects:
+        data = _data(project)
+        if('id' in data and not data.get('is_deleted')):
+            project_ids.append(data['id'])
+            project_names.append(data.get('name'))
+
+    # The one pass over the items; the columns are then filled from it
+    datas = [data for data in (_data(item) for item in items) if 'id' in data and not data.get('is_deleted')]
+    n_items = len(datas)
+    ids = [data['id'] for data in datas]
+    completed = np.fromiter((bool(data.get('checked') or data.get('is_archived')) for data in datas), dtype=bool, count=n_items)
+    priority = np.fromiter((data.get('priority') or 1 for data in datas), dtype=np.int64, count=n_items)
+
+    sorted_project_ids, project_order = _sort_ids(project_ids)
+    sorted_ids, order = _sort_ids(ids)
+    return {'project': _rows(sorted_project_ids, project_order, [data.get('project_id') for data in datas]),
+            'parent': _rows(sorted_ids, order, [data.get('parent_id') for data in datas]),
+            'completed': completed,
+            'priority': np.clip(priority, 1, 4),
+            'project_ids': project_ids,
+            'project_names': project_names}
+
+
+def depths(parent):
+    """Compute the depth of every task by pointer jumping.
+
+    :param parent: An array of parent rows (-1 for top-level tasks)
+    :return: An array of depths (0 for top-level tasks; -1 for tasks in, or below, a parent cycle)
+    """
+    _check_numpy()
+    depth = (parent >= 0).astype(np.int64)
+    pointer = parent.copy()
+    for _ in range(_max_jumps):
+        active = pointer >= 0
+        if(not active.any()):
+            return depth
+        target = pointer[active]
+        depth[active] += depth[target]
+        pointer[active] = pointer[target]
+    depth[pointer >= 0] = -1
+    return depth
+
+
+def compute(arrays, template_targets=None):
+    """Compute the statistics of an account.
+
+    :param arrays: The dictionary returned by `build_arrays`
+    :param template_targets: Optionally, a list of (project id, boolean) tuples, one per template target, flagging fully-populated targets
+    :return: A dictionary (ready to be written as JSON) with a 'projects' list and a 'totals' dictionary
+    """
+    _check_numpy()
+    n_projects = len(arrays['project_ids'])
+    project = arrays['project']
+    parent = arrays['parent']
+    completed = arrays['completed']
+    depth = depths(parent)
+    n_children = np.bincount(parent[parent >= 0], minlength=len(parent))
+
+    # Restrict the per-project aggregates to tasks in known projects, outside of cycles
+    keep = (project >= 0) & (depth >= 0)
+    project_k = project[keep]
+    depth_k = depth[keep]
+    completed_k = completed[keep]
+    n_children_k = n_children[keep]
+    n_depths = int(depth_k.max()) + 1 if len(depth_k) else 1
+
+    n_completed = np.bincount(project_k, weights=completed_k, minlength=n_projects).astype(np.int64)
+    n_open = np.bincount(project_k, minlength=n_projects) - n_completed
+    depth_histogram = np.bincount(project_k * n_depths + depth_k, minlength=n_projects * n_depths).reshape(n_projects, n_depths)
+    has_children = n_children_k > 0
+    n_parents = np.bincount(project_k[has_children], minlength=n_projects)
+    n_children_sum = np.bincount(project_k[has_children], weights=n_children_k[has_children], minlength=n_projects)
+    fanout_max = np.zeros(n_projects, dtype=np.int64)
+    np.maximum.at(fanout_max, project_k, n_children_k)
+    is_open = ~completed_k
+    priority_mix = np.bincount(project_k[is_open] * 4 + arrays['priority'][keep][is_open] - 1,
+                               minlength=n_projects * 4).reshape(n_projects, 4)
+
+    n_targets = np.zeros(n_projects, dtype=np.int64)
+    n_populated = np.zeros(n_projects, dtype=np.int64)
+    if(template_targets):
+        sorted_project_ids, project_order = _sort_ids(arrays['project_ids'])
+        target_rows = _rows(sorted_project_ids, project_order, [project_id for project_id, _ in template_targets])
+        target_populated = np.array([populated for _, populated in template_targets], dtype=bool)
+        known = target_rows >= 0
+        n_targets = np.bincount(target_rows[known], minlength=n_projects)
+        n_populated = np.bincount(target_rows[known][target_populated[known]], minlength=n_projects)
+
+    result = []
+    for i_project in range(n_projects):
+        result.append({'id': arrays['project_ids'][i_project],
+                       'name': arrays['project_names'][i_project],
+                       'n_open': int(n_open[i_project]),
+                       'n_completed': int(n_completed[i_project]),
+                       'depth_histogram': [int(n) for n in np.trim_zeros(depth_histogram[i_project], 'b')],
+                       'fanout_mean': float(n_children_sum[i_project] / n_parents[i_project]) if n_parents[i_project] else 0.,
+                       'fanout_max': int(fanout_max[i_project]),
+                       'priority_mix': [int(n) for n in priority_mix[i_project]],
+                       'n_template_targets': int(n_targets[i_project]),
+                       'n_template_targets_populated': int(n_populated[i_project])})
+    totals = {'n_items': int(len(parent)),
+              'n_open': int((~completed).sum()),
+              'n_completed': int(completed.sum()),
+              'n_unassigned': int((project < 0).sum()),
+              'n_in_cycles': int((depth < 0).sum()),
+              'depth_histogram': [int(n) for n in np.bincount(depth[depth >= 0])] if len(depth) else [],
+              'fanout_histogram': [int(n) for n in np.bincount(n_children[n_children > 0])] if n_children.any() else []}
+    return {'projects': result, 'totals': totals}
+
+
+def log_report(report):
+    """Write a statistics report to the package log, as tables.
+
+    :param report: A report returned by `compute`
+    :return: None
+    """
+    header = '%-30s %7s %7s %5s %7s %5s %23s %9s' % ('Project', 'Open', 'Done', 'Depth', 'Fan-out', 'Max', 'Priority (p4/p3/p2/p1)', 'Templates')
+    pkg.log.open('Projects:')
+    pkg.log.comment(header)
+    pkg.log.comment('-' * len(header))
+    for project in report['projects']:
+        priority = '/'.join('%d' % (n) for n in reversed(project['priority_mix']))
+        templates = '%d/%d' % (project['n_template_targets_populated'], project['n_template_targets']) if project['n_template_targets'] else '-'
+        pkg.log.comment('%-30s %7d %7d %5d %7.2f %5d %23s %9s' % (
+            (project['name'] or '')[:30], project['n_open'], project['n_completed'], len(project['depth_histogram']),
+            project['fanout_mean'], project['fanout_max'], priority, templates))
+    pkg.log.close(None)
+
+    totals = report['totals']
+    pkg.log.open('Totals:')
+    pkg.log.comment('%d items (%d open, %d completed); %d in unknown projects, %d in parent cycles.' % (
+        totals['n_items'], totals['n_open'], totals['n_completed'], totals['n_unassigned'], totals['n_in_cycles']))
+    pkg.log.comment('Tasks by depth:     ' + ' '.join('%d:%d' % (i, n) for i, n in enumerate(totals['depth_histogram']) if n))
+    pkg.log.comment('Parents by fan-out: ' + ' '.join('%d:%d' % (i, n) for i, n in enumerate(totals['fanout_histogram']) if n))
+    pkg.log.close(None)
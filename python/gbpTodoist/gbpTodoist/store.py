@@ -0,0 +1,314 @@
+"""This module provides an optional SQLite-backed local store of the projects and
+items of a Todoist account.
+
+The store holds one row per project and per item, with the columns needed for
+indexed tree queries (id, parent, project, content hash, due date, order and
+state flags) broken out of the item's data dictionary, which is kept whole as
+JSON.  Sync responses (full or incremental) are applied in a single
+transaction.  The database is run in write-ahead-log mode, so that other
+processes can read it while it is being updated.
+
+Subtree and ancestor queries are answered with recursive common table
+expressions, and a `task_tree` can be hydrated from the store one project at a
+time (see `store_forest`).
+"""
+import os
+import sys
+import importlib
+import sqlite3
+import json
+import hashlib
+import time
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+_tree = importlib.import_module(package_name + '.tree')
+
+# Ids are given no declared type, so that they are stored (and compared) exactly
+# as the API returns them, whether those are integers or strings
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS projects (
+    id PRIMARY KEY, parent_id, name TEXT, child_order INTEGER,
+    is_archived INTEGER, is_deleted INTEGER, data TEXT);
+CREATE TABLE IF NOT EXISTS items (
+    id PRIMARY KEY, parent_id, project_id, content TEXT, content_hash TEXT, due_date TEXT,
+    child_order INTEGER, checked INTEGER, is_archived INTEGER, is_deleted INTEGER, data TEXT);
+CREATE INDEX IF NOT EXISTS projects_parent_id ON projects (parent_id);
+CREATE INDEX IF NOT EXISTS items_parent_id ON items (parent_id);
+CREATE INDEX IF NOT EXISTS items_project_id ON items (project_id);
+CREATE INDEX IF NOT EXISTS items_content_hash ON items (content_hash);
+CREATE INDEX IF NOT EXISTS items_due_date ON items (due_date);
+"""
+
+#: Maximum depth followed by the recursive tree queries (guards against parent cycles)
+max_depth = 1000
+
+
+def content_hash(content):
+    """Return the hash used to index item content.
+
+    :param content: A string
+    :return: A hexadecimal string
+    """
+    if(content is None):
+        return None
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class record(object):
+    """This class provides a minimal stand-in for a `todoist` model, for data
+    read back from the store."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        """Generate an instance of the `record` class.
+
+        :param data: The project or item data dictionary
+        """
+        self.data = data
+
+
+def _data(obj):
+    """Return the data dictionary of a model, or the object itself if it is
+    already a dictionary.
+
+    :param obj: A `todoist` model or a dictionary
+    :return: Dictionary
+    """
+    return getattr(obj, 'data', obj)
+
+
+class state_store(object):
+    """This class provides the SQLite store."""
+
+    def __init__(self, path, timeout=30.):
+        """Open (creating it if needed) a store.
+
+        :param path: Path to the SQLite database file
+        :param timeout: Number of seconds to wait for a lock held by another process
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the store.
+
+        :return: None
+        """
+        self.connection.close()
+
+    def get_meta(self, key, default=None):
+        """Return a value from the store's metadata table.
+
+        :param key: The metadata key
+        :param default: Value to return if the key is not present
+        :return: string
+        """
+        row = self.connection.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        if(row is None):
+            return default
+        return row[0]
+
+    @staticmethod
+    def _project_row(data):
+        return (data['id'], data.get('parent_id'), data.get('name'), _tree.item_order(data),
+                int(bool(data.get('is_archived'))), int(bool(data.get('is_deleted'))), json.dumps(data))
+
+    @staticmethod
+    def _item_row(data):
+        due = _tree.due_datetime(data)
+        if(due is not None):
+            due = due.strftime('%Y-%m-%dT%H:%M:%S')
+        return (data['id'], data.get('parent_id'), data.get('project_id'), data.get('content'), content_hash(data.get('content')),
+                due, _tree.item_order(data), int(bool(data.get('checked'))), int(bool(data.get('is_archived'))),
+                int(bool(data.get('is_deleted'))), json.dumps(data))
+
+    def upsert(self, projects=(), items=(), full=False, sync_token=None):
+        """Apply a set of projects and items to the store, in one transaction.
+
+        Deleted projects and items are removed from the store.  Malformed items
+        (those without an id) are skipped.
+
+        :param projects: A list of project models or data dictionaries
+        :param items: A list of item models or data dictionaries
+        :param full: Boolean flag indicating that these are the complete sets of projects and items (i.e. a full sync)
+        :param sync_token: Optional sync token to record with the update
+        :return: A (number of projects, number of items) tuple
+        """
+        project_rows = []
+        project_deletes = []
+        for project in projects:
+            data = _data(project)
+            if('id' not in data):
+                continue
+            if(data.get('is_deleted')):
+                project_deletes.append((data['id'],))
+            else:
+                project_rows.append(self._project_row(data))
+        item_rows = []
+        item_deletes = []
+        for item in items:
+            data = _data(item)
+            if('id' not in data):
+                continue
+            if(data.get('is_deleted')):
+                item_deletes.append((data['id'],))
+            else:
+                item_rows.append(self._item_row(data))
+
+        with self.connection:
+            if(full):
+                self.connection.execute('DELETE FROM projects')
+                self.connection.execute('DELETE FROM items')
+            self.connection.executemany('INSERT OR REPLACE INTO projects VALUES (?,?,?,?,?,?,?)', project_rows)
+            self.connection.executemany('DELETE FROM projects WHERE id=?', project_deletes)
+            self.connection.executemany('INSERT OR REPLACE INTO items VALUES (?,?,?,?,?,?,?,?,?,?,?)', item_rows)
+            self.connection.executemany('DELETE FROM items WHERE id=?', item_deletes)
+            if(sync_token is not None):
+                self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?,?)', ('sync_token', sync_token))
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?,?)', ('updated', repr(time.time())))
+        return len(project_rows), len(item_rows)
+
+    def apply_sync(self, response):
+        """Apply the response of a call to `TodoistAPI.sync()` to the store.
+
+        :param response: The sync response dictionary
+        :return: A (number of projects, number of items) tuple
+        """
+        return self.upsert(projects=response.get('projects', []), items=response.get('items', []),
+                           full=bool(response.get('full_sync')), sync_token=response.get('sync_token'))
+
+    def _records(self, sql, params=()):
+        return [record(json.loads(row[0])) for row in self.connection.execute(sql, params)]
+
+    def projects(self):
+        """Return all projects in the store.
+
+        :return: A list of `record` instances
+        """
+        return self._records('SELECT data FROM projects ORDER BY child_order')
+
+    def project_items(self, project_id):
+        """Return the items of a project.
+
+        :param project_id: A project id
+        :return: A list of `record` instances
+        """
+        return self._records('SELECT data FROM items WHERE project_id=? ORDER BY child_order', (project_id,))
+
+    def item_project_ids(self):
+        """Return the ids of all the projects hosting items.
+
+        :return: A list of project ids
+        """
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT project_id FROM items')]
+
+    def project_of(self, item_id):
+        """Return the id of the project hosting an item.
+
+        :param item_id: An item id
+        :return: A project id, or None if the item is not in the store
+        """
+        row = self.connection.execute('SELECT project_id FROM items WHERE id=?', (item_id,)).fetchone()
+        if(row is None):
+            return None
+        return row[0]
+
+    def items_by_content(self, content):
+        """Return all items with the given content.
+
+        :param content: A string
+        :return: A list of `record` instances
+        """
+        return self._records('SELECT data FROM items WHERE content_hash=? AND content=?', (content_hash(content), content))
+
+    def items_due(self, t_start, t_stop):
+        """Return all items due in the interval [t_start, t_stop).
+
+        :param t_start: A datetime
+        :param t_stop: A datetime
+        :return: A list of `record` instances, ordered by due date
+        """
+        return self._records('SELECT data FROM items WHERE due_date>=? AND due_date<? ORDER BY due_date',
+                             (t_start.strftime('%Y-%m-%dT%H:%M:%S'), t_stop.strftime('%Y-%m-%dT%H:%M:%S')))
+
+    def subtree(self, item_id, table='items'):
+        """Return an item (or project) and all of its descendants, depth-first.
+
+        :param item_id: The id of the subtree root
+        :param table: 'items' or 'projects'
+        :return: A list of (depth, `record`) tuples
+        """
+        if(table not in ('items', 'projects')):
+            pkg.log.error("Invalid store table {%s}." % (table))
+        # Each path segment holds the id as well as the order, so that the
+        # descendants of siblings with the same order are not interleaved
+        sql = """
+            WITH RECURSIVE subtree(id, depth, path) AS (
+                SELECT id, 0, printf('%%010d.%%s', child_order, id) FROM %(table)s WHERE id=?
+                UNION ALL
+                SELECT t.id, subtree.depth+1, subtree.path || '/' || printf('%%010d.%%s', t.child_order, t.id)
+                FROM %(table)s AS t JOIN subtree ON t.parent_id=subtree.id
+                WHERE subtree.depth<?)
+            SELECT subtree.depth, t.data FROM subtree JOIN %(table)s AS t ON t.id=subtree.id
+            ORDER BY subtree.path""" % {'table': table}
+        return [(row[0], record(json.loads(row[1]))) for row in self.connection.execute(sql, (item_id, max_depth))]
+
+    def ancestors(self, item_id, table='items'):
+        """Return the ancestors of an item (or project), nearest first.
+
+        :param item_id: The id of the item
+        :param table: 'items' or 'projects'
+        :return: A list of `record` instances
+        """
+        if(table not in ('items', 'projects')):
+            pkg.log.error("Invalid store table {%s}." % (table))
+        sql = """
+            WITH RECURSIVE ancestors(id, parent_id, depth) AS (
+                SELECT id, parent_id, 0 FROM %(table)s WHERE id=?
+                UNION ALL
+                SELECT t.id, t.parent_id, ancestors.depth+1
+                FROM %(table)s AS t JOIN ancestors ON t.id=ancestors.parent_id
+                WHERE ancestors.depth<?)
+            SELECT t.data FROM ancestors JOIN %(table)s AS t ON t.id=ancestors.id
+            WHERE ancestors.depth>0 ORDER BY ancestors.depth""" % {'table': table}
+        return self._records(sql, (item_id, max_depth))
+
+
+class store_forest(_tree.lazy_forest):
+    """This class provides a `lazy_forest` which reads the items of a project
+    from a `state_store` the first time they are needed."""
+
+    def __init__(self, store):
+        """Generate an instance of the `store_forest` class.
+
+        :param store: A `state_store` instance
+        """
+        super(store_forest, self).__init__([])
+        self.store = store
+
+    def _bucket(self, project_id):
+        if(project_id is None):
+            return []
+        return self.store.project_items(project_id)
+
+    def _locate(self, item_id):
+        return self.store.project_of(item_id)
+
+    def project_ids(self):
+        return self.store.item_project_ids()
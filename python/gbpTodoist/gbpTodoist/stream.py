@@ -0,0 +1,304 @@
+"""This module provides a bounded-memory path for syncing large accounts.
+
+`todoist.TodoistAPI.sync()` holds the whole response body (as bytes, then as
+text), the document parsed from it and the models built from that, all at
+once, and then encodes the whole state to a single string to cache it.  Here
+instead:
+
+   1) the response is read in chunks and parsed incrementally (see
+      `object_stream`), so that each project, item, etc. is emitted as soon as
+      it has been read; the parser only buffers the text of one chunk and of
+      the object being read;
+   2) every object is merged into the local state (by id, in linear time) as
+      soon as it is read, and is then handed to an optional callback (e.g. to
+      feed a tree index or a store);
+   3) the cache is written one object at a time.
+
+The response returned by `sync` has the same form as that of `TodoistAPI.sync()`.
+Its lists refer to the dictionaries wrapped by the state's models (rather than
+to copies of them), so that the objects of the response are held only once:
+memory use is bounded by the size of the state, not by twice that.
+"""
+import os
+import sys
+import importlib
+import codecs
+import json
+import re
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Number of bytes read from the response at a time
+chunk_size_default = 1 << 16
+
+#: The state lists of a `todoist.TodoistAPI`, and the names of the models they hold
+models = {'collaborators': 'Collaborator', 'filters': 'Filter', 'items': 'Item', 'labels': 'Label',
+          'live_notifications': 'LiveNotification', 'notes': 'Note', 'project_notes': 'ProjectNote',
+          'projects': 'Project', 'reminders': 'Reminder', 'sections': 'Section'}
+
+_whitespace_re = re.compile(r'[ \t\n\r]*')
+
+
+class object_stream(object):
+    """This class provides an incremental parser for a JSON object, which emits
+    the elements of the object's array values one at a time."""
+
+    def __init__(self):
+        # Share key strings across objects (as json.loads() does within a single document)
+        keys = {}
+        self._decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: dict((keys.setdefault(key, key), value) for key, value in pairs))
+        self.buffer = ''
+        self.pos = 0
+        self.state = 'start'
+        self.key = None
+        self.eof = False
+
+    def feed(self, text):
+        """Parse another chunk of the document.
+
+        :param text: A string
+        :return: A list of ('value', key, value), ('array', key, None) and ('element', key, element) events
+        """
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return list(self._parse())
+
+    def close(self):
+        """Finish parsing the document.
+
+        :return: A list of events (see `feed`)
+        """
+        self.eof = True
+        events = list(self._parse())
+        if(self.state != 'done'):
+            pkg.log.error("Incomplete JSON document.")
+        return events
+
+    def _decode(self):
+        # Return (True, value), or (False, None) if more text is needed.  A
+        # value ending right at the end of the buffer may be a truncated
+        # number or literal, so it is only accepted at the end of the document.
+        try:
+            value, end = self._decoder.raw_decode(self.buffer, self.pos)
+        except ValueError:
+            if(self.eof):
+                raise
+            return False, None
+        if(end == len(self.buffer) and not self.eof):
+            return False, None
+        self.pos = end
+        return True, value
+
+    def _expect(self, char, state_next):
+        if(self.buffer[self.pos] != char):
+            pkg.log.error("Invalid JSON document: expected '%s' but found '%s'." % (char, self.buffer[self.pos]))
+        self.pos += 1
+        self.state = state_next
+
+    def _parse(self):
+        while(self.state != 'done'):
+            self.pos = _whitespace_re.match(self.buffer, self.pos).end()
+            if(self.pos >= len(self.buffer)):
+                return
+            char = self.buffer[self.pos]
+            if(self.state == 'start'):
+                self._expect('{', 'key')
+            elif(self.state == 'key'):
+                if(char == '}'):
+                    self._expect('}', 'done')
+                    continue
+                found, self.key = self._decode()
+                if(not found):
+                    return
+                self.state = 'colon'
+            elif(self.state == 'colon'):
+                self._expect(':', 'value')
+            elif(self.state == 'value'):
+                if(char == '['):
+                    self._expect('[', 'first_element')
+                    yield ('array', self.key, None)
+                    continue
+                found, value = self._decode()
+                if(not found):
+                    return
+                self.state = 'after_value'
+                yield ('value', self.key, value)
+            elif(self.state == 'first_element' and char == ']'):
+                self._expect(']', 'after_value')
+            elif(self.state in ('element', 'first_element')):
+                found, value = self._decode()
+                if(not found):
+                    return
+                self.state = 'after_element'
+                yield ('element', self.key, value)
+            elif(self.state == 'after_element'):
+                self._expect(']' if char == ']' else ',', 'after_value' if char == ']' else 'element')
+            elif(self.state == 'after_value'):
+                self._expect('}' if char == '}' else ',', 'done' if char == '}' else 'key')
+
+
+def iter_events(chunks):
+    """Parse a JSON object from a sequence of text chunks.
+
+    :param chunks: An iterable of strings
+    :return: A generator of events (see `object_stream.feed`)
+    """
+    parser = object_stream()
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+
+
+def write_cache(api):
+    """Write the local cache of a `todoist.TodoistAPI`, one object at a time.
+
+    The file is read back by `TodoistAPI._read_cache()` as usual.
+
+    :param api: A `todoist.TodoistAPI` instance
+    :return: None
+    """
+    if(not api.cache):
+        return
+
+    def _default(obj):
+        return obj.data
+
+    with open(api.cache + api.token + '.json', 'w') as fp_out:
+        fp_out.write('{')
+        for i_key, key in enumerate(sorted(api.state)):
+            fp_out.write('%s%s: ' % (', ' if i_key else '', json.dumps(key)))
+            value = api.state[key]
+            if(isinstance(value, list)):
+                fp_out.write('[')
+                for i_value, value_i in enumerate(value):
+                    fp_out.write('%s%s' % (', ' if i_value else '', json.dumps(value_i, sort_keys=True, default=_default)))
+                fp_out.write(']')
+            else:
+                fp_out.write(json.dumps(value, sort_keys=True, default=_default))
+        fp_out.write('}')
+    with open(api.cache + api.token + '.sync', 'w') as fp_out:
+        fp_out.write(api.sync_token)
+
+
+class _merger(object):
+    """This class provides the merging of the objects of one state list into
+    the API's state, one object at a time, as they are read."""
+
+    def __init__(self, api, datatype):
+        """Generate an instance of the `_merger` class.
+
+        :param api: A `todoist.TodoistAPI` instance
+        :param datatype: The state list to merge into (one of the keys of `models`)
+        """
+        import todoist.models
+        self.api = api
+        self.datatype = datatype
+        self.model = getattr(todoist.models, models[datatype])
+        self.index = dict((obj.data.get('id'), obj) for obj in api.state[datatype])
+        self.added = []
+        self.seen = []
+        self.ids_deleted = set()
+
+    def add(self, data):
+        """Merge an object of the response.
+
+        :param data: A data dictionary
+        :return: The dictionary to refer to in the response (that of the merged model, unless the object is deleted)
+        """
+        is_deleted = data.get('is_deleted', 0)
+        if(not (is_deleted == 0 or is_deleted is False)):
+            if('id' in data):
+                self.ids_deleted.add(data['id'])
+            return data
+        local = self.index.get(data.get('id')) if 'id' in data else None
+        if(local is not None):
+            local.data.update(data)
+        else:
+            local = self.model(data, self.api)
+            if('id' in data):
+                self.index[data['id']] = local
+            self.added.append(local)
+        self.seen.append(local)
+        return local.data
+
+    def finish(self, full_sync):
+        """Replace the API's state list with the merged one.
+
+        :param full_sync: Boolean flag; if True, the objects of the response replace the state list
+        :return: None
+        """
+        if(full_sync):
+            state = self.seen
+        else:
+            state = self.api.state[self.datatype] + self.added
+        if(self.ids_deleted):
+            state = [obj for obj in state if obj.data.get('id') not in self.ids_deleted]
+        self.api.state[self.datatype] = state
+
+
+def sync(api, commands=None, on_object=None, chunk_size=chunk_size_default):
+    """Sync an account, as `todoist.TodoistAPI.sync()` does, with bounded memory.
+
+    :param api: A `todoist.TodoistAPI` instance
+    :param commands: An optional list of commands to send
+    :param on_object: Optional function called with (datatype, data dictionary) for every object of the response, as it is read (and merged)
+    :param chunk_size: Number of bytes read from the response at a time
+    :return: The sync response dictionary
+    """
+    post_data = {'token': api.token,
+                 'sync_token': api.sync_token,
+                 'day_orders_timestamp': api.state['day_orders_timestamp'],
+                 'include_notification_settings': 1,
+                 'resource_types': json.dumps(['all']),
+                 'commands': json.dumps(commands or [])}
+    http_response = api.session.post(api.get_api_url() + 'sync', data=post_data, stream=True)
+    if(http_response.status_code >= 400):
+        pkg.log.error("Sync failed with status %d: %s" % (http_response.status_code, http_response.text[:200]))
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = (decoder.decode(chunk) for chunk in http_response.iter_content(chunk_size))
+
+    # Objects of the state lists are merged as soon as they are read, and the
+    # response refers to the merged dictionaries rather than to copies of them
+    response = {}
+    mergers = {}
+    for event_type, key, value in iter_events(chunks):
+        if(event_type == 'element'):
+            merger = mergers.get(key)
+            if(merger is not None):
+                value = merger.add(value)
+            response[key].append(value)
+            if(on_object is not None):
+                on_object(key, value)
+        elif(event_type == 'array'):
+            response[key] = []
+            if(key in models and key in api.state):
+                mergers[key] = _merger(api, key)
+        else:
+            response[key] = value
+
+    # Leave everything but the model lists to the API
+    full_sync = bool(response.get('full_sync'))
+    for merger in mergers.values():
+        merger.finish(full_sync)
+    rest = {}
+    for key, value in response.items():
+        if(key not in mergers):
+            rest[key] = value
+    api._update_state(rest)
+    for temp_id, new_id in response.get('temp_id_mapping', {}).items():
+        api.temp_ids[temp_id] = new_id
+        api._replace_temp_id(temp_id, new_id)
+    write_cache(api)
+    return response
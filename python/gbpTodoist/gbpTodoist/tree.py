@@ -0,0 +1,306 @@
+"""This module provides the compact node type used to represent projects and
+tasks in a `task_tree`.
+
+Rather than attaching tree attributes (`children`, `parent`, `tasks`) directly
+onto `todoist` model instances, each model is wrapped in a `tree_node`.  Nodes
+use `__slots__` and hold only what tree operations need (id, parent, project,
+order, a reference to the content string and a set of flags); everything else
+is read lazily from the wrapped model through the `data` property.
+"""
+import os
+import sys
+import importlib
+import datetime
+
+# Infer the name of this package from the path of __file__
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+package_root_dir = os.path.abspath(os.path.dirname(__file__))
+package_name = os.path.basename(package_root_dir)
+
+# Make sure that what's in this path takes precedence
+# over an installed version of the project
+sys.path.insert(0, package_parent_dir)
+
+# Import needed internal modules
+pkg = importlib.import_module(package_name)
+
+#: Node flag: the item is checked (completed)
+FLAG_CHECKED = 1
+#: Node flag: the item is archived
+FLAG_ARCHIVED = 2
+#: Node flag: the item is deleted
+FLAG_DELETED = 4
+#: Node flag: the item is malformed (e.g. its data holds an unparsed `kwargs` entry)
+FLAG_MALFORMED = 8
+#: Node flag: the node represents a project
+FLAG_PROJECT = 16
+
+
+def item_order(data):
+    """Return the sibling order of a project or item, for either version of
+    the Todoist data model.
+
+    :param data: A project or item data dictionary
+    :return: Integer
+    """
+    order = data.get('child_order')
+    if(order is None):
+        order = data.get('item_order')
+    if(order is None):
+        order = 0
+    return order
+
+
+def due_datetime(data):
+    """Return the due date of an item as a (naive, UTC) datetime, for either
+    version of the Todoist data model.
+
+    :param data: An item data dictionary
+    :return: A datetime, or None if the item has no (parsable) due date
+    """
+    due = data.get('due')
+    if(isinstance(due, dict) and due.get('date')):
+        date_string = due['date'].rstrip('Z')
+        for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+            try:
+                return datetime.datetime.strptime(date_string, fmt)
+            except ValueError:
+                pass
+        return None
+    due_date_utc = data.get('due_date_utc')
+    if(due_date_utc):
+        try:
+            return datetime.datetime.strptime(due_date_utc, '%a %d %b %Y %H:%M:%S +0000')
+        except ValueError:
+            return None
+    return None
+
+
+def completed_datetime(data):
+    """Return the completion date of an item as a (naive, UTC) datetime, for
+    either version of the Todoist data model.
+
+    :param data: An item data dictionary
+    :return: A datetime, or None if the item has no (parsable) completion date
+    """
+    date_completed = data.get('date_completed') or data.get('completed_date') or data.get('completed_at')
+    if(not date_completed):
+        return None
+    date_string = date_completed.rstrip('Z').split('.')[0]
+    for fmt in ('%a %d %b %Y %H:%M:%S +0000', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(date_string, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+class tree_node(object):
+    """This class provides a compact, tree-linked wrapper around a `todoist`
+    project or item model."""
+
+    __slots__ = ('id', 'parent_id', 'project_id', 'order', 'content', 'flags', 'parent', 'children', 'tasks', '_model')
+
+    def __init__(self, model, is_project=False):
+        """Generate an instance of the `tree_node` class.
+
+        :param model: A `todoist` model instance (anything with a `data` dictionary)
+        :param is_project: Boolean flag indicating whether the model is a project
+        """
+        data = model.data
+        self._model = model
+        self.parent = None
+        self.children = []
+        self.tasks = None
+
+        # Malformed items are kept, but are never linked into the tree
+        if('kwargs' in data):
+            kwargs = data['kwargs']
+            self.id = kwargs.get('id') if isinstance(kwargs, dict) else None
+            self.parent_id = None
+            self.project_id = None
+            self.order = 0
+            self.content = None
+            self.flags = FLAG_MALFORMED
+            return
+
+        self.id = data['id']
+        self.parent_id = data.get('parent_id')
+        self.order = item_order(data)
+        flags = 0
+        if(is_project):
+            flags |= FLAG_PROJECT
+            self.project_id = None
+            self.content = data.get('name')
+            self.tasks = []
+        else:
+            self.project_id = data.get('project_id')
+            self.content = data.get('content')
+        if(data.get('checked')):
+            flags |= FLAG_CHECKED
+        if(data.get('is_archived')):
+            flags |= FLAG_ARCHIVED
+        if(data.get('is_deleted')):
+            flags |= FLAG_DELETED
+        self.flags = flags
+
+    @property
+    def data(self):
+        """The data dictionary of the wrapped model."""
+        return self._model.data
+
+    @property
+    def model(self):
+        """The wrapped `todoist` model instance."""
+        return self._model
+
+    def is_active(self):
+        """Check if the node is active (i.e. neither checked nor archived).
+
+        :return: Boolean
+        """
+        return not (self.flags & (FLAG_CHECKED | FLAG_ARCHIVED))
+
+    def is_malformed(self):
+        """Check if the node wraps a malformed item.
+
+        :return: Boolean
+        """
+        return bool(self.flags & FLAG_MALFORMED)
+
+    def __repr__(self):
+        """Return a short description of the node.
+
+        :return: string
+        """
+        return "tree_node(id=%r, content=%r)" % (self.id, self.content)
+
+
+def build_tree(models, is_project=False):
+    """Wrap a list of models in nodes and link them into a forest.
+
+    :param models: A list of `todoist` project or item models
+    :param is_project: Boolean flag indicating whether the models are projects
+    :return: A tuple of (list of all nodes, dictionary of linked nodes keyed by id, list of malformed nodes)
+    """
+    nodes = [tree_node(model, is_project=is_project) for model in models]
+    index = {}
+    bad_list = []
+    for node in nodes:
+        if(node.flags & FLAG_MALFORMED):
+            bad_list.append(node)
+        else:
+            index[node.id] = node
+    for node in nodes:
+        if(node.parent_id is not None and node.parent_id != node.id):
+            parent = index.get(node.parent_id)
+            if(parent is not None):
+                node.parent = parent
+                parent.children.append(node)
+    return nodes, index, bad_list
+
+
+class lazy_forest(object):
+    """This class provides on-demand construction of the task forest.
+
+    Only a lightweight index is built up front: the item models are bucketed by
+    project and each item id is mapped to its project.  Nodes, and the links
+    between them, are only built for a project the first time its tasks are
+    asked for.
+    """
+
+    def __init__(self, models):
+        """Generate an instance of the `lazy_forest` class.
+
+        :param models: A list of `todoist` item models
+        """
+        self._buckets = {}
+        self._project_of = {}
+        for model in models:
+            data = model.data
+            if('kwargs' in data):
+                self._buckets.setdefault(None, []).append(model)
+            else:
+                project_id = data.get('project_id')
+                self._buckets.setdefault(project_id, []).append(model)
+                self._project_of[data['id']] = project_id
+
+        # Nodes built so far, keyed by project id and item id respectively
+        self._built = {}
+        self.index = {}
+
+    def _bucket(self, project_id):
+        """Return the item models of a project.  Override this to load items
+        from somewhere other than a list of models.
+
+        :param project_id: A project id
+        :return: A list of models
+        """
+        return self._buckets.get(project_id, [])
+
+    def _locate(self, item_id):
+        """Return the id of the project hosting an item.
+
+        :param item_id: An item id
+        :return: A project id, or None if the item is not known
+        """
+        return self._project_of.get(item_id)
+
+    def project_ids(self):
+        """Return the ids of all the projects hosting items (None for malformed items).
+
+        :return: A list of project ids
+        """
+        return list(self._buckets.keys())
+
+    def all_nodes(self):
+        """Build (if needed) and return the nodes of every item.
+
+        :return: A list of nodes
+        """
+        nodes = []
+        for project_id in self.project_ids():
+            nodes.extend(self.tasks_of(project_id))
+        return nodes
+
+    def is_built(self, project_id):
+        """Check if the nodes of a project have been built.
+
+        :param project_id: A project id
+        :return: Boolean
+        """
+        return project_id in self._built
+
+    def tasks_of(self, project_id):
+        """Return the task nodes of a project, building them if needed.
+
+        :param project_id: A project id (None for the malformed items)
+        :return: A list of nodes
+        """
+        nodes = self._built.get(project_id)
+        if(nodes is None):
+            nodes, index, _ = build_tree(self._bucket(project_id))
+            self.index.update(index)
+            self._built[project_id] = nodes
+        return nodes
+
+    def get(self, item_id):
+        """Return the node of an item, building its project's nodes if needed.
+
+        :param item_id: An item id
+        :return: A node, or None if the item is not known
+        """
+        node = self.index.get(item_id)
+        if(node is None):
+            project_id = self._locate(item_id)
+            if(project_id is not None and not self.is_built(project_id)):
+                self.tasks_of(project_id)
+                node = self.index.get(item_id)
+        return node
+
+    def n_built(self):
+        """Return the number of projects whose nodes have been built.
+
+        :return: Integer
+        """
+        return len(self._built)
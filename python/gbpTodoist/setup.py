@@ -31,6 +31,10 @@ this_package = _pkg.package(os.path.abspath(__file__))
 pkg.log.comment(this_project, blankline_before=True, blankline_after=True)
 pkg.log.comment(this_package, blankline_after=True)
 
+# The package data and scripts are assembled by the package's manifest (see
+# the `_internal.manifest` module), which caches directory listings between runs
+pkg.log.comment("Package data files: %d" % (len(this_package.package_files)))
+
 # This line converts the package_scripts list above into the entry point
 # list needed by Click, provided that:
 #    1) each script is in its own file
@@ -59,6 +63,7 @@ setup(
     url=this_project.params['url'],
     license=this_project.params['license'],
     install_requires=['Click'],
+    extras_require={'stats': ['numpy']},
     setup_requires=['pytest-runner'],
     tests_require=['pytest'],
     packages=find_packages(),
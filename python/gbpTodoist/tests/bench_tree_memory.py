@@ -0,0 +1,70 @@
+"""Memory benchmark for the nodes used to build a `task_tree`.
+
+Compares the bytes-per-node cost of the legacy approach (attaching `children`
+and `parent` attributes directly onto the SDK model instances) with wrapping
+each model in a `__slots__`-based `tree_node`.  The cost of the SDK models
+themselves is excluded from both measurements.
+
+Run with:  python tests/bench_tree_memory.py [n_items]
+"""
+from __future__ import print_function
+import os
+import sys
+import importlib
+import tracemalloc
+
+# Make sure that the package in this tree is found (and takes precedence over
+# an installed version of the project) when run as a script
+package_parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, package_parent_dir)
+
+_tree = importlib.import_module('gbpTodoist.tree')
+
+
+class _model(object):
+    """Stand-in for a `todoist.models.Item` instance."""
+
+    def __init__(self, data):
+        self.data = data
+        self.api = None
+
+
+def _models(n_items):
+    return [_model({'id': i, 'parent_id': (i - 1) // 4 if i else None, 'project_id': 1, 'item_order': i, 'indent': 1,
+                    'content': 'Task %d' % (i), 'checked': 0, 'is_archived': 0, 'is_deleted': 0}) for i in range(n_items)]
+
+
+def _legacy_build(models):
+    index = {}
+    for model in models:
+        model.children = []
+        model.parent = None
+        index[model.data['id']] = model
+    for model in models:
+        parent = index.get(model.data['parent_id'])
+        if parent is not None:
+            model.parent = parent
+            parent.children.append(model)
+    return index
+
+
+def _measure(build, n_items):
+    models = _models(n_items)
+    tracemalloc.start()
+    snapshot_start = tracemalloc.take_snapshot()
+    result = build(models)
+    snapshot_stop = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    n_bytes = sum(stat.size_diff for stat in snapshot_stop.compare_to(snapshot_start, 'filename'))
+    del result
+    return float(n_bytes) / n_items
+
+
+def main(n_items=100000):
+    print("Nodes: %d" % (n_items))
+    print("   legacy (attributes on SDK models): %7.1f bytes/node" % (_measure(_legacy_build, n_items)))
+    print("   tree_node (__slots__ wrapper):     %7.1f bytes/node" % (_measure(_tree.build_tree, n_items)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
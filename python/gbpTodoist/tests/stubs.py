@@ -0,0 +1,15 @@
+"""Stand-ins for the `todoist` objects used across the tests."""
+
+
+class model(object):
+    """Stand-in for a `todoist` project or item model."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class api(object):
+    """Stand-in for `todoist.TodoistAPI`, collecting queued commands."""
+
+    def __init__(self):
+        self.queue = []
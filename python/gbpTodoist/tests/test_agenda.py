@@ -0,0 +1,36 @@
+import datetime
+import importlib
+
+agenda = importlib.import_module('gbpTodoist.agenda')
+
+
+def _item(id, project_id, date, string=None):
+    return {'id': id, 'project_id': project_id, 'content': 'Task %d' % (id), 'checked': 0, 'is_archived': 0,
+            'due': {'date': date, 'string': string or date, 'is_recurring': string is not None}}
+
+
+def test_recurrence():
+    assert agenda.recurrence({'date_string': 'every other week at 9am'}) == ('interval', 'week', 2)
+    assert agenda.recurrence({'date_string': 'ev 3 days'}) == ('interval', 'day', 3)
+    assert agenda.recurrence({'date_string': 'every mon, wed and fri'}) == ('weekdays', set([0, 2, 4]))
+    assert agenda.recurrence({'date_string': 'every 3rd friday'}) is None
+    assert agenda.recurrence({'due': {'string': 'every day', 'is_recurring': False}}) is None
+
+    start = datetime.datetime(2024, 1, 31, 9)
+    months = list(agenda.occurrences(start, ('interval', 'month', 1), datetime.datetime(2024, 2, 1), datetime.datetime(2024, 5, 1)))
+    assert [d.date() for d in months] == [datetime.date(2024, 2, 29), datetime.date(2024, 3, 31), datetime.date(2024, 4, 30)]
+    days = list(agenda.occurrences(start, ('interval', 'day', 7), datetime.datetime(2024, 3, 1), datetime.datetime(2024, 3, 10)))
+    assert days == [datetime.datetime(2024, 3, 6, 9)]
+
+
+def test_due_index():
+    items = [_item(1, 10, '2024-03-04'), _item(2, 20, '2024-03-05T10:00:00'), _item(3, 10, '2024-03-01', 'every day'),
+             _item(4, 20, '2024-02-01'), {'id': 5, 'project_id': 10, 'content': 'no date', 'checked': 0}]
+    index = agenda.due_index(items, window_start=datetime.datetime(2024, 3, 1), window_stop=datetime.datetime(2024, 3, 8))
+    assert len(index) == 3 + 7
+
+    t_start = datetime.datetime(2024, 3, 4)
+    t_stop = datetime.datetime(2024, 3, 6)
+    assert [(d.day, data['id']) for d, data in index.query(t_start, t_stop)] == [(4, 1), (4, 3), (5, 3), (5, 2)]
+    assert [(d.day, data['id']) for d, data in index.query(t_start, t_stop, project_ids=[20])] == [(5, 2)]
+    assert [data['id'] for d, data in index.query(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 3, 2))] == [4, 3]
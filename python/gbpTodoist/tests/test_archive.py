@@ -0,0 +1,65 @@
+import datetime
+import importlib
+
+_tree = importlib.import_module('gbpTodoist.tree')
+archive = importlib.import_module('gbpTodoist.archive')
+
+
+class _completed(object):
+    def __init__(self, items):
+        self.items = items
+        self.n_calls = 0
+
+    def get_all(self, limit, offset, until, since=None):
+        self.n_calls += 1
+        until = datetime.datetime.strptime(until, '%Y-%m-%dT%H:%M') + datetime.timedelta(minutes=1)
+        since = datetime.datetime.strptime(since, '%Y-%m-%dT%H:%M') if since is not None else None
+        items = [item for item in sorted(self.items, key=_tree.completed_datetime, reverse=True)
+                 if _tree.completed_datetime(item) < until and (since is None or _tree.completed_datetime(item) >= since)]
+        return {'items': items[offset:offset + limit], 'projects': {}}
+
+
+class _api(object):
+    def __init__(self, items):
+        self.completed = _completed(items)
+
+
+def _item(id, date):
+    return {'id': id, 'content': 'Task %d' % (id), 'project_id': 1, 'completed_date': date}
+
+
+def test_archive(tmpdir):
+    items = [_item(i, '2023-%02d-01T10:00:00Z' % (1 + i % 12)) for i in range(7)] + [_item(7, '2024-01-01T10:00:30Z')]
+    api = _api(items)
+    path = str(tmpdir.join('completed.jsonl.gz'))
+
+    # An interrupted update, resumed by a new instance
+    store = archive.completed_archive(path)
+    assert store.update(api, page_size=3, until=datetime.datetime(2024, 1, 1, 10, 0), max_pages=2) == 6
+    assert archive.completed_archive(path).is_resuming()
+    assert archive.completed_archive(path).update(api, page_size=3) == 2
+    assert sorted(item['id'] for item in store.items()) == list(range(8))
+
+    # Tasks completed later (including in the boundary minute) are added once
+    api.completed.items.append(_item(8, '2024-01-01T10:00:50Z'))
+    api.completed.items.append(_item(9, '2024-02-01T09:00:00Z'))
+    store = archive.completed_archive(path)
+    assert not store.is_resuming()
+    assert store.update(api, until=datetime.datetime(2024, 3, 1)) == 2
+    assert sorted(item['id'] for item in store.items()) == list(range(10))
+    assert store.throughput('year') == [('2023', 7), ('2024', 3)]
+    assert store.throughput('month')[-2:] == [('2024-01', 2), ('2024-02', 1)]
+
+
+def test_archive_v7_dates(tmpdir):
+    items = [_item(0, 'Sun 31 Dec 2023 23:00:00 +0000'), _item(1, 'Mon 01 Jan 2024 10:00:30 +0000')]
+    api = _api(items)
+    store = archive.completed_archive(str(tmpdir.join('completed.jsonl.gz')))
+    assert store.update(api, until=datetime.datetime(2024, 1, 1, 10, 0)) == 2
+    assert store.cursor['boundary_ids'] == [1]
+
+    # The task completed in the boundary minute is not archived twice
+    api.completed.items.append(_item(2, 'Mon 01 Jan 2024 10:00:50 +0000'))
+    assert store.update(api, until=datetime.datetime(2024, 2, 1)) == 1
+    assert store.throughput('year') == [('2023', 1), ('2024', 2)]
+    assert store.throughput('day') == [('2023-12-31', 1), ('2024-01-01', 2)]
@@ -0,0 +1,40 @@
+import importlib
+
+from stubs import model as _model, api as _api
+
+_tree = importlib.import_module('gbpTodoist.tree')
+bulk = importlib.import_module('gbpTodoist.bulk')
+
+
+def test_copy_tasks():
+    tasks, index, _ = _tree.build_tree([
+        _model({'id': 1, 'project_id': 9, 'content': 'Root', 'checked': 0, 'child_order': 1, 'priority': 2}),
+        _model({'id': 3, 'project_id': 9, 'parent_id': 1, 'content': 'B', 'checked': 0, 'child_order': 2}),
+        _model({'id': 2, 'project_id': 9, 'parent_id': 1, 'content': 'A', 'checked': 0, 'child_order': 1}),
+        _model({'id': 4, 'project_id': 9, 'parent_id': 2, 'content': 'Done', 'checked': 1, 'child_order': 1})])
+    api = _api()
+    assert bulk.queue_copy_tasks(api, [index[1]], 'P') == 3
+
+    # Parents come first, siblings keep their order and children point at their parent's temp id
+    assert [c['args']['content'] for c in api.queue] == ['Root', 'A', 'B']
+    assert api.queue[0]['args']['priority'] == 2 and 'parent_id' not in api.queue[0]['args']
+    assert api.queue[1]['args']['parent_id'] == api.queue[0]['temp_id']
+    assert api.queue[2]['args']['parent_id'] == api.queue[0]['temp_id']
+    assert [c['args']['child_order'] for c in api.queue] == [1, 1, 2]
+
+    api = _api()
+    bulk.queue_copy_tasks(api, [index[1]], 'P', active_only=False, order_start=bulk.max_order(tasks))
+    assert [c['args'].get('content') for c in api.queue] == ['Root', 'A', 'Done', 'B', None]
+    assert api.queue[2]['args']['parent_id'] == api.queue[1]['temp_id']
+    assert api.queue[0]['args']['child_order'] == 3
+
+    # Completed tasks are completed again once their subtree is created
+    assert api.queue[4]['type'] == 'item_complete' and api.queue[4]['args']['id'] == api.queue[2]['temp_id']
+
+
+def test_move():
+    tasks, index, _ = _tree.build_tree([_model({'id': 1, 'project_id': 9, 'content': 'Root'})])
+    api = _api()
+    bulk.queue_move_tasks(api, [index[1]], parent_id=5)
+    bulk.queue_move_tasks(api, [index[1]], project_id=8)
+    assert [c['args'] for c in api.queue] == [{'id': 1, 'parent_id': 5}, {'id': 1, 'project_id': 8}]
@@ -0,0 +1,82 @@
+import gzip
+import importlib
+
+import pytest
+
+cassette = importlib.import_module('gbpTodoist.cassette')
+todoist = pytest.importorskip('todoist')
+
+
+class _response(object):
+    def __init__(self, body):
+        self.status_code = 200
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class _session(object):
+    def __init__(self):
+        self.calls = []
+
+    def post(self, url, **kwargs):
+        self.calls.append(url)
+        return _response({'sync_token': 't%d' % (len(self.calls)), 'full_sync': True,
+                          'user': {'id': 5, 'token': 'my-secret-token', 'email': 'me@example.com'},
+                          'projects': [{'id': 1, 'name': 'Work', 'is_deleted': 0}],
+                          'items': [{'id': 10, 'project_id': 1, 'content': 'Secret plan', 'is_deleted': 0}]})
+
+
+def test_record_replay(tmpdir):
+    path = str(tmpdir.join('account.jsonl.gz'))
+    session = cassette.recording_session(path, session=_session(), anonymize=True)
+    api = todoist.TodoistAPI('my-secret-token', session=session, cache=None)
+    api.sync()
+    session.close()
+    assert session.n_recorded == 1
+    with gzip.open(path, 'rb') as fp_in:
+        text = fp_in.read().decode('utf-8')
+    assert 'my-secret-token' not in text and 'Secret plan' not in text and 'Work' not in text
+    assert 'me@example.com' not in text
+
+    session = cassette.replay_session(path, latency_scale=0.)
+    api = todoist.TodoistAPI('another-token', session=session, cache=None)
+    api.sync()
+    assert api.sync_token == 't1'
+    assert api.state['items'][0]['content'] != 'Secret plan'
+    with pytest.raises(Exception):
+        api.sync()
+
+
+def test_record_scrubs_response_tokens(tmpdir):
+    # The sync response's user object holds the token, which is scrubbed even without anonymizing
+    path = str(tmpdir.join('account.jsonl.gz'))
+    session = cassette.recording_session(path, session=_session())
+    todoist.TodoistAPI('my-secret-token', session=session, cache=None).sync()
+    session.close()
+    entry = list(cassette.read_cassette(path))[0]
+    assert entry['body']['user'] == {'id': 5, 'token': 'SCRUBBED', 'email': 'me@example.com'}
+
+
+class _get_session(object):
+    def get(self, url, **kwargs):
+        item_id = kwargs['params']['item_id']
+        return _response({'item': {'id': item_id}, 'notes': [{'item_id': item_id}]})
+
+
+def test_replay_matches_get_params(tmpdir):
+    # Concurrent fetches are recorded in completion order; replay serves each its own response
+    path = str(tmpdir.join('fetch.jsonl.gz'))
+    session = cassette.recording_session(path, session=_get_session())
+    for item_id in (1, 2, 3):
+        session.get('https://todoist.com/api/v8/items/get', params={'item_id': item_id, 'token': 'my-secret-token'})
+    session.close()
+
+    session = cassette.replay_session(path, latency_scale=0.)
+    for item_id in (3, 1, 2):
+        response = session.get('https://todoist.com/api/v8/items/get', params={'item_id': item_id, 'token': 'another-token'})
+        assert response.json()['item']['id'] == item_id
+    with pytest.raises(Exception):
+        session.get('https://todoist.com/api/v8/items/get', params={'item_id': 1, 'token': 'another-token'})
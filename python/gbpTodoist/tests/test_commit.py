@@ -0,0 +1,44 @@
+import importlib
+
+import pytest
+
+_commit = importlib.import_module('gbpTodoist.commit')
+
+
+class _api(object):
+    """Minimal stand-in for `todoist.TodoistAPI`, failing on the n'th commit."""
+
+    def __init__(self, fail_on=None):
+        self.queue = []
+        self.sent = []
+        self.n_commits = 0
+        self.fail_on = fail_on
+
+    def commit(self, raise_on_error=True):
+        self.n_commits += 1
+        if self.n_commits == self.fail_on:
+            raise IOError('connection lost')
+        batch = list(self.queue)
+        del self.queue[:]
+        self.sent.append(batch)
+        return {'sync_status': dict((c['uuid'], 'ok') for c in batch),
+                'temp_id_mapping': dict((c['temp_id'], 1000 + i) for i, c in enumerate(batch) if 'temp_id' in c)}
+
+
+def test_journal_replay(tmpdir):
+    path = str(tmpdir.join('journal.jsonl'))
+    api = _api(fail_on=2)
+    _commit.queue_command(api, 'item_add', {'content': 'a', 'project_id': 1}, temp_id='t1')
+    _commit.queue_command(api, 'item_add', {'content': 'b', 'project_id': 1, 'parent_id': 't1'}, temp_id='t2')
+    _commit.queue_command(api, 'item_add', {'content': 'c', 'project_id': 1, 'parent_id': 't2'}, temp_id='t3')
+    journal = _commit.command_journal(path)
+    with pytest.raises(IOError):
+        _commit.commit(api, journal=journal, batch_size=1)
+
+    # A later run only resends what was not acknowledged, with temp ids resolved
+    journal = _commit.command_journal(path)
+    assert [c['args']['content'] for c in journal.pending()] == ['b', 'c']
+    api = _api()
+    _commit.replay(api, journal, batch_size=10)
+    assert api.sent[0][0]['args']['parent_id'] == 1000
+    assert not tmpdir.join('journal.jsonl').check()
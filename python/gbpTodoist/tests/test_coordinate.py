@@ -0,0 +1,87 @@
+import importlib
+import json
+import os
+import threading
+import time
+import pytest
+
+coordinate = importlib.import_module('gbpTodoist.coordinate')
+
+
+class _api(object):
+    """A stand-in for `todoist.TodoistAPI`'s cache handling."""
+
+    def __init__(self, cache, token='TOKEN'):
+        self.cache = cache
+        self.token = token
+        self.reset_state()
+        self._read_cache()
+
+    def reset_state(self):
+        self.state = {'items': []}
+        self.sync_token = '*'
+
+    def _read_cache(self):
+        path = os.path.join(self.cache, self.token + '.json')
+        if(os.path.isfile(path)):
+            with open(path) as fp_in:
+                self.state, self.sync_token = json.load(fp_in)
+
+    def sync(self, sync_token, items):
+        self.state = {'items': items}
+        self.sync_token = sync_token
+        with open(os.path.join(self.cache, self.token + '.json'), 'w') as fp_out:
+            json.dump([self.state, self.sync_token], fp_out)
+
+
+@pytest.mark.skipif(coordinate.fcntl is None, reason='needs fcntl')
+def test_account_lock(tmpdir):
+    path = str(tmpdir.join('account.lock'))
+    events = []
+    with coordinate.account_lock(path):
+        # Another holder times out ...
+        with pytest.raises(Exception):
+            coordinate.account_lock(path, timeout=0.2, poll_interval=0.05).acquire()
+
+        # ... or waits for the lock to be released
+        def _wait():
+            with coordinate.account_lock(path, poll_interval=0.05):
+                events.append('second')
+        thread = threading.Thread(target=_wait)
+        thread.start()
+        time.sleep(0.2)
+        events.append('first')
+    thread.join()
+    assert events == ['first', 'second']
+    with open(path) as fp_in:
+        assert int(fp_in.read()) == os.getpid()
+
+
+@pytest.mark.skipif(coordinate.fcntl is None, reason='needs fcntl')
+def test_reuse_state(tmpdir):
+    cache = str(tmpdir)
+    api_first = _api(cache)
+    api_second = _api(cache)
+
+    # The first run syncs, commits (which syncs again) and finishes
+    first = coordinate.account_coordinator(api_first, max_age=60.)
+    first.acquire()
+    assert not first.reuse_state()
+    api_first.sync('token-1', [1, 2])
+    first.mark_synced()
+    api_first.sync('token-2', [1, 2, 3])
+    first.release()
+
+    # The second run, started before the first synced, reuses the committed state
+    second = coordinate.account_coordinator(api_second, max_age=60.)
+    second.acquire()
+    assert second.reuse_state()
+    assert api_second.sync_token == 'token-2' and api_second.state['items'] == [1, 2, 3]
+    second.release()
+
+    # Stale or inconsistent stamps are not trusted
+    assert not coordinate.account_coordinator(_api(cache), max_age=0.).reuse_state()
+    second.stamp.write('token-2', t_sync=time.time() - 120.)
+    assert not coordinate.account_coordinator(_api(cache), max_age=60.).reuse_state()
+    second.stamp.write('token-0')
+    assert not coordinate.account_coordinator(_api(cache), max_age=60.).reuse_state()
@@ -0,0 +1,69 @@
+import importlib
+import sys
+import threading
+import time
+
+import pytest
+
+if(sys.version_info < (3, 5)):
+    pytest.skip('asyncio fetching needs Python 3.5+', allow_module_level=True)
+
+fetch = importlib.import_module('gbpTodoist.fetch')
+
+
+class _api(object):
+    token = 'x'
+
+    def __init__(self, delay, slow=2.):
+        self.delay = delay
+        self.slow = slow
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get(self, call, params=None, timeout=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay if params['item_id'] != 13 else self.slow)
+        with self.lock:
+            self.in_flight -= 1
+        if(params['item_id'] == 12):
+            return {'error': 'Item not found'}
+        return {'item': {'id': params['item_id']}, 'notes': [{'item_id': params['item_id'], 'content': 'note'}]}
+
+
+def test_fetch():
+    api = _api(0.05)
+    results = {}
+    errors = {}
+
+    def on_result(item_id, notes, error):
+        if(error is None):
+            results[item_id] = notes
+        else:
+            errors[item_id] = error
+
+    t_start = time.time()
+    n_ok, n_failed = fetch.fetcher(api, concurrency=4, rate=0, timeout=0.3).fetch_resource('comments', list(range(100, 140)) + [12, 13], on_result)
+    assert time.time() - t_start < 1.5
+    assert (n_ok, n_failed) == (40, 2)
+    assert results[100] == [{'item_id': 100, 'content': 'note'}]
+    assert errors[12] == 'Item not found' and 'timed out' in errors[13]
+    assert api.max_in_flight <= 4
+
+
+def test_fetch_after_timeout():
+    # Requests waiting for the worker of a timed-out request do not time out themselves
+    api = _api(0.1, slow=0.8)
+    errors = {}
+    fetch.fetcher(api, concurrency=1, rate=0, timeout=0.3).fetch_resource('comments', [13, 100, 101], lambda item_id, notes, error: errors.setdefault(item_id, error))
+    assert 'timed out' in errors[13] and errors[100] is None and errors[101] is None
+    assert api.max_in_flight == 1
+
+
+def test_rate_limiter():
+    api = _api(0.)
+    t_start = time.time()
+    fetch.fetcher(api, concurrency=2, rate=20.).fetch_resource('comments', list(range(10)), lambda *args: None)
+    assert time.time() - t_start > (10 - 2) / 20. * 0.9
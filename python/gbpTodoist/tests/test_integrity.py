@@ -0,0 +1,30 @@
+import importlib
+
+from stubs import model as _model, api as _api
+
+_tree = importlib.import_module('gbpTodoist.tree')
+integrity = importlib.import_module('gbpTodoist.integrity')
+
+
+def _item(id, parent_id, project_id=1):
+    return _model({'id': id, 'parent_id': parent_id, 'project_id': project_id, 'content': 'task %d' % (id)})
+
+
+def test_check_and_cleanup():
+    models = [_item(1, None), _item(2, 1), _item(3, 99), _item(4, 5), _item(5, 6), _item(6, 4), _item(7, 4),
+              _item(8, 1, project_id=2), _item(9, None, project_id=3), _model({'kwargs': {'id': 10}}),
+              _model({'id': 11, 'parent_id': None, 'project_id': 1}), _item(12, 11)]
+    nodes, _, _ = _tree.build_tree(models)
+    report = integrity.check(nodes, project_ids=set([1, 2]))
+    assert [node.id for node in report['orphans']] == [3]
+    assert [sorted(node.id for node in cycle) for cycle in report['cycles']] == [[4, 5, 6]]
+    assert [node.id for node in report['cross_project']] == [8]
+    assert [node.id for node in report['missing_project']] == [9]
+    assert [node.id for node in report['malformed']] == [10]
+    assert [node.id for node in report['incomplete']] == [11]
+
+    api = _api()
+    assert integrity.plan_cleanup(api, report) == 4
+    assert [(c['type'], c['args'].get('id')) for c in api.queue] == [
+        ('item_delete', None), ('item_move', 3), ('item_move', 8), ('item_move', 4)]
+    assert api.queue[0]['args']['ids'] == [10]
@@ -0,0 +1,75 @@
+import importlib
+import json
+import threading
+import pytest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+log = importlib.import_module('gbpTodoist._internal.log')
+
+
+def test_log_json():
+    fp = StringIO()
+    stream = log.log_stream()
+    stream.set_format('json', fp_out=fp, progress_interval=0.)
+    stream.open('Outer...')
+    stream.comment(['Line 1', 'Line "2"'])
+    stream.open('Inner...')
+    stream.progress_bar(lambda n: iter(range(n)), 3, 3)
+    stream.close('Inner done.')
+
+    # Nothing is written until the outermost bracket closes
+    assert fp.getvalue() == ''
+    stream.close('Done.')
+    events = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert [(event['event'], event['depth']) for event in events] == [
+        ('open', 0), ('comment', 1), ('open', 1)] + [('progress', 2)] * 5 + [('close', 1), ('close', 0)]
+    assert events[1]['msg'] == 'Line 1\nLine "2"'
+    assert events[-3]['n'] == 3 and events[-3]['done']
+    assert events[-1]['elapsed'] >= events[-2]['elapsed'] >= 0.
+    assert len(set(event['pid'] for event in events)) == 1
+
+    # Errors are written out before being raised
+    with pytest.raises(Exception):
+        stream.error('Broken.')
+    event = json.loads(fp.getvalue().splitlines()[-1])
+    assert event['event'] == 'error' and event['msg'] == 'Broken.'
+
+    stream.set_format('text')
+    stream.comment('Plain.')
+    assert fp.getvalue().endswith('Plain.')
+
+
+def test_progress():
+    fp = StringIO()
+    stream = log.log_stream(fp_out=fp)
+    assert not stream.is_tty
+
+    # Short phases report nothing; iterables of unknown length are fine
+    assert list(stream.progress(iter(range(5)), label='Short')) == list(range(5))
+    assert fp.getvalue() == ''
+
+    # Off a terminal, summaries are written as lines (never with '\r')
+    stream.progress_delay = 0.
+    stream.summary_interval = 0.
+    total = sum(stream.progress((i for i in range(1000)), label='Long', unit='things'))
+    assert total == sum(range(1000))
+    lines = fp.getvalue().splitlines()
+    assert '\r' not in fp.getvalue()
+    assert lines[-1].startswith('Long: 1000 things in ')
+    assert len(lines) > 1 and all(line.startswith('Long: ') for line in lines)
+
+    # Several indicators can be updated at once, from several threads
+    bars = [stream.progress(count=400, label='Worker %d' % (i)) for i in range(2)]
+    threads = [threading.Thread(target=lambda bar=bar: [bar.update() for _ in range(400)]) for bar in bars]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for bar in bars:
+        assert bar.n == 400
+        bar.close()
+    assert [line.split(':')[0] for line in fp.getvalue().splitlines()[-2:]] == ['Worker 0', 'Worker 1']
@@ -0,0 +1,52 @@
+import os
+import importlib
+
+_manifest = importlib.import_module('gbpTodoist._internal.manifest')
+
+
+def _touch(path):
+    with open(path, 'w') as fp_out:
+        fp_out.write('')
+
+
+def test_manifest_prunes_and_survives_symlink_loops(tmpdir):
+    root = str(tmpdir)
+    os.makedirs(os.path.join(root, 'a', '__pycache__'))
+    _touch(os.path.join(root, 'a', 'x.txt'))
+    _touch(os.path.join(root, 'a', '__pycache__', 'x.cpython-36.pyc'))
+    _touch(os.path.join(root, 'b.pyc'))
+    os.symlink(root, os.path.join(root, 'a', 'loop'))
+
+    scanner = _manifest.manifest()
+    files = sorted(os.path.relpath(path, root) for path in scanner.files(root))
+    assert files == [os.path.join('a', 'x.txt')]
+    assert scanner.n_links_skipped == 1
+
+
+def test_manifest_cache(tmpdir):
+    root = str(tmpdir.mkdir('tree'))
+    path_cache = str(tmpdir.join('cache.json'))
+    _touch(os.path.join(root, 'x.docstring'))
+    _touch(os.path.join(root, 'y.py'))
+
+    scanner = _manifest.manifest(path_cache=path_cache)
+    assert len(scanner.files(root, extensions=['.docstring'])) == 1
+    scanner.save()
+
+    scanner = _manifest.manifest(path_cache=path_cache)
+    assert len(scanner.files(root)) == 2
+    assert scanner.n_dirs_cached == 1 and scanner.n_dirs_scanned == 0
+
+
+def test_manifest_without_scandir(tmpdir, monkeypatch):
+    root = str(tmpdir)
+    os.makedirs(os.path.join(root, 'a'))
+    _touch(os.path.join(root, 'a', 'x.txt'))
+    os.symlink(os.path.join(root, 'a'), os.path.join(root, 'link'))
+    os.symlink(os.path.join(root, 'missing'), os.path.join(root, 'dangling'))
+    monkeypatch.setattr(_manifest, 'scandir', None)
+
+    files = sorted(os.path.relpath(path, root) for path in _manifest.manifest().files(root))
+    assert files == [os.path.join('a', 'x.txt'), os.path.join('link', 'x.txt')]
+    files = sorted(os.path.relpath(path, root) for path in _manifest.manifest(follow_symlinks=False).files(root))
+    assert files == [os.path.join('a', 'x.txt'), 'dangling', 'link']
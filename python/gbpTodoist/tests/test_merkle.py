@@ -0,0 +1,22 @@
+import importlib
+
+_tree = importlib.import_module('gbpTodoist.tree')
+merkle = importlib.import_module('gbpTodoist.merkle')
+
+
+class _model(object):
+    def __init__(self, id, parent_id, content):
+        self.data = {'id': id, 'parent_id': parent_id, 'project_id': 1, 'content': content, 'checked': 0}
+
+
+def _snapshot(items):
+    nodes, _, _ = _tree.build_tree([_model(*item) for item in items])
+    return merkle.snapshot(nodes)
+
+
+def test_diff():
+    old = _snapshot([(1, None, 'a'), (2, 1, 'b'), (3, 2, 'c'), (4, None, 'd'), (5, 4, 'e'), (6, 5, 'f')])
+    new = _snapshot([(1, None, 'a'), (2, 1, 'B'), (3, 4, 'c'), (4, None, 'd'), (5, 4, 'e'), (7, 1, 'g')])
+    result = merkle.diff(old, new)
+    assert result == {'added': set([7]), 'removed': set([6]), 'changed': set([2]), 'moved': set([3])}
+    assert merkle.diff(new, new) == {'added': set(), 'removed': set(), 'changed': set(), 'moved': set()}
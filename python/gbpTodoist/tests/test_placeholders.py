@@ -0,0 +1,25 @@
+import datetime
+import importlib
+import pickle
+
+placeholders = importlib.import_module('gbpTodoist.placeholders')
+
+
+def test_compile_text():
+    values = {'target': 'Trip', 'project': 'Rome', 'due': datetime.date(2024, 6, 10), 'today': datetime.date(2024, 6, 1)}
+    assert placeholders.compile_text('Pack socks') is None
+    assert placeholders.compile_text('Keep {this} as it is') is None
+    formatter = placeholders.compile_text('Book {project} hotel by {due-2} ({today+1:%b %d}) {{ok}} {other}')
+    assert formatter is placeholders.compile_text(formatter.text)
+    assert formatter.render(values) == 'Book Rome hotel by 2024-06-08 (Jun 02) {ok} {other}'
+    assert formatter.render(dict(values, due=None)) == 'Book Rome hotel by  (Jun 02) {ok} {other}'
+    assert pickle.loads(pickle.dumps(formatter)).render(values) == formatter.render(values)
+
+
+def test_pattern():
+    values = {'target': 'Trip', 'project': 'Rome', 'due': None, 'today': datetime.date(2024, 6, 1)}
+    pattern = placeholders.compile_text('Review {target} on {today:%b %d}').pattern(values)
+    assert pattern.match('Review Trip on May 31') and pattern.match('Review Trip on ')
+    assert not pattern.match('Review Budget on May 31') and not pattern.match('Review Trip on holiday')
+    assert placeholders.compile_text('{target}').pattern(values) is None
+    assert placeholders.compile_text('{today}').pattern(values) is None
@@ -0,0 +1,116 @@
+import importlib
+import datetime
+
+populate = importlib.import_module('gbpTodoist.populate')
+
+
+class _item(object):
+    def __init__(self, data, children=(), parent=None):
+        self.data = data
+        self.id = data.get('id')
+        self.children = list(children)
+        self.parent = parent
+        for child in self.children:
+            child.parent = self
+
+
+def _task(id, content, children=(), checked=0):
+    return _item({'id': id, 'content': content, 'checked': checked, 'is_archived': 0,
+                  'item_order': 1, 'indent': 1, 'project_id': 100, 'priority': 4}, children)
+
+
+def _template_list(project_id=100):
+    template = _task(1, 'Trip', [_task(2, 'Pack', [_task(3, 'Socks')]), _task(4, 'Book')])
+    target = _task(10, 'Trip', [_task(11, 'Pack'), _task(12, 'Book', checked=1)])
+    project = _item({'id': project_id, 'name': 'Work'})
+    return [{'project_target': project, 'task_template': template, 'task_target': target}]
+
+
+def test_plan():
+    commands = populate.plan(_template_list())
+    assert [(c['action'], c['label']) for c in commands] == [
+        ('present', 'Pack -> Trip ... '), ('add', 'Socks -> Pack ... '), ('add', 'Book -> Trip ... ')]
+    assert commands[1]['parent'] == ('id', 11)
+    assert commands[1]['args']['indent'] == 2
+    assert commands[2]['parent'] == ('id', 10)
+
+
+def test_plan_sharded_matches_serial():
+    template_list = _template_list(100) + _template_list(200) + _template_list(100)
+    commands = populate.plan(template_list, n_processes=2)
+    assert commands == populate.plan(template_list)
+    # The second pair targeting the same task finds the first pair's planned tasks
+    assert [c['action'] for c in commands].count('add') == 4
+
+
+def test_plan_skips_covered_targets():
+    template = _task(1, 'Trip', [_task(2, 'Pack', [_task(3, 'Socks')]), _task(4, 'Book')])
+    target = _task(10, 'Trip', [_task(12, 'Book'), _task(11, 'Pack', [_task(13, 'Socks')]), _task(14, 'Done', checked=1)])
+    project = _item({'id': 100, 'name': 'Work'})
+    commands = populate.plan([{'project_target': project, 'task_template': template, 'task_target': target}])
+    assert [c['action'] for c in commands] == ['covered']
+
+    # An extra task under the target only costs a walk of the branch it is in
+    target.children[1].children.append(_task(15, 'Shoes'))
+    commands = populate.plan([{'project_target': project, 'task_template': template, 'task_target': target}])
+    assert [(c['action'], c['label']) for c in commands] == [
+        ('present', 'Pack -> Trip ... '), ('covered', 'Socks -> Pack ... '), ('covered', 'Book -> Trip ... ')]
+
+
+def test_select_affected():
+    template_list = _template_list(100) + _template_list(200)
+    for item in template_list:
+        item['project_template'] = _item({'id': item['project_target'].id + 1})
+    template_list[1]['task_target'].id = 20
+    pack = template_list[1]['task_target'].children[0]
+    pack.id = 21
+    nodes = {21: pack}
+
+    def _select(items, projects=()):
+        return populate.select_affected(template_list, items, list(projects), nodes.get)
+
+    assert _select([{'id': 21, 'project_id': 200}]) == [template_list[1]]
+    assert _select([{'id': 22, 'parent_id': 21, 'project_id': 200, 'is_deleted': 1}]) == [template_list[1]]
+    assert _select([{'id': 21, 'project_id': 300}]) == []
+    assert _select([], [{'id': 101}]) == [template_list[0]]
+
+
+def test_plan_placeholders():
+    template = _task(1, 'Trip', [_task(2, 'Pack for {project}'), _task(3, 'Check in')])
+    template.children[1].data['date_string'] = '{due-1}'
+    template_list = []
+    for project_id, name, due in ((100, 'Rome', '2024-06-10'), (200, 'Oslo', None)):
+        target = _task(10 + project_id, 'Trip')
+        target.data['due'] = {'date': due} if due else None
+        template_list.append({'project_target': _item({'id': project_id, 'name': name}), 'task_template': template, 'task_target': target})
+    commands = populate.plan(template_list)
+    assert [(c['action'], c['content']) for c in commands] == [
+        ('add', 'Pack for Rome'), ('add', 'Check in'), ('add', 'Pack for Oslo'), ('add', 'Check in')]
+    assert commands[1]['args']['date_string'] == '2024-06-09' and commands[3]['args']['date_string'] == ''
+
+    # Targets holding the rendered subtree are covered
+    template_list[0]['task_target'].children = [_task(20, 'Pack for Rome'), _task(21, 'Check in')]
+    commands = populate.plan(template_list[:1])
+    assert [c['action'] for c in commands] == ['covered']
+
+
+def test_plan_placeholders_across_runs():
+    template = _task(1, 'Weekly', [_task(2, 'Review {today}', [_task(3, 'Notes')])])
+    target = _task(10, 'Weekly')
+    item = {'project_target': _item({'id': 100, 'name': 'Work'}), 'task_template': template, 'task_target': target}
+    commands = populate.plan_pairs([populate.pair_input(item, today=datetime.date(2026, 10, 18))])
+    assert [(c['action'], c['content']) for c in commands] == [('add', 'Review 2026-10-18'), ('add', 'Notes')]
+
+    # A later run recognises the subtask rendered on the first one
+    target.children = [_task(20, 'Review 2026-10-18', [_task(21, 'Notes')])]
+    commands = populate.plan_pairs([populate.pair_input(item, today=datetime.date(2026, 10, 19))])
+    assert [(c['action'], c['key']) for c in commands] == [('present', ('id', 20)), ('covered', ('id', 21))]
+
+
+def test_plan_placeholders_unrelated_children():
+    # Placeholder subtasks are not taken for unrelated children of their target
+    template = _task(1, 'Trip', [_task(2, '{target}'), _task(3, 'Review {target}')])
+    target = _task(10, 'Trip', [_task(20, 'Buy milk'), _task(21, 'Review budget')])
+    item = {'project_target': _item({'id': 100, 'name': 'Work'}), 'task_template': template, 'task_target': target}
+    commands = populate.plan_pairs([populate.pair_input(item, today=datetime.date(2026, 10, 19))])
+    assert [(c['action'], c['content']) for c in commands] == [('add', 'Trip'), ('add', 'Review Trip')]
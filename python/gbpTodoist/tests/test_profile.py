@@ -0,0 +1,50 @@
+import importlib
+import os
+import time
+
+import click
+from click.testing import CliRunner
+
+profile = importlib.import_module('gbpTodoist._internal.profile')
+
+
+@click.group(invoke_without_command=True)
+@profile.profile_option
+@click.pass_context
+def _command(ctx):
+    profile.phase('build')
+    ctx.obj = [list(range(i)) for i in range(300)]
+
+
+@_command.command()
+@click.pass_obj
+def work(obj):
+    profile.phase('work')
+    t_stop = time.time() + 0.05
+    while(time.time() < t_stop):
+        sum(len(x) for x in obj)
+
+
+def test_profile(tmpdir):
+    runner = CliRunner()
+    for mode in profile.modes:
+        path_dir = str(tmpdir.join(mode))
+        result = runner.invoke(_command, ['--profile', mode, '--profile-dir', path_dir, 'work'])
+        assert result.exit_code == 0, result.output
+        assert profile.active is None
+        filenames = sorted(os.listdir(path_dir))
+        if(mode == 'cprofile'):
+            assert [filename.split('.')[-2] for filename in filenames if filename.endswith('.pstats')] == ['00-startup', '01-build', '02-work']
+        else:
+            path_stacks = [os.path.join(path_dir, filename) for filename in filenames if filename.endswith('.collapsed')][0]
+            with open(path_stacks) as fp_in:
+                lines = fp_in.read().splitlines()
+            assert any(line.startswith('work;') and 'work (test_profile.py:' in line for line in lines)
+            assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+        with open([os.path.join(path_dir, filename) for filename in filenames if filename.endswith('.txt')][0]) as fp_in:
+            report = fp_in.read()
+        assert [line.split()[0] for line in report.splitlines()[1:4]] == ['startup', 'build', 'work']
+
+    # Without --profile, nothing is written
+    result = runner.invoke(_command, ['--profile-dir', str(tmpdir.join('none')), 'work'])
+    assert result.exit_code == 0 and not tmpdir.join('none').check()
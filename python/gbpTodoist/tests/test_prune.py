@@ -0,0 +1,56 @@
+import importlib
+import datetime
+
+from stubs import model as _model, api as _api
+
+_tree = importlib.import_module('gbpTodoist.tree')
+prune = importlib.import_module('gbpTodoist.prune')
+
+
+def _item(id, parent_id, date_completed=None):
+    data = {'id': id, 'parent_id': parent_id, 'project_id': 1, 'content': 'task %d' % (id)}
+    if(date_completed is not None):
+        data['checked'] = 1
+        data['date_completed'] = date_completed
+    return _model(data)
+
+
+def test_completed_datetime():
+    assert _tree.completed_datetime({'date_completed': 'Fri 26 Sep 2014 08:25:05 +0000'}) == datetime.datetime(2014, 9, 26, 8, 25, 5)
+    assert _tree.completed_datetime({'completed_at': '2014-09-26T08:25:05.000000Z'}) == datetime.datetime(2014, 9, 26, 8, 25, 5)
+    assert _tree.completed_datetime({'date_completed': 'yesterday'}) is None
+    assert _tree.completed_datetime({}) is None
+
+
+def test_find_stale_and_plan():
+    old = '2019-01-01T00:00:00Z'
+    new = '2019-06-01T00:00:00Z'
+    models = [
+        # An old, fully completed subtree: pruned from its root
+        _item(1, None, old), _item(2, 1, old), _item(3, 2, old),
+        # A completed root with a recently completed child: only its old child goes
+        _item(4, None, new), _item(5, 4, new), _item(6, 4, old),
+        # An active root: only its completed children are candidates
+        _item(7, None), _item(8, 7, old), _item(9, 7), _item(10, 9, old),
+        # Checked, but undated: never pruned
+        _model({'id': 11, 'parent_id': None, 'project_id': 1, 'content': 'undated', 'checked': 1}),
+        _model({'kwargs': {'id': 12}})]
+    nodes, index, _ = _tree.build_tree(models)
+    cutoff = prune.cutoff_date(30, now=datetime.datetime(2019, 6, 15))
+
+    completed = prune.completed_subtrees(nodes)
+    assert sorted(completed) == [1, 2, 3, 4, 5, 6, 8, 10]
+    assert completed[1] == (datetime.datetime(2019, 1, 1), 3)
+    assert completed[4] == (datetime.datetime(2019, 6, 1), 3)
+
+    stale = prune.find_stale(nodes, cutoff)
+    assert [(node.id, n_tasks) for node, latest, n_tasks in stale] == [(1, 3), (6, 1), (8, 1), (10, 1)]
+    assert [node.id for node, _, _ in prune.find_stale(nodes, cutoff, roots=index[7].children)] == [8, 10]
+
+    api = _api()
+    assert prune.plan(api, stale) == 4
+    assert [(c['type'], c['args']['id']) for c in api.queue] == [
+        ('item_archive', 1), ('item_archive', 6), ('item_archive', 8), ('item_archive', 10)]
+    api = _api()
+    assert prune.plan(api, stale, action='delete') == 1
+    assert api.queue[0]['type'] == 'item_delete' and api.queue[0]['args']['ids'] == [1, 6, 8, 10]
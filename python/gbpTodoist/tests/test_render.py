@@ -0,0 +1,74 @@
+import importlib
+import json
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from stubs import model as _model
+
+_tree = importlib.import_module('gbpTodoist.tree')
+render = importlib.import_module('gbpTodoist.render')
+
+
+def _forest():
+    projects, project_index, _ = _tree.build_tree([
+        _model({'id': 1, 'name': 'Work', 'parent_id': None, 'child_order': 2}),
+        _model({'id': 2, 'name': 'Home', 'parent_id': None, 'child_order': 1}),
+        _model({'id': 3, 'name': 'Sub', 'parent_id': 1, 'child_order': 1})], is_project=True)
+    tasks, task_index, _ = _tree.build_tree([
+        _model({'id': 10, 'content': 'Second', 'project_id': 1, 'parent_id': None, 'child_order': 2}),
+        _model({'id': 11, 'content': 'First', 'project_id': 1, 'parent_id': None, 'child_order': 1, 'checked': 1}),
+        _model({'id': 12, 'content': 'Done child', 'project_id': 1, 'parent_id': 11, 'child_order': 1, 'checked': 1}),
+        _model({'id': 13, 'content': 'Child', 'project_id': 1, 'parent_id': 10, 'child_order': 1}),
+        _model({'id': 14, 'content': 'Grandchild', 'project_id': 1, 'parent_id': 13, 'child_order': 1}),
+        _model({'id': 15, 'content': 'Chores', 'project_id': 2, 'parent_id': None, 'child_order': 1}),
+        _model({'kwargs': {'id': 16}})])
+    by_project = {}
+    for task in tasks:
+        by_project.setdefault(task.project_id, []).append(task)
+    roots = [project for project in projects if not project.parent]
+    return roots, project_index, task_index, lambda project: by_project.get(project.id, [])
+
+
+def _render(roots, **kwargs):
+    fp = StringIO()
+    render.render(fp, roots, **kwargs)
+    return fp.getvalue()
+
+
+def test_render_text():
+    roots, project_index, task_index, project_tasks = _forest()
+    assert _render(roots, project_tasks=project_tasks).splitlines() == [
+        'Home',
+        '   - Chores',
+        'Work',
+        '   - First [done]',
+        '      + Done child [done]',
+        '   - Second',
+        '      + Child',
+        '         # Grandchild',
+        '   Sub']
+    assert _render(roots, project_tasks=project_tasks, max_depth=1, collapse_completed=True).splitlines() == [
+        'Home',
+        '   - Chores',
+        'Work',
+        '   - First [done] (+1)',
+        '   - Second (+1)',
+        '   Sub']
+    assert _render([task_index[10]], format='markdown', sort=False).splitlines() == [
+        '- [ ] Second',
+        '  - [ ] Child',
+        '    - [ ] Grandchild']
+
+
+def test_render_json():
+    roots, project_index, task_index, project_tasks = _forest()
+    document = json.loads(_render(roots, format='json', project_tasks=project_tasks, max_depth=2))
+    assert [node['content'] for node in document] == ['Home', 'Work']
+    work = document[1]
+    assert [(node['type'], node['content']) for node in work['children']] == [('task', 'First'), ('task', 'Second'), ('project', 'Sub')]
+    assert work['children'][0]['completed'] and work['children'][0]['children'][0]['id'] == 12
+    assert work['children'][1]['children'][0]['n_hidden'] == 1
+    assert json.loads(_render([], format='json')) == []
@@ -0,0 +1,38 @@
+import importlib
+
+from stubs import model as _model, api as _api
+
+_tree = importlib.import_module('gbpTodoist.tree')
+rules = importlib.import_module('gbpTodoist.rules')
+
+
+def test_rules():
+    projects, _, _ = _tree.build_tree([_model({'id': 1, 'name': 'Work'}), _model({'id': 2, 'name': 'Sub', 'parent_id': 1}),
+                                       _model({'id': 3, 'name': 'Done'})], is_project=True)
+    tasks, _, _ = _tree.build_tree([
+        _model({'id': 10, 'project_id': 2, 'content': 'Urgent: call', 'checked': 0, 'labels': [], 'priority': 1}),
+        _model({'id': 11, 'project_id': 1, 'content': 'Parent', 'checked': 0, 'labels': [7], 'priority': 1}),
+        _model({'id': 12, 'project_id': 1, 'parent_id': 11, 'content': 'Child', 'checked': 1, 'labels': [], 'priority': 1})])
+    rule_set = rules.rule_set([
+        {'name': 'urgent', 'when': {'under_project': 'Work', 'content_matches': '^Urgent'}, 'then': {'add_label': 5, 'set_priority': 4}},
+        {'name': 'close', 'when': {'project': 'Work', 'all_children_checked': True}, 'then': {'complete': True}},
+        {'name': 'file', 'when': {'label': 7, 'max_depth': 0}, 'then': {'move_to_project': 'Done', 'remove_label': 7}}], projects)
+    assert [r.index_key for r in rule_set.rules] == [None, ('project', 1), ('label', 7)]
+
+    api = _api()
+    rules.queue_actions(api, rule_set.evaluate([task for task in tasks if not task.parent]))
+    assert [(c['type'], c['args']) for c in api.queue] == [
+        ('item_update', {'id': 10, 'labels': [5], 'priority': 4}),
+        ('item_update', {'id': 11, 'labels': []}),
+        ('item_move', {'id': 11, 'project_id': 3}),
+        ('item_close', {'id': 11})]
+
+
+def test_rules_without_content():
+    tasks, _, _ = _tree.build_tree([_model({'id': 10, 'project_id': 1, 'content': None, 'checked': 0}),
+                                    _model({'id': 11, 'project_id': 1, 'checked': 0})])
+    rule_set = rules.rule_set([
+        {'name': 'prefix', 'when': {'content_prefix': 'Urgent'}, 'then': {'complete': True}},
+        {'name': 'matches', 'when': {'content_matches': '^$'}, 'then': {'complete': True}}], [])
+    assert [(node.id, [r.name for r in matched]) for node, matched in rule_set.evaluate(tasks)] == [
+        (10, ['matches']), (11, ['matches'])]
@@ -0,0 +1,33 @@
+import importlib
+
+search = importlib.import_module('gbpTodoist.search')
+
+
+def _item(id, parent_id, content, **kwargs):
+    data = {'id': id, 'parent_id': parent_id, 'project_id': 1, 'content': content}
+    data.update(kwargs)
+    return data
+
+
+def test_search(tmpdir):
+    index = search.search_index()
+    index.apply_sync({'full_sync': True, 'sync_token': 'abc',
+                      'projects': [{'id': 1, 'name': 'Work'}],
+                      'items': [_item(10, None, 'Plan the release'), _item(11, 10, 'Release notes draft'),
+                                _item(12, 10, 'Notes on the plan'), {'kwargs': 'malformed'}]})
+    assert search.parse_query('"release notes" plan*') == [('phrase', ['release', 'notes']), ('prefix', 'plan')]
+    assert [h.id for h in index.search('release')] == [10, 11]
+    assert [h.id for h in index.search('"notes draft"')] == [11]
+    assert [h.id for h in index.search('"draft notes"')] == []
+    assert sorted(h.id for h in index.search('pla*')) == [10, 12]
+    assert [str(h) for h in index.search('notes on')] == ['Work / Plan the release / Notes on the plan']
+    assert [h.id for h in index.search('work', kind='project')] == [1]
+
+    # Incremental updates, and a round trip through the disk
+    index.apply_sync({'sync_token': 'def', 'items': [_item(11, 10, 'x', is_deleted=1), _item(13, None, 'Release party')]})
+    path = str(tmpdir.join('index.json'))
+    index.save(path)
+    index = search.search_index.load(path)
+    assert index.sync_token == 'def'
+    assert sorted(h.id for h in index.search('release')) == [10, 13]
+    assert index.search('draft') == []
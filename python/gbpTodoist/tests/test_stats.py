@@ -0,0 +1,37 @@
+import importlib
+
+import pytest
+
+stats = importlib.import_module('gbpTodoist.stats')
+np = pytest.importorskip('numpy')
+
+
+def _item(id, parent_id, project_id, checked=0, priority=1):
+    return {'id': id, 'parent_id': parent_id, 'project_id': project_id, 'content': str(id), 'checked': checked,
+            'is_archived': 0, 'priority': priority}
+
+
+def test_stats():
+    projects = [{'id': 1, 'name': 'Work'}, {'id': 2, 'name': 'Home'}]
+    items = [_item(10, None, 1), _item(11, 10, 1, priority=4), _item(12, 10, 1, checked=1), _item(13, 11, 1),
+             _item(20, None, 2), _item(21, 22, 2), _item(22, 21, 2), _item(30, None, 99), {'kwargs': 'malformed'}]
+    arrays = stats.build_arrays(projects, items)
+    assert list(stats.depths(arrays['parent'])) == [0, 1, 1, 2, 0, -1, -1, 0]
+
+    report = stats.compute(arrays, template_targets=[(1, True), (1, False), (2, True)])
+    work, home = report['projects']
+    assert (work['n_open'], work['n_completed'], work['depth_histogram']) == (3, 1, [1, 2, 1])
+    assert (work['fanout_mean'], work['fanout_max'], work['priority_mix']) == (1.5, 2, [2, 0, 0, 1])
+    assert (work['n_template_targets'], work['n_template_targets_populated']) == (2, 1)
+    assert (home['n_open'], home['depth_histogram'], home['n_template_targets_populated']) == (1, [1], 1)
+    assert report['totals']['n_in_cycles'] == 2 and report['totals']['n_unassigned'] == 1
+    assert report['totals']['fanout_histogram'] == [0, 3, 1]
+
+
+def test_build_arrays_string_ids():
+    projects = [{'id': 'b', 'name': 'Work'}, {'id': 'a', 'name': 'Home'}]
+    items = [_item('x2', 'x1', 'a'), _item('x1', None, 'b'), _item('x3', 'x9', 'c')]
+    arrays = stats.build_arrays(projects, items)
+    assert list(arrays['project']) == [1, 0, -1]
+    assert list(arrays['parent']) == [1, -1, -1]
+    assert list(stats.build_arrays([], [])['parent']) == []
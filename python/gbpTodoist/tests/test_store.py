@@ -0,0 +1,36 @@
+import datetime
+import importlib
+
+_store = importlib.import_module('gbpTodoist.store')
+
+
+def _item(id, parent_id, content, order, **kwargs):
+    data = {'id': id, 'parent_id': parent_id, 'project_id': 1, 'content': content, 'item_order': order,
+            'checked': 0, 'is_archived': 0, 'is_deleted': 0}
+    data.update(kwargs)
+    return data
+
+
+def test_store(tmpdir):
+    store = _store.state_store(str(tmpdir.join('state.sqlite')))
+    store.apply_sync({'full_sync': True, 'sync_token': 'abc',
+                      'projects': [{'id': 1, 'parent_id': None, 'name': 'Work', 'item_order': 1}],
+                      'items': [_item(10, None, 'a', 2), _item(11, 10, 'b', 2), _item(12, 10, 'c', 1),
+                                _item(13, 12, 'd', 1, due_date_utc='Fri 26 Sep 2014 08:25:05 +0000')]})
+    assert [(depth, r.data['content']) for depth, r in store.subtree(10)] == [(0, 'a'), (1, 'c'), (2, 'd'), (1, 'b')]
+    assert [r.data['id'] for r in store.ancestors(13)] == [12, 10]
+    assert [r.data['id'] for r in store.items_by_content('c')] == [12]
+    assert [r.data['id'] for r in store.items_due(datetime.datetime(2014, 9, 26), datetime.datetime(2014, 9, 27))] == [13]
+
+    # An incremental update
+    store.apply_sync({'sync_token': 'def', 'items': [_item(11, None, 'b', 2, is_deleted=1), _item(14, 10, 'e', 3)]})
+    assert store.get_meta('sync_token') == 'def'
+    assert [r.data['id'] for depth, r in store.subtree(10)] == [10, 12, 13, 14]
+
+    # Siblings with the same order keep their descendants together
+    store.upsert(items=[_item(15, 10, 'f', 3), _item(16, 14, 'g', 1), _item(17, 15, 'h', 1)])
+    assert [r.data['id'] for depth, r in store.subtree(10)] == [10, 12, 13, 14, 16, 15, 17]
+
+    forest = _store.store_forest(store)
+    assert forest.get(13).parent.id == 12
+    store.close()
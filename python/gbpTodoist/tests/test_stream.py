@@ -0,0 +1,82 @@
+import importlib
+import json
+import random
+
+import pytest
+
+stream = importlib.import_module('gbpTodoist.stream')
+
+
+def _chunks(text, seed):
+    rng = random.Random(seed)
+    i_start = 0
+    while(i_start < len(text)):
+        i_stop = i_start + rng.randint(1, 7)
+        yield text[i_start:i_stop]
+        i_start = i_stop
+
+
+def test_object_stream():
+    document = {'full_sync': True, 'sync_token': 'ab"c', 'day_orders_timestamp': 12345, 'user': {'id': 7, 'x': [1, 2]},
+                'items': [{'id': 1, 'content': u'café [1]', 'checked': 0}, {'id': 2, 'content': '}{', 'n': -1.5e3}],
+                'labels': [], 'filters': [3, 45, None, True]}
+    text = json.dumps(document, indent=1)
+    for seed in range(20):
+        events = list(stream.iter_events(_chunks(text, seed)))
+        rebuilt = {}
+        for event_type, key, value in events:
+            if(event_type == 'array'):
+                rebuilt[key] = []
+            elif(event_type == 'element'):
+                rebuilt[key].append(value)
+            else:
+                rebuilt[key] = value
+        assert rebuilt == document
+        assert [value['id'] for event_type, key, value in events if key == 'items' and event_type == 'element'] == [1, 2]
+    with pytest.raises(Exception):
+        list(stream.iter_events(_chunks(text[:-3], 0)))
+
+
+class _response(object):
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size):
+        for i_start in range(0, len(self.body), chunk_size):
+            yield self.body[i_start:i_start + chunk_size]
+
+
+class _session(object):
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def post(self, url, data=None, stream=False):
+        return _response(json.dumps(self.bodies.pop(0)).encode('utf-8'))
+
+
+def test_sync(tmpdir):
+    todoist = pytest.importorskip('todoist')
+    session = _session([{'full_sync': True, 'sync_token': 's1', 'projects': [{'id': 1, 'name': 'Work'}],
+                         'items': [{'id': 10, 'content': 'a', 'project_id': 1}, {'id': 11, 'content': 'b', 'project_id': 1}]},
+                        {'full_sync': False, 'sync_token': 's2',
+                         'items': [{'id': 10, 'content': 'a2'}, {'id': 11, 'is_deleted': 1}, {'id': 12, 'content': 'c'}]}])
+    cache = str(tmpdir) + '/'
+    api = todoist.TodoistAPI('token', session=session, cache=cache)
+    seen = []
+    response = stream.sync(api, on_object=lambda datatype, data: seen.append((datatype, data['id'])), chunk_size=5)
+    assert seen == [('projects', 1), ('items', 10), ('items', 11)]
+    assert response['sync_token'] == 's1' and api.sync_token == 's1'
+    assert [item['content'] for item in api.state['items']] == ['a', 'b']
+
+    # The response refers to the state's dictionaries, rather than to copies
+    assert all(data is item.data for data, item in zip(response['items'], api.state['items']))
+
+    stream.sync(api, chunk_size=3)
+    assert [(item['id'], item['content']) for item in api.state['items']] == [(10, 'a2'), (12, 'c')]
+    assert api.state['items'][0]['project_id'] == 1
+
+    # The cache is read back by the API as usual
+    api = todoist.TodoistAPI('token', cache=cache)
+    assert api.sync_token == 's2' and [item['id'] for item in api.state['items']] == [10, 12]
@@ -0,0 +1,30 @@
+import importlib
+
+from stubs import model as _model
+
+_tree = importlib.import_module('gbpTodoist.tree')
+
+
+def test_build_tree():
+    models = [_model({'id': 1, 'parent_id': None, 'project_id': 7, 'content': 'a', 'checked': 0, 'item_order': 2}),
+              _model({'id': 2, 'parent_id': 1, 'project_id': 7, 'content': 'b', 'checked': 1, 'child_order': 1}),
+              _model({'kwargs': {'id': 3}})]
+    nodes, index, bad_list = _tree.build_tree(models)
+    assert [node.id for node in index[1].children] == [2]
+    assert index[2].parent is index[1] and index[2].order == 1
+    assert index[1].is_active() and not index[2].is_active()
+    assert index[2].data is models[1].data
+    assert [node.id for node in bad_list] == [3] and 3 not in index
+    assert not hasattr(nodes[0], '__dict__')
+
+
+def test_lazy_forest():
+    models = [_model({'id': 1, 'parent_id': None, 'project_id': 7, 'content': 'a'}),
+              _model({'id': 2, 'parent_id': 1, 'project_id': 7, 'content': 'b'}),
+              _model({'id': 3, 'parent_id': None, 'project_id': 8, 'content': 'c'})]
+    forest = _tree.lazy_forest(models)
+    assert forest.n_built() == 0
+    assert [node.id for node in forest.tasks_of(7)] == [1, 2]
+    assert forest.get(1).children[0].id == 2
+    assert forest.n_built() == 1
+    assert forest.get(3).content == 'c' and forest.n_built() == 2